@@ -0,0 +1,88 @@
+"""
+DATABASES from the environment.
+
+    DB_ENGINE=sqlite (default)  a file next to manage.py (DB_NAME to move it) in
+                                WAL mode: readers don't block the writer, and
+                                write transactions take the lock up front
+                                (BEGIN IMMEDIATE) and wait up to
+                                SQLITE_BUSY_TIMEOUT instead of failing with
+                                "database is locked" on lock upgrade
+    DB_ENGINE=postgres          DB_NAME / DB_USER / DB_PASSWORD / DB_HOST /
+                                DB_PORT; connections persist for
+                                DB_CONN_MAX_AGE seconds (health-checked), or
+                                with DB_POOL=1 come from a psycopg pool of
+                                DB_POOL_MIN_SIZE..DB_POOL_MAX_SIZE per process
+                                (needs psycopg 3 with psycopg[pool]; CONN_MAX_AGE is then 0)
+    DB_REPLICA_HOST             adds a "replica" alias (same credentials unless
+                                DB_REPLICA_PORT / DB_REPLICA_NAME / ... are set)
+                                that conversations.routing sends heavy reads to
+"""
+import os
+from pathlib import Path
+
+DB_ENGINE = os.getenv("DB_ENGINE", "sqlite")
+
+SQLITE_JOURNAL_MODE = os.getenv("SQLITE_JOURNAL_MODE", "WAL")
+SQLITE_SYNCHRONOUS = os.getenv("SQLITE_SYNCHRONOUS", "NORMAL")  # safe with WAL; FULL fsyncs every commit
+SQLITE_BUSY_TIMEOUT = float(os.getenv("SQLITE_BUSY_TIMEOUT", "20"))
+SQLITE_CACHE_MB = int(os.getenv("SQLITE_CACHE_MB", "64"))
+SQLITE_MMAP_MB = int(os.getenv("SQLITE_MMAP_MB", "256"))
+SQLITE_TRANSACTION_MODE = os.getenv("SQLITE_TRANSACTION_MODE", "IMMEDIATE")
+
+DB_CONN_MAX_AGE = int(os.getenv("DB_CONN_MAX_AGE", "60"))
+DB_POOL = os.getenv("DB_POOL", "0") == "1"
+DB_POOL_MIN_SIZE = int(os.getenv("DB_POOL_MIN_SIZE", "2"))
+DB_POOL_MAX_SIZE = int(os.getenv("DB_POOL_MAX_SIZE", "20"))
+DB_POOL_TIMEOUT = float(os.getenv("DB_POOL_TIMEOUT", "10"))  # seconds to wait for a free connection
+
+
+def sqlite(name) -> dict:
+    pragmas = [
+        f"PRAGMA journal_mode={SQLITE_JOURNAL_MODE}",
+        f"PRAGMA synchronous={SQLITE_SYNCHRONOUS}",
+        f"PRAGMA cache_size=-{SQLITE_CACHE_MB * 1024}",  # negative = KiB
+        f"PRAGMA mmap_size={SQLITE_MMAP_MB * 1024 * 1024}",
+        "PRAGMA temp_store=MEMORY",
+    ]
+    return {
+        "ENGINE": "django.db.backends.sqlite3",
+        "NAME": name,
+        "OPTIONS": {
+            "timeout": SQLITE_BUSY_TIMEOUT,  # busy timeout
+            "transaction_mode": SQLITE_TRANSACTION_MODE,
+            "init_command": ";".join(pragmas),  # run on every new connection
+        },
+    }
+
+
+def postgres(prefix: str = "DB", fallback: dict = None) -> dict:
+    fallback = fallback or {}
+    env = lambda key, default="": os.getenv(f"{prefix}_{key}") or fallback.get(key) or default
+    config = {
+        "ENGINE": "django.db.backends.postgresql",
+        "NAME": env("NAME", "terminal_chat"),
+        "USER": env("USER", "postgres"),
+        "PASSWORD": env("PASSWORD"),
+        "HOST": env("HOST", "localhost"),
+        "PORT": env("PORT", "5432"),
+        "CONN_MAX_AGE": DB_CONN_MAX_AGE,
+        "CONN_HEALTH_CHECKS": True,
+        "OPTIONS": {},
+    }
+    if DB_POOL:
+        config["CONN_MAX_AGE"] = 0  # the pool keeps the connections
+        config["OPTIONS"]["pool"] = {"min_size": DB_POOL_MIN_SIZE, "max_size": DB_POOL_MAX_SIZE,
+                                     "timeout": DB_POOL_TIMEOUT}
+    return config
+
+
+def databases(base_dir: Path) -> dict:
+    if DB_ENGINE == "sqlite":
+        return {"default": sqlite(os.getenv("DB_NAME") or base_dir / "db.sqlite3")}
+    if DB_ENGINE != "postgres":
+        raise ValueError(f"DB_ENGINE must be sqlite or postgres, not {DB_ENGINE!r}")
+    default = postgres()
+    dbs = {"default": default}
+    if os.getenv("DB_REPLICA_HOST"):
+        dbs["replica"] = {**postgres("DB_REPLICA", fallback=default), "TEST": {"MIRROR": "default"}}
+    return dbs
@@ -5,6 +5,8 @@ from dotenv import load_dotenv
 
 load_dotenv()
 
+from .database import databases  # noqa: E402  (reads the environment loaded above)
+
 BASE_DIR = Path(__file__).resolve().parent.parent
 
 
@@ -29,6 +31,7 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    "conversations.metrics.MetricsMiddleware",
     "corsheaders.middleware.CorsMiddleware",  
     "django.middleware.security.SecurityMiddleware",
     "django.contrib.sessions.middleware.SessionMiddleware",
@@ -37,6 +40,7 @@ MIDDLEWARE = [
     "django.contrib.auth.middleware.AuthenticationMiddleware",
     "django.contrib.messages.middleware.MessageMiddleware",
     "django.middleware.clickjacking.XFrameOptionsMiddleware",
+    "conversations.scheduler.OverloadMiddleware",
 ]
 
 CORS_ALLOW_ALL_ORIGINS = True  
@@ -62,21 +66,9 @@ TEMPLATES = [
 WSGI_APPLICATION = "backend.wsgi.application"
 
 
-USE_SQLITE_FOR_DEV = True
-
-if USE_SQLITE_FOR_DEV:
-    DATABASES = {"default": {"ENGINE": "django.db.backends.sqlite3", "NAME": BASE_DIR / "db.sqlite3"}}
-else:
-    DATABASES = {
-         "default": {
-    "ENGINE": "django.db.backends.postgresql",
-    "NAME": "chat-ai",
-    "USER": "postgres",
-    "PASSWORD": "XLQaJg3ajjYA9zsPdie0",
-    "HOST": "localhost",
-    "PORT": "5432",
-  }
-    }
+# DB_ENGINE=sqlite (default) or postgres, pooling and a read replica: see backend/database.py
+DATABASES = databases(BASE_DIR)
+DATABASE_ROUTERS = ["conversations.routing.ReadReplicaRouter"]
 
 
 LANGUAGE_CODE = "en-us"
@@ -0,0 +1,114 @@
+"""
+Admission control against a fake LLM server that enforces its own rate limit.
+
+    python benchmarks/admission.py --rpm 600 --seconds 20
+    python benchmarks/admission.py --rpm 600 --interactive 8 --think 0.5   # interactive alone near the quota
+
+Starts benchmarks/fake_llm_server.py with --rpm and drives the ai.py
+entry points from threads for `seconds`: interactive chats (with think
+time between turns), summary chats and backfill embeddings as fast as
+they are answered. It runs twice, without admission control (every call
+goes straight to the provider, which answers 429 and trips the circuit
+breaker) and with a Scheduler at --share of the provider's limit, and
+prints per class how many calls were answered, shed with 429, failed
+with 503 or came back as error text, with p50/p95 latency of the
+answered ones, and how many requests the provider rejected.
+"""
+import argparse
+import os
+import sys
+import threading
+import time
+from collections import defaultdict
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+sys.path.insert(0, str(Path(__file__).resolve().parent))
+
+from fake_llm_server import serve  # noqa: E402
+
+
+def run(rpm: int, share: float, seconds: float, classes: dict, think: float, latency: float,
+        timeouts) -> tuple:
+    from conversations import ai, providers, scheduler
+
+    srv = serve(0, latency, rpm=rpm)
+    # a fresh client and circuit breaker per run
+    providers._instances["http"] = providers.HttpProvider(f"http://127.0.0.1:{srv.server_address[1]}/v1")
+    scheduler._scheduler = scheduler.Scheduler(rpm=rpm * share, timeouts=timeouts)
+
+    calls = {
+        "interactive": lambda i: ai.gemini_chat([{"role": "user", "content": f"hello {i}"}]),
+        "summary": lambda i: ai.gemini_chat([{"role": "user", "content": f"summarize {i} " * 50}],
+                                            priority=ai.SUMMARY),
+        "backfill": lambda i: ai.gemini_embed([f"chunk {i} {j}" for j in range(16)], priority=ai.BACKFILL),
+    }
+    outcomes = defaultdict(lambda: defaultdict(int))
+    latencies = defaultdict(list)
+    lock = threading.Lock()
+    stop = time.monotonic() + seconds
+
+    def worker(name: str, n: int):
+        i = 0
+        while time.monotonic() < stop:
+            i += 1
+            t0 = time.perf_counter()
+            try:
+                out = calls[name](f"{n}-{i}")
+                kind = "error" if isinstance(out, str) and out.startswith("(AI error") else "ok"
+            except ai.Overloaded as e:
+                kind = str(e.status)
+            with lock:
+                outcomes[name][kind] += 1
+                if kind == "ok":
+                    latencies[name].append(time.perf_counter() - t0)
+            if name == "interactive":
+                time.sleep(think)
+            elif kind != "ok":
+                time.sleep(0.1)  # don't spin on refusals
+
+    threads = [threading.Thread(target=worker, args=(name, n))
+               for name, count in classes.items() for n in range(count)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    srv.shutdown()
+    return outcomes, latencies, srv.limit
+
+
+def report(label: str, outcomes, latencies, limit) -> None:
+    print(f"-- {label}: provider served {limit.served}, rejected {limit.limited} with 429")
+    print(f"{'class':<12} {'ok':>6} {'429':>6} {'503':>6} {'error':>6} {'p50 s':>7} {'p95 s':>7}")
+    for name in ("interactive", "summary", "backfill"):
+        o, lat = outcomes[name], sorted(latencies[name])
+        p50 = lat[len(lat) // 2] if lat else float("nan")
+        p95 = lat[int(len(lat) * 0.95)] if lat else float("nan")
+        print(f"{name:<12} {o['ok']:>6} {o['429']:>6} {o['503']:>6} {o['error']:>6} {p50:>7.2f} {p95:>7.2f}")
+
+
+if __name__ == "__main__":
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--rpm", type=int, default=600, help="the fake provider's requests per minute")
+    ap.add_argument("--share", type=float, default=0.9, help="LLM_RPM as a share of --rpm")
+    ap.add_argument("--seconds", type=float, default=20)
+    ap.add_argument("--interactive", type=int, default=4, help="chat threads")
+    ap.add_argument("--think", type=float, default=1.0, help="seconds between a chat thread's turns")
+    ap.add_argument("--summary", type=int, default=4, help="summary threads")
+    ap.add_argument("--backfill", type=int, default=8, help="embedding threads")
+    ap.add_argument("--latency", type=float, default=0.05)
+    ap.add_argument("--queue-timeout", type=float, default=10)
+    ap.add_argument("--background-timeout", type=float, default=5)
+    args = ap.parse_args()
+
+    os.environ["CHAT_BACKEND"] = "http"
+    os.environ.setdefault("LLM_RETRIES", "2")
+    os.environ.setdefault("LLM_BACKOFF_MAX", "2")
+    os.environ.setdefault("DJANGO_SETTINGS_MODULE", "backend.settings")
+    import django
+    django.setup()
+
+    classes = {"interactive": args.interactive, "summary": args.summary, "backfill": args.backfill}
+    timeouts = (args.queue_timeout, args.background_timeout, args.background_timeout)
+    for label, share in (("no admission control", 0), (f"LLM_RPM={args.rpm * args.share:g}", args.share)):
+        report(label, *run(args.rpm, share, args.seconds, classes, args.think, args.latency, timeouts))
@@ -0,0 +1,103 @@
+"""
+Throughput of the sync (thread-per-request) vs async send_message path
+against a local fake LLM server.
+
+    python benchmarks/async_load.py --chats 200 --workers 8 --latency 0.2
+
+The sync run models a WSGI deployment with `workers` threads; the async
+run drives /api/async/ through the ASGI handler on one event loop.
+Requires httpx for the async LLM client.
+"""
+import argparse
+import asyncio
+import os
+import sys
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+sys.path.insert(0, str(Path(__file__).resolve().parent))
+
+from fake_llm_server import serve
+
+
+def setup(latency: float):
+    srv = serve(0, latency)
+    os.environ["CHAT_BACKEND"] = "http"
+    os.environ["LLM_BASE_URL"] = f"http://127.0.0.1:{srv.server_address[1]}/v1"
+    os.environ.setdefault("DJANGO_SETTINGS_MODULE", "backend.settings")
+
+    import django
+    from django.conf import settings
+    django.setup()
+    settings.DATABASES["default"]["NAME"] = os.path.join(tempfile.mkdtemp(), "bench.sqlite3")
+    settings.DATABASES["default"].setdefault("OPTIONS", {})["timeout"] = 30
+    settings.ALLOWED_HOSTS = ["*"]
+
+    # The DB is not what is measured here; keep commit fsyncs out of the numbers.
+    from django.db.backends.signals import connection_created
+
+    def fast_sqlite(sender, connection, **kwargs):
+        with connection.cursor() as cur:
+            cur.execute("PRAGMA journal_mode=WAL")
+            cur.execute("PRAGMA synchronous=OFF")
+    connection_created.connect(fast_sqlite)
+
+    from django.core.management import call_command
+    call_command("migrate", verbosity=0)
+
+
+def make_conversations(n: int):
+    from conversations.models import Conversation
+    return [c.id for c in Conversation.objects.bulk_create(Conversation() for _ in range(n))]
+
+
+def run_sync(ids, workers: int) -> float:
+    from django.db import connections
+    from django.test import Client
+
+    def one(cid):
+        r = Client().post(f"/api/conversations/{cid}/messages/", {"content": "hello"},
+                          content_type="application/json")
+        connections.close_all()
+        assert r.status_code == 201, r.content
+
+    t0 = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        list(pool.map(one, ids))
+    return time.perf_counter() - t0
+
+
+def run_async(ids) -> float:
+    from django.test import AsyncClient
+
+    async def main():
+        client = AsyncClient()
+
+        async def one(cid):
+            r = await client.post(f"/api/async/conversations/{cid}/messages/", {"content": "hello"},
+                                  content_type="application/json")
+            assert r.status_code == 201, r.content
+
+        t0 = time.perf_counter()
+        await asyncio.gather(*(one(cid) for cid in ids))
+        return time.perf_counter() - t0
+
+    return asyncio.run(main())
+
+
+if __name__ == "__main__":
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--chats", type=int, default=200)
+    ap.add_argument("--workers", type=int, default=8)
+    ap.add_argument("--latency", type=float, default=0.2)
+    args = ap.parse_args()
+
+    setup(args.latency)
+    for name, run in (("sync ", lambda ids: run_sync(ids, args.workers)), ("async", run_async)):
+        run(make_conversations(1))  # warm up imports and connections
+        ids = make_conversations(args.chats)
+        secs = run(ids)
+        print(f"{name}: {args.chats} chats in {secs:6.2f}s  -> {args.chats / secs:7.1f} msg/s")
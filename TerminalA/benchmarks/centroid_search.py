@@ -0,0 +1,86 @@
+"""
+Recall and latency of two-stage (centroid) vector search against the
+exhaustive scan.
+
+    python benchmarks/centroid_search.py --conversations 20000 --messages 50 --probe 32 128 512
+    python benchmarks/centroid_search.py --noise 4   # topics overlap more; recall drops
+
+The fake embedder gives unrelated vectors, which no centroid can
+cluster, so this builds a VectorIndex in memory from synthetic
+topical vectors instead: every conversation has a topic, its messages
+are the topic plus noise, and each query is a noisy topic. Recall@k is
+the share of the exhaustive top-k the two-stage search also returns.
+"""
+import argparse
+import os
+import statistics
+import sys
+import time
+from pathlib import Path
+
+import numpy as np
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+
+def build(conversations: int, messages: int, dim: int, noise: float, seed: int):
+    from conversations.vector_index import VectorIndex
+    rng = np.random.default_rng(seed)
+    topics = rng.standard_normal((conversations, dim)).astype(np.float32)
+    index = VectorIndex()
+    index._built = True
+    index.refresh = lambda: None  # in-memory only, no database
+    eid = 0
+    for lo in range(0, conversations, 1000):
+        rows = []
+        for c in range(lo, min(lo + 1000, conversations)):
+            vecs = topics[c] + noise * rng.standard_normal((messages, dim)).astype(np.float32)
+            for v in vecs:
+                eid += 1
+                rows.append((eid, eid, c + 1, True, eid, v))
+        index._append(rows)
+    return index, topics
+
+
+def run(index, topics, probes, queries: int, k: int, noise: float, seed: int):
+    rng = np.random.default_rng(seed + 1)
+    qs = [topics[rng.integers(len(topics))] + noise * rng.standard_normal(topics.shape[1]) for _ in range(queries)]
+
+    def timed(conversations):
+        out, ms = [], []
+        for q in qs:
+            t0 = time.perf_counter()
+            out.append({e for _, e in index.search(q, k, conversations=conversations)})
+            ms.append((time.perf_counter() - t0) * 1000)
+        return out, ms
+
+    exact, exact_ms = timed(None)
+    yield "exhaustive", 1.0, exact_ms
+    for c in probes:
+        got, ms = timed(c)
+        recall = statistics.mean(len(a & b) / max(1, len(a)) for a, b in zip(exact, got))
+        yield f"C={c}", recall, ms
+
+
+if __name__ == "__main__":
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--conversations", type=int, default=20000)
+    ap.add_argument("--messages", type=int, default=20, help="embeddings per conversation")
+    ap.add_argument("--dim", type=int, default=768)
+    ap.add_argument("--noise", type=float, default=2.0, help="message spread around its topic")
+    ap.add_argument("--probe", type=int, nargs="+", default=[32, 128, 512], help="conversations scored (C)")
+    ap.add_argument("--queries", type=int, default=200)
+    ap.add_argument("-k", type=int, default=24, help="top-k compared (semantic_search asks for 3x excerpts)")
+    ap.add_argument("--seed", type=int, default=0)
+    args = ap.parse_args()
+
+    os.environ.setdefault("DJANGO_SETTINGS_MODULE", "backend.settings")
+    import django
+    django.setup()
+    t0 = time.perf_counter()
+    index, topics = build(args.conversations, args.messages, args.dim, args.noise, args.seed)
+    print(f"# {len(index)} vectors in {args.conversations} conversations, built in {time.perf_counter() - t0:.1f}s")
+    print(f"{'search':<12} {'recall@k':>9} {'p50 ms':>8} {'p95 ms':>8}")
+    for name, recall, ms in run(index, topics, args.probe, args.queries, args.k, args.noise, args.seed):
+        ms.sort()
+        print(f"{name:<12} {recall:>9.3f} {ms[len(ms) // 2]:>8.2f} {ms[int(len(ms) * 0.95)]:>8.2f}")
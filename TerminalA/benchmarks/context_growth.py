@@ -0,0 +1,92 @@
+"""
+Per-turn cost of send_message as a conversation grows.
+
+    python benchmarks/context_growth.py --sizes 10 100 1000 5000 --turns 20
+
+For each history size, times `turns` calls to the messages endpoint with
+the offline fake model (so only DB + prompt construction is measured)
+and compares against rebuilding the full-history prompt, which is what
+send_message did before the bounded context builder.
+"""
+import argparse
+import os
+import statistics
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+
+def setup():
+    os.environ["CHAT_BACKEND"] = "fake"
+    os.environ.setdefault("DJANGO_SETTINGS_MODULE", "backend.settings")
+    import django
+    from django.conf import settings
+    django.setup()
+    settings.DATABASES["default"]["NAME"] = os.path.join(tempfile.mkdtemp(), "bench.sqlite3")
+    settings.ALLOWED_HOSTS = ["*"]
+    from django.core.management import call_command
+    call_command("migrate", verbosity=0)
+
+
+def make_conversation(n: int):
+    from conversations.models import Conversation, Message
+    conv = Conversation.objects.create(title=f"history {n}")
+    Message.objects.bulk_create(
+        Message(conversation=conv, role="user" if i % 2 == 0 else "assistant",
+                content=f"message {i} " + "lorem ipsum dolor sit amet " * 8)
+        for i in range(n)
+    )
+    return conv
+
+
+def full_history_prompt(conv) -> int:
+    """The old whole-history prompt: every message of the conversation, flattened."""
+    from conversations.ai import _build_prompt
+    history = [{"role": m.role, "content": m.content} for m in conv.messages.order_by("created_at")]
+    return len(_build_prompt([{"role": "system", "content": "x"}] + history))
+
+
+def pct(xs, p):
+    xs = sorted(xs)
+    return xs[min(len(xs) - 1, int(p / 100 * len(xs)))]
+
+
+if __name__ == "__main__":
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--sizes", type=int, nargs="+", default=[10, 100, 1000, 5000])
+    ap.add_argument("--turns", type=int, default=20)
+    args = ap.parse_args()
+
+    setup()
+    from django.test import Client
+    from conversations.ai import _build_prompt
+    from conversations.context import build_llm_context
+    from conversations.views import SYSTEM_PROMPT
+
+    client = Client()
+    print(f"{'history':>8} {'turn p50 ms':>12} {'turn p95 ms':>12} {'prompt chars':>13} "
+          f"{'old prompt ms':>14} {'old prompt chars':>17}")
+    for n in args.sizes:
+        conv = make_conversation(n)
+        client.post(f"/api/conversations/{conv.id}/messages/", {"content": "warm up"},
+                    content_type="application/json")
+        times = []
+        for i in range(args.turns):
+            t0 = time.perf_counter()
+            r = client.post(f"/api/conversations/{conv.id}/messages/", {"content": f"turn {i}"},
+                            content_type="application/json")
+            times.append((time.perf_counter() - t0) * 1000)
+            assert r.status_code == 201, r.content
+        conv.refresh_from_db()
+        prompt = len(_build_prompt(build_llm_context(conv, SYSTEM_PROMPT)))
+
+        old = []
+        for _ in range(min(args.turns, 5)):
+            t0 = time.perf_counter()
+            old_chars = full_history_prompt(conv)
+            old.append((time.perf_counter() - t0) * 1000)
+        print(f"{n:>8} {pct(times, 50):>12.2f} {pct(times, 95):>12.2f} {prompt:>13} "
+              f"{statistics.median(old):>14.2f} {old_chars:>17}")
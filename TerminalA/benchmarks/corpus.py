@@ -0,0 +1,81 @@
+"""
+Deterministic synthetic corpus for benchmarks and query-count tests.
+
+    from benchmarks.corpus import generate
+    generate(conversations=1000, messages=10, seed=0)
+
+Builds N conversations x M messages of pseudo-random text drawn from a
+fixed vocabulary, with keyword postings and embeddings, using the same
+bulk paths as the app (keyword_index.index_messages, chunked
+MessageEmbedding rows over content-addressed EmbeddingVectors). Vectors come from the fake backend's embedder,
+so a query embedded with CHAT_BACKEND=fake lands in the same space.
+Roughly one conversation in ten is left active.
+"""
+import random
+from typing import List, Tuple
+
+VOCAB = (
+    "kiwi mango budget invoice travel visa deadline sprint release database index "
+    "latency cache query vector summary meeting roadmap hiring onboarding contract "
+    "refund shipping warehouse forecast revenue churn pricing discount survey feedback "
+    "bug crash deploy rollback migration schema backup password login token server "
+    "python django react docker kubernetes postgres redis kafka metrics alert"
+).split()
+FILLER = "the a of to and in for on with about from we you it this that is was will can".split()
+
+
+def sentence(rng: random.Random, words: int = 12) -> str:
+    picked = [rng.choice(VOCAB) if rng.random() < 0.4 else rng.choice(FILLER) for _ in range(words)]
+    return " ".join(picked).capitalize() + "."
+
+
+def message_text(rng: random.Random) -> str:
+    return " ".join(sentence(rng, rng.randint(6, 18)) for _ in range(rng.randint(1, 4)))
+
+
+def queries(n: int, seed: int = 1) -> List[str]:
+    """n distinct-ish search strings over the corpus vocabulary."""
+    rng = random.Random(seed)
+    return [f"what about {rng.choice(VOCAB)} and {rng.choice(VOCAB)}?" for _ in range(n)]
+
+
+def generate(conversations: int, messages: int, seed: int = 0, embed: bool = True,
+             batch: int = 500) -> Tuple[int, int]:
+    """Write the corpus; returns (conversations, messages) created."""
+    from conversations.ai import EMBED_MODEL, _fake_embed, content_digest
+    from conversations.chunking import split_text
+    from conversations.keyword_index import index_messages
+    from conversations.models import Conversation, Message, MessageEmbedding
+    from conversations.services import save_vectors, stored_vectors
+    from conversations.vector_index import get_index
+
+    rng = random.Random(seed)
+    made = 0
+    for lo in range(0, conversations, batch):
+        convs = Conversation.objects.bulk_create(
+            Conversation(
+                title=f"{rng.choice(VOCAB)} {rng.choice(VOCAB)} #{lo + i}",
+                status="active" if rng.random() < 0.1 else "ended",
+                summary=sentence(rng, 20),
+                tags=rng.sample(VOCAB, 3),
+            )
+            for i in range(min(batch, conversations - lo))
+        )
+        msgs = Message.objects.bulk_create(
+            Message(conversation=c, role="user" if j % 2 == 0 else "assistant", content=message_text(rng))
+            for c in convs for j in range(messages)
+        )
+        made += len(msgs)
+        index_messages(msgs)
+        if embed:
+            pieces = [(m, a, b, content_digest(EMBED_MODEL, m.content[a:b]))
+                      for m in msgs for a, b in split_text(m.content)]
+            vectors = stored_vectors(d for *_, d in pieces)
+            vectors.update(save_vectors({d: _fake_embed(m.content[a:b])
+                                         for m, a, b, d in pieces if d not in vectors}))
+            MessageEmbedding.objects.bulk_create(
+                (MessageEmbedding(message=m, start=a, end=b, vector=vectors[d]) for m, a, b, d in pieces),
+                batch_size=batch,
+            )
+    get_index().reset()
+    return conversations, made
@@ -0,0 +1,152 @@
+"""
+Concurrent send_message writes against each database profile.
+
+    python benchmarks/db_profiles.py --threads 8 --messages 50
+    python benchmarks/db_profiles.py --postgres        # also DB_ENGINE=postgres, needs DB_HOST etc.
+
+Every profile runs in its own process, configured only through the
+environment that backend/database.py reads:
+
+    sqlite-legacy   rollback journal, synchronous=FULL, 5 s timeout and
+                    deferred transactions (Django's defaults before)
+    sqlite-wal      the defaults: WAL, synchronous=NORMAL, BEGIN IMMEDIATE
+    postgres        persistent connections (DB_CONN_MAX_AGE)
+    postgres-pool   DB_POOL=1
+
+`threads` writers each post `messages` user turns to their own
+conversation (the fake LLM answers, so every call writes both messages
+and their jobs) while `readers` threads list conversations.
+Prints writes per second, p50/p95 latency, and how many calls failed
+with "database is locked" or another error. SQLite profiles use a fresh
+file; Postgres ones a throwaway test database.
+"""
+import argparse
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+PROFILES = {
+    "sqlite-legacy": {"DB_ENGINE": "sqlite", "SQLITE_JOURNAL_MODE": "DELETE", "SQLITE_SYNCHRONOUS": "FULL",
+                      "SQLITE_BUSY_TIMEOUT": "5", "SQLITE_TRANSACTION_MODE": "DEFERRED"},
+    "sqlite-wal": {"DB_ENGINE": "sqlite"},
+    "postgres": {"DB_ENGINE": "postgres", "DB_POOL": "0"},
+    "postgres-pool": {"DB_ENGINE": "postgres", "DB_POOL": "1"},
+}
+
+
+def pct(xs, p):
+    xs = sorted(xs)
+    return xs[min(len(xs) - 1, int(p / 100 * len(xs)))] if xs else float("nan")
+
+
+def child(threads: int, messages: int, readers: int) -> dict:
+    """Run inside the profile's process; returns the numbers as a dict."""
+    os.environ["CHAT_BACKEND"] = "fake"
+    os.environ.setdefault("DJANGO_SETTINGS_MODULE", "backend.settings")
+    import django
+    django.setup()
+    from django.conf import settings
+    from django.core.management import call_command
+    from django.db import OperationalError, connection, connections
+    from django.test import Client
+
+    settings.ALLOWED_HOSTS = ["*"]
+    postgres = connection.vendor == "postgresql"
+    if postgres:
+        old_name = connection.creation.create_test_db(verbosity=0, autoclobber=True)
+    else:
+        call_command("migrate", verbosity=0)
+
+    from conversations.models import Conversation
+    convs = [Conversation.objects.create().id for _ in range(threads)]
+    connections.close_all()
+
+    lock = threading.Lock()
+    latencies, errors = [], {"locked": 0, "other": 0}
+    done = threading.Event()
+
+    def writer(cid: int):
+        client = Client()
+        for i in range(messages):
+            t0 = time.perf_counter()
+            try:
+                r = client.post(f"/api/conversations/{cid}/messages/", {"role": "user", "content": f"turn {i}"},
+                                content_type="application/json")
+                kind = None if r.status_code == 201 else "other"
+            except OperationalError as e:
+                kind = "locked" if "locked" in str(e) else "other"
+            except Exception:
+                kind = "other"
+            with lock:
+                if kind:
+                    errors[kind] += 1
+                else:
+                    latencies.append(time.perf_counter() - t0)
+        connections.close_all()
+
+    def reader():
+        client = Client()
+        while not done.is_set():
+            try:
+                client.get("/api/conversations/")
+            except OperationalError as e:
+                with lock:
+                    errors["locked" if "locked" in str(e) else "other"] += 1
+        connections.close_all()
+
+    readers_ = [threading.Thread(target=reader) for _ in range(readers)]
+    writers = [threading.Thread(target=writer, args=(cid,)) for cid in convs]
+    t0 = time.perf_counter()
+    for t in readers_ + writers:
+        t.start()
+    for t in writers:
+        t.join()
+    elapsed = time.perf_counter() - t0
+    done.set()
+    for t in readers_:
+        t.join()
+
+    if postgres:
+        connection.creation.destroy_test_db(old_name, verbosity=0)
+    return {"ok": len(latencies), "per_s": len(latencies) / elapsed, "p50": pct(latencies, 50) * 1000,
+            "p95": pct(latencies, 95) * 1000, **errors}
+
+
+def run(profile: str, args) -> dict:
+    env = {**os.environ, **PROFILES[profile]}
+    if profile.startswith("sqlite"):
+        env["DB_NAME"] = os.path.join(tempfile.mkdtemp(), f"{profile}.sqlite3")
+    out = subprocess.run([sys.executable, __file__, "--child", "--threads", str(args.threads),
+                          "--messages", str(args.messages), "--readers", str(args.readers)],
+                         env=env, capture_output=True, text=True)
+    if out.returncode:
+        raise SystemExit(f"{profile} failed:\n{out.stderr}")
+    return json.loads(out.stdout.strip().splitlines()[-1])
+
+
+if __name__ == "__main__":
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--threads", type=int, default=8, help="concurrent writers")
+    ap.add_argument("--messages", type=int, default=50, help="turns per writer")
+    ap.add_argument("--readers", type=int, default=2, help="threads listing conversations meanwhile")
+    ap.add_argument("--postgres", action="store_true", help="also run the Postgres profiles")
+    ap.add_argument("--child", action="store_true", help=argparse.SUPPRESS)
+    args = ap.parse_args()
+
+    if args.child:
+        print(json.dumps(child(args.threads, args.messages, args.readers)))
+        sys.exit()
+
+    profiles = [p for p in PROFILES if args.postgres or p.startswith("sqlite")]
+    print(f"{'profile':<15} {'ok':>6} {'writes/s':>9} {'p50 ms':>8} {'p95 ms':>8} {'locked':>7} {'other':>6}")
+    for profile in profiles:
+        r = run(profile, args)
+        print(f"{profile:<15} {r['ok']:>6} {r['per_s']:>9.1f} {r['p50']:>8.1f} {r['p95']:>8.1f} "
+              f"{r['locked']:>7} {r['other']:>6}", flush=True)
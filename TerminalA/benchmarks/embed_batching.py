@@ -0,0 +1,119 @@
+"""
+Query-embedding calls and latency under concurrent search load, with and
+without micro-batching (conversations/embed_batch.py).
+
+    python benchmarks/embed_batching.py --requests 400 --concurrency 32 --latency 0.05
+
+Uses the offline fake provider with a fixed per-call latency, so the
+numbers are the embedding round-trips only. --api-concurrency caps the
+calls in flight, like a provider's rate or connection limit, and a share
+of the queries (--repeat-share) repeats a previous one, as popular
+searches do.
+"""
+import argparse
+import asyncio
+import os
+import random
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+
+def pct(xs, p):
+    xs = sorted(xs)
+    return xs[min(len(xs) - 1, int(p / 100 * len(xs)))]
+
+
+def workload(n: int, repeat_share: float):
+    rng = random.Random(0)
+    out = []
+    for i in range(n):
+        out.append(rng.choice(out) if out and rng.random() < repeat_share else f"query number {i}")
+    return out
+
+
+def limited(fn, calls, limit):
+    sem = threading.BoundedSemaphore(limit)
+
+    def wrapped(texts):
+        calls.append(len(texts))
+        with sem:
+            return fn(texts)
+    return wrapped
+
+
+def alimited(fn, calls, limit):
+    sem = asyncio.Semaphore(limit)
+
+    async def wrapped(texts):
+        calls.append(len(texts))
+        async with sem:
+            return await fn(texts)
+    return wrapped
+
+
+def run_threads(texts, concurrency, limit, window_ms):
+    from conversations.ai import gemini_embed
+    from conversations.embed_batch import EmbedBatcher
+    calls = []
+    batcher = EmbedBatcher(limited(gemini_embed, calls, limit), window_ms=window_ms)
+
+    def one(t):
+        t0 = time.perf_counter()
+        batcher.embed(t)
+        return (time.perf_counter() - t0) * 1000
+    t0 = time.perf_counter()
+    with ThreadPoolExecutor(concurrency) as pool:
+        lat = list(pool.map(one, texts))
+    return calls, lat, time.perf_counter() - t0
+
+
+def run_async(texts, concurrency, limit, window_ms):
+    from conversations.ai import agemini_embed
+    from conversations.embed_batch import AsyncEmbedBatcher
+    calls = []
+
+    async def main():
+        batcher = AsyncEmbedBatcher(alimited(agemini_embed, calls, limit), window_ms=window_ms)
+        sem = asyncio.Semaphore(concurrency)
+
+        async def one(t):
+            async with sem:
+                t0 = time.perf_counter()
+                await batcher.embed(t)
+                return (time.perf_counter() - t0) * 1000
+        t0 = time.perf_counter()
+        lat = await asyncio.gather(*(one(t) for t in texts))
+        return lat, time.perf_counter() - t0
+    lat, wall = asyncio.run(main())
+    return calls, lat, wall
+
+
+if __name__ == "__main__":
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--requests", type=int, default=400)
+    ap.add_argument("--concurrency", type=int, default=32)
+    ap.add_argument("--latency", type=float, default=0.05, help="fake embed seconds per call")
+    ap.add_argument("--api-concurrency", type=int, default=4)
+    ap.add_argument("--window-ms", type=float, default=10)
+    ap.add_argument("--repeat-share", type=float, default=0.3)
+    args = ap.parse_args()
+
+    os.environ.setdefault("DJANGO_SETTINGS_MODULE", "backend.settings")
+    import django
+    django.setup()
+    from conversations import ai, providers
+    ai.CHAT_BACKEND, providers.FAKE_LATENCY = "fake", args.latency
+
+    texts = workload(args.requests, args.repeat_share)
+    print(f"{'mode':>6} {'window ms':>9} {'api calls':>9} {'avg batch':>9} "
+          f"{'p50 ms':>8} {'p95 ms':>8} {'p99 ms':>8} {'req/s':>8}")
+    for name, runner in (("thread", run_threads), ("async", run_async)):
+        for window in (0, args.window_ms):
+            calls, lat, wall = runner(texts, args.concurrency, args.api_concurrency, window)
+            print(f"{name:>6} {window:>9g} {len(calls):>9} {sum(calls) / len(calls):>9.1f} "
+                  f"{pct(lat, 50):>8.1f} {pct(lat, 95):>8.1f} {pct(lat, 99):>8.1f} {len(texts) / wall:>8.0f}")
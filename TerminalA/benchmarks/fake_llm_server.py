@@ -0,0 +1,122 @@
+"""
+Minimal OpenAI-compatible fake LLM server for load tests.
+
+    python benchmarks/fake_llm_server.py --port 8765 --latency 0.2
+    python benchmarks/fake_llm_server.py --rpm 120 --tpm 40000   # with provider rate limits
+
+Serves POST /v1/chat/completions and POST /v1/embeddings, sleeping
+`latency` seconds per request. With --rpm / --tpm it enforces requests
+and tokens (chars / 4 of the request) per sliding minute like a hosted
+provider: a request over the limit gets 429 with Retry-After and is
+not served. Point the backend at it with
+CHAT_BACKEND=http LLM_BASE_URL=http://127.0.0.1:8765/v1.
+"""
+import argparse
+import hashlib
+import json
+import math
+import threading
+import time
+from collections import deque
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import numpy as np
+
+EMBED_DIM = 768
+
+
+class RateLimit:
+    """Requests and tokens per sliding 60 s window; 0 = unlimited."""
+
+    def __init__(self, rpm: int = 0, tpm: int = 0):
+        self.rpm, self.tpm = rpm, tpm
+        self.served = 0
+        self.limited = 0
+        self._log = deque()  # (time, tokens) of served requests
+        self._tokens = 0
+        self._lock = threading.Lock()
+
+    def admit(self, tokens: int) -> float:
+        """0 if the request may be served (and counts it), else seconds until it could be."""
+        with self._lock:
+            now = time.monotonic()
+            while self._log and self._log[0][0] <= now - 60:
+                self._tokens -= self._log.popleft()[1]
+            over_rpm = self.rpm and len(self._log) >= self.rpm
+            over_tpm = self.tpm and self._log and self._tokens + tokens > self.tpm
+            if over_rpm or over_tpm:
+                self.limited += 1
+                return max(0.001, self._log[0][0] + 60 - now)
+            self._log.append((now, tokens))
+            self._tokens += tokens
+            self.served += 1
+            return 0.0
+
+
+def _vector(text: str):
+    seed = int.from_bytes(hashlib.sha1(text.encode("utf-8")).digest()[:8], "little")
+    return np.random.default_rng(seed).standard_normal(EMBED_DIM).astype(np.float32).tolist()
+
+
+class Handler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"  # keep-alive, so client pooling is exercised
+    disable_nagle_algorithm = True
+    wbufsize = -1  # headers + body in one write; flushed per request
+    latency = 0.0
+    limit = RateLimit()
+
+    def log_message(self, *args):
+        pass
+
+    def _send(self, status: int, payload: dict, headers: dict = None):
+        body = json.dumps(payload).encode()
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        for k, v in (headers or {}).items():
+            self.send_header(k, v)
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_POST(self):
+        length = int(self.headers.get("Content-Length") or 0)
+        raw = self.rfile.read(length)
+        req = json.loads(raw or b"{}")
+        wait = self.limit.admit(len(raw) // 4)
+        if wait:
+            self._send(429, {"error": {"type": "rate_limit_exceeded", "message": "Rate limit reached"}},
+                       {"Retry-After": str(math.ceil(wait))})
+            return
+        time.sleep(self.latency)
+        if self.path.endswith("/chat/completions"):
+            last = next((m["content"] for m in reversed(req.get("messages", [])) if m["role"] == "user"), "")
+            self._send(200, {"choices": [{"index": 0, "message": {"role": "assistant", "content": f"You said: {last}"}}]})
+        elif self.path.endswith("/embeddings"):
+            texts = req.get("input") or []
+            texts = [texts] if isinstance(texts, str) else texts
+            self._send(200, {"data": [{"index": i, "embedding": _vector(t)} for i, t in enumerate(texts)]})
+        else:
+            self._send(404, {"error": "not found"})
+
+
+def serve(port: int = 0, latency: float = 0.0, rpm: int = 0, tpm: int = 0) -> ThreadingHTTPServer:
+    """Start the server on a daemon thread; returns it (see .server_address, .limit)."""
+    handler = type("FakeLLMHandler", (Handler,), {"latency": latency, "limit": RateLimit(rpm, tpm)})
+    server = ThreadingHTTPServer(("127.0.0.1", port), handler)
+    server.limit = handler.limit
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+if __name__ == "__main__":
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--port", type=int, default=8765)
+    ap.add_argument("--latency", type=float, default=0.2)
+    ap.add_argument("--rpm", type=int, default=0, help="requests per minute before 429 (0 = unlimited)")
+    ap.add_argument("--tpm", type=int, default=0, help="tokens per minute before 429 (0 = unlimited)")
+    args = ap.parse_args()
+    srv = serve(args.port, args.latency, args.rpm, args.tpm)
+    print(f"fake LLM on http://127.0.0.1:{srv.server_address[1]}/v1 (latency {args.latency}s, "
+          f"rpm {args.rpm or '-'}, tpm {args.tpm or '-'})")
+    threading.Event().wait()
@@ -0,0 +1,107 @@
+"""
+Query plans and latency of the hot read queries with and without the
+0008_query_indexes indexes.
+
+    python benchmarks/index_plans.py --conversations 100000 --messages 10
+    python benchmarks/index_plans.py --default-db ...   # configured DB, e.g. Postgres
+
+Builds the corpus (no embeddings) in a fresh SQLite file, or in the
+configured default database with --default-db, then runs every scenario
+twice: migrated back to 0007 (indexes dropped) and forward to 0008. For
+each scenario it prints p50/p95 ms per run and, with --plans, the
+database's plan for the ORM queries.
+"""
+import argparse
+import os
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from benchmarks.suite import measure, setup  # noqa: E402
+
+BEFORE, AFTER = "0007_job_window_kind", "0008_query_indexes"
+
+
+def scenarios():
+    from django.test import Client
+    from conversations.models import Conversation, Message
+
+    client = Client()
+    ended = list(Conversation.objects.filter(status="ended").order_by("?").values_list("id", flat=True)[:100])
+
+    def get(url):
+        r = client.get(url)
+        assert r.status_code == 200, (url, r.status_code)
+
+    # name -> (callable, queryset to explain or None)
+    transcript = lambda i: Message.objects.filter(conversation_id=ended[i % len(ended)]).order_by("created_at")
+    recent_ended = lambda i: Conversation.objects.filter(status="ended").order_by("-started_at")[:25]
+    ended_ids = lambda i: Conversation.objects.filter(status="ended").order_by("id").values_list("id", flat=True)[:2000]
+    # the embedding backfill's scan (services._unembedded)
+    ended_messages = lambda i: (Message.objects.select_related("conversation")
+                                .filter(conversation__status="ended", embeddings__isnull=True, id__gt=i * 997)
+                                .order_by("id")[:500])
+    return {
+        "list": (lambda i: get("/api/conversations/"), None),
+        "detail": (lambda i: get(f"/api/conversations/{ended[i % len(ended)]}/"), None),
+        "transcript": (lambda i: list(transcript(i)), transcript(0)),
+        "recent ended": (lambda i: list(recent_ended(i)), recent_ended(0)),
+        "ended ids": (lambda i: list(ended_ids(i)), ended_ids(0)),
+        "ended messages": (lambda i: list(ended_messages(i)), ended_messages(0)),
+    }
+
+
+def run(repeat: int, plans: bool, analyze: bool) -> dict:
+    from django.core.management import call_command
+    from django.db import connection
+    out = {}
+    for label, target in (("before", BEFORE), ("after", AFTER)):
+        call_command("migrate", "conversations", target, verbosity=0)
+        if analyze:
+            with connection.cursor() as cur:
+                cur.execute("ANALYZE")
+        out[label] = {}
+        for name, (fn, qs) in scenarios().items():
+            out[label][name] = measure(fn, repeat)
+            if plans and qs is not None:
+                print(f"-- {label} {name}\n{qs.explain()}")
+    return out
+
+
+if __name__ == "__main__":
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--conversations", type=int, default=10000)
+    ap.add_argument("--messages", type=int, default=10, help="messages per conversation")
+    ap.add_argument("--repeat", type=int, default=30)
+    ap.add_argument("--plans", action="store_true", help="print query plans")
+    ap.add_argument("--analyze", action="store_true",
+                    help="also run ANALYZE before measuring without the indexes (0008 runs it itself)")
+    ap.add_argument("--default-db", action="store_true",
+                    help="use the configured database instead of a temp SQLite file (adds the corpus to it)")
+    args = ap.parse_args()
+
+    if args.default_db:
+        os.environ["CHAT_BACKEND"] = "fake"
+        os.environ.setdefault("DJANGO_SETTINGS_MODULE", "backend.settings")
+        import django
+        django.setup()
+        from django.conf import settings
+        from django.core.management import call_command
+        settings.ALLOWED_HOSTS = ["*"]
+        call_command("migrate", verbosity=0)
+    else:
+        setup(os.path.join(tempfile.mkdtemp(), "plans.sqlite3"), latency=0.0)
+
+    from benchmarks.corpus import generate
+    t0 = time.perf_counter()
+    generate(args.conversations, args.messages, embed=False, batch=2000)
+    print(f"# corpus {args.conversations} x {args.messages} built in {time.perf_counter() - t0:.1f}s", flush=True)
+
+    results = run(args.repeat, args.plans, args.analyze)
+    print(f"{'scenario':<16} {'p50 before':>11} {'p50 after':>10} {'p95 before':>11} {'p95 after':>10} {'queries':>8}")
+    for name, b in results["before"].items():
+        a = results["after"][name]
+        print(f"{name:<16} {b['p50']:>11.2f} {a['p50']:>10.2f} {b['p95']:>11.2f} {a['p95']:>10.2f} {a['queries']:>8}")
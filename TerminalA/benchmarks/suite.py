@@ -0,0 +1,151 @@
+"""
+Latency and query-count benchmarks for the hot endpoints at growing scale.
+
+    python benchmarks/suite.py --scales 1k 10k --repeat 50
+    python benchmarks/suite.py --scales 1k --json out.json
+    python benchmarks/suite.py --scales 1k --baseline out.json   # exit 1 on regression
+
+Each scale gets a fresh SQLite database filled by benchmarks.corpus. The
+LLM is the offline fake backend (CHAT_BACKEND=fake, FAKE_LLM_LATENCY via
+--latency), so numbers are DB + Python cost plus a fixed model delay.
+For every scenario the suite reports p50/p95/p99 latency and the number
+of DB queries per call. With --baseline, a scenario regresses when its
+query count grows, or when its p95 exceeds the baseline's by more than
+--tolerance (a ratio).
+"""
+import argparse
+import json
+import os
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+# scale -> (conversations, messages per conversation)
+SCALES = {"1k": (100, 10), "10k": (1000, 10), "100k": (10000, 10)}
+
+
+def setup(db_path: str, latency: float):
+    os.environ["CHAT_BACKEND"] = "fake"
+    os.environ["FAKE_LLM_LATENCY"] = str(latency)
+    os.environ.setdefault("DJANGO_SETTINGS_MODULE", "backend.settings")
+    import django
+    from django.apps import apps
+    from django.conf import settings
+    if not apps.ready:
+        django.setup()
+    from django.db import connections
+    connections.close_all()
+    settings.DATABASES["default"]["NAME"] = db_path
+    settings.ALLOWED_HOSTS = ["*"]
+    from conversations import ai, providers
+    ai.CHAT_BACKEND, providers.FAKE_LATENCY = "fake", latency
+    from django.core.management import call_command
+    call_command("migrate", verbosity=0)
+
+
+def pct(xs, p):
+    xs = sorted(xs)
+    return xs[min(len(xs) - 1, int(p / 100 * len(xs)))]
+
+
+def measure(fn, repeat: int, warmup: int = 2) -> dict:
+    """Call fn(i) `repeat` times; latency percentiles in ms and median DB queries per call."""
+    from django.db import connection
+    from django.test.utils import CaptureQueriesContext
+    for i in range(warmup):
+        fn(-1 - i)
+    times, counts = [], []
+    for i in range(repeat):
+        with CaptureQueriesContext(connection) as ctx:
+            t0 = time.perf_counter()
+            fn(i)
+            times.append((time.perf_counter() - t0) * 1000)
+        counts.append(len(ctx.captured_queries))
+    return {"n": repeat, "p50": pct(times, 50), "p95": pct(times, 95), "p99": pct(times, 99),
+            "queries": pct(counts, 50)}
+
+
+def scenarios(repeat: int):
+    from django.test import Client
+    from benchmarks.corpus import queries
+    from conversations.models import Conversation
+    from conversations.services import semantic_search
+
+    client = Client()
+    qs = queries(repeat + 10)
+    ended = list(Conversation.objects.filter(status="ended").values_list("id", flat=True)[:repeat + 10])
+    active = Conversation.objects.filter(status="active").first()
+
+    def post(url, body, status):
+        r = client.post(url, body, content_type="application/json")
+        assert r.status_code == status, (url, r.status_code, r.content[:200])
+
+    def get(url):
+        r = client.get(url)
+        assert r.status_code == 200, (url, r.status_code)
+
+    yield "semantic_search", lambda i: semantic_search(qs[i], k=8)
+    yield "query light", lambda i: post("/api/query/", {"query": qs[i], "analysis_depth": "light"}, 200)
+    yield "query deep", lambda i: post("/api/query/", {"query": qs[i], "analysis_depth": "deep"}, 200)
+    yield "list", lambda i: get("/api/conversations/")
+    yield "detail", lambda i: get(f"/api/conversations/{ended[i]}/")
+    yield "send_message", lambda i: post(f"/api/conversations/{active.id}/messages/",
+                                         {"role": "user", "content": f"benchmark turn {i}"}, 201)
+    yield "analytics daily", lambda i: get("/api/analytics/daily/")
+    yield "analytics tags", lambda i: get("/api/analytics/tags/")
+
+
+def run(scale: str, repeat: int, latency: float) -> dict:
+    from benchmarks.corpus import generate
+    setup(os.path.join(tempfile.mkdtemp(), f"bench-{scale}.sqlite3"), latency)
+    t0 = time.perf_counter()
+    generate(*SCALES[scale])
+    print(f"# {scale}: corpus built in {time.perf_counter() - t0:.1f}s", flush=True)
+    from conversations.analytics import rebuild
+    t0 = time.perf_counter()
+    rebuild()  # the corpus is bulk-created, which bypasses the live counters
+    print(f"# {scale}: analytics rebuilt in {time.perf_counter() - t0:.1f}s", flush=True)
+    return {name: measure(fn, repeat) for name, fn in scenarios(repeat)}
+
+
+def regressions(results: dict, baseline: dict, tolerance: float) -> list:
+    out = []
+    for scale, rows in results.items():
+        for name, r in rows.items():
+            b = baseline.get(scale, {}).get(name)
+            if b is None:
+                continue
+            if r["queries"] > b["queries"]:
+                out.append(f"{scale} {name}: {b['queries']} -> {r['queries']} queries")
+            if r["p95"] > b["p95"] * tolerance:
+                out.append(f"{scale} {name}: p95 {b['p95']:.2f} -> {r['p95']:.2f} ms")
+    return out
+
+
+if __name__ == "__main__":
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--scales", nargs="+", default=["1k", "10k"], choices=list(SCALES))
+    ap.add_argument("--repeat", type=int, default=30)
+    ap.add_argument("--latency", type=float, default=0.0, help="fake LLM seconds per call")
+    ap.add_argument("--json", help="write results here")
+    ap.add_argument("--baseline", help="compare against a previous --json file")
+    ap.add_argument("--tolerance", type=float, default=1.5)
+    args = ap.parse_args()
+
+    results = {}
+    print(f"{'scale':>6} {'scenario':<16} {'p50 ms':>9} {'p95 ms':>9} {'p99 ms':>9} {'queries':>8}")
+    for scale in args.scales:
+        results[scale] = run(scale, args.repeat, args.latency)
+        for name, r in results[scale].items():
+            print(f"{scale:>6} {name:<16} {r['p50']:>9.2f} {r['p95']:>9.2f} {r['p99']:>9.2f} {r['queries']:>8}")
+
+    if args.json:
+        Path(args.json).write_text(json.dumps(results, indent=2))
+    if args.baseline:
+        found = regressions(results, json.loads(Path(args.baseline).read_text()), args.tolerance)
+        for line in found:
+            print("REGRESSION", line)
+        sys.exit(1 if found else 0)
@@ -1,42 +1,320 @@
+import asyncio
+import functools
+import hashlib
+import inspect
 import os
-from typing import List, Dict, Union
-import numpy as np
-from google import generativeai as genai
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Iterator, List, Dict, Optional, Union
 
-genai.configure(api_key=os.getenv("GEMINI_API_KEY"))
+from . import metrics, providers, scheduler
+from .embed_batch import AsyncEmbedBatcher, EmbedBatcher
+from .providers import (  # noqa: F401  (re-exported settings)
+    CHAT_MODEL,
+    EMBED_DIM,
+    EMBED_MODEL,
+    LLM_BASE_URL,
+    LLM_MAX_CONCURRENCY,
+    LLM_TIMEOUT,
+    CircuitOpenError,
+    build_prompt as _build_prompt,
+    fake_embed as _fake_embed,
+)
+from .scheduler import BACKFILL, INTERACTIVE, SUMMARY, Overloaded  # noqa: F401
 
-CHAT_MODEL = "gemini-2.0-flash"
-EMBED_MODEL = "text-embedding-004"
+CHAT_BACKEND = os.getenv("CHAT_BACKEND", "gemini")  # "gemini" | "fake" | "http", see providers.py
 
-def gemini_chat(messages: List[Dict[str, str]]) -> str:
+LLM_CACHE_SIZE = int(os.getenv("LLM_CACHE_SIZE", "2048"))
+LLM_CACHE_TTL = float(os.getenv("LLM_CACHE_TTL", "3600"))
+LLM_CACHE_SHARED = os.getenv("LLM_CACHE_SHARED", "")  # Django cache alias, e.g. "default"
+
+
+def _provider() -> providers.Provider:
+    return providers.get(CHAT_BACKEND)
+
+# --- instrumentation ---------------------------------------------------------
+# The entry points below don't raise for a failed call: chat returns an
+# "(AI error: ...)" string and embed returns zero vectors. _error() counts
+# the exception, _observed() counts the degraded value it turned into.
+# A call that was never made raises scheduler.Overloaded instead: shed by
+# admission control, or the provider is out (circuit open, retries spent
+# on 429/5xx), so nothing gets stored in place of a reply.
+
+def _error(op: str, e: Exception) -> None:
+    metrics.LLM_ERRORS.inc(op=op, backend=CHAT_BACKEND, error=type(e).__name__)
+
+def _tokens(arg) -> int:
+    """Estimated tokens (chars / 4) of a message list, a text or a list of texts."""
+    if isinstance(arg, str):
+        return len(arg) // 4
+    return sum(len(m["content"]) if isinstance(m, dict) else len(m) for m in arg) // 4
+
+def _record(op: str, started: float, arg, result) -> None:
+    metrics.LLM_SECONDS.observe(time.perf_counter() - started, op=op, backend=CHAT_BACKEND)
+    if isinstance(result, str):  # chat: arg is the message list
+        metrics.LLM_TOKENS.inc(_tokens(arg), op=op, direction="in")
+        metrics.LLM_TOKENS.inc(_tokens(result), op=op, direction="out")
+        if result.startswith("(AI error:"):
+            metrics.LLM_FALLBACKS.inc(op=op, kind="error_text")
+        return
+    texts = [arg] if isinstance(arg, str) else arg
+    metrics.LLM_TOKENS.inc(_tokens(texts), op=op, direction="in")
+    metrics.EMBED_BATCH.observe(len(texts), op=op)
+    zeros = sum(1 for v in result if _is_zero(v))
+    if zeros:
+        metrics.LLM_FALLBACKS.inc(zeros, op=op, kind="zero_vector")
+
+def _unavailable(e: Exception) -> None:
+    """Raise Overloaded (503) for a provider that is down rather than for a bad request."""
+    if isinstance(e, CircuitOpenError):
+        raise Overloaded(str(e), providers.LLM_BREAKER_COOLDOWN, status=503) from e
+    if providers.retryable(e):
+        raise Overloaded(f"LLM backend unavailable: {e}", providers.backoff(providers.LLM_RETRIES, e),
+                         status=503) from e
+
+def _observed(op: str):
+    def deco(fn):
+        if asyncio.iscoroutinefunction(fn):
+            @functools.wraps(fn)
+            async def awrapper(arg, **kw):
+                started = time.perf_counter()
+                result = await fn(arg, **kw)
+                _record(op, started, arg, result)
+                return result
+            return awrapper
+        if inspect.isgeneratorfunction(fn):
+            @functools.wraps(fn)
+            def gwrapper(arg, **kw):
+                started, parts = time.perf_counter(), []
+                for chunk in fn(arg, **kw):
+                    parts.append(chunk)
+                    yield chunk
+                _record(op, started, arg, "".join(parts))
+            return gwrapper
+        @functools.wraps(fn)
+        def wrapper(arg, **kw):
+            started = time.perf_counter()
+            result = fn(arg, **kw)
+            _record(op, started, arg, result)
+            return result
+        return wrapper
+    return deco
+
+@_observed("chat")
+def gemini_chat(messages: List[Dict[str, str]], priority: int = INTERACTIVE) -> str:
+    scheduler.get().acquire(priority, _tokens(messages))
     try:
-        sys_text = "\n".join(m["content"] for m in messages if m["role"]=="system").strip()
-        lines = [f'{m["role"].upper()}: {m["content"]}' for m in messages if m["role"] in ("user","assistant")]
-        prompt = (f"SYSTEM:\n{sys_text}\n\n" if sys_text else "") + "\n".join(lines) + "\nASSISTANT:"
-        resp = genai.GenerativeModel(CHAT_MODEL).generate_content(prompt)
-        return (resp.text or "").strip()
+        reply = _provider().chat(messages)
     except Exception as e:
+        _error("chat", e)
+        _unavailable(e)
         return f"(AI error: {e})"
+    scheduler.get().charge(_tokens(reply))
+    return reply
+
+@_observed("chat_stream")
+def gemini_chat_stream(messages: List[Dict[str, str]], priority: int = INTERACTIVE) -> Iterator[str]:
+    """
+    Streaming counterpart of gemini_chat: yields text chunks as they arrive.
+    Admission and the request happen on the first next(), so a caller that
+    pulls the first chunk before responding can still answer Overloaded.
+    """
+    scheduler.get().acquire(priority, _tokens(messages))
+    out = 0
+    try:
+        for chunk in _provider().chat_stream(messages):
+            out += len(chunk)
+            yield chunk
+    except Exception as e:
+        _error("chat_stream", e)
+        if not out:
+            _unavailable(e)
+        yield f"(AI error: {e})"
+    scheduler.get().charge(out // 4)
 
-def gemini_embed(texts: Union[str, List[str]]) -> List[List[float]]:
+@_observed("embed")
+def gemini_embed(texts: Union[str, List[str]], priority: int = INTERACTIVE) -> List[List[float]]:
     if isinstance(texts, str):
         texts = [texts]
+    scheduler.get().acquire(priority, _tokens(texts))
     try:
-        res = genai.embed_content(model=EMBED_MODEL, content=texts)
-        if isinstance(res, dict) and "embedding" in res:   # single
-            return [res["embedding"]]
-        if isinstance(res, dict) and "embeddings" in res:  # batch
-            return [e.get("values", e) for e in res["embeddings"]]
-        return res  # best effort
-    except Exception:
-        return [[0.0]*768 for _ in texts]
-
-def cosine(a: List[float], b: List[float]) -> float:
-    va = np.array(a, dtype=float); vb = np.array(b, dtype=float)
-    denom = (np.linalg.norm(va)*np.linalg.norm(vb)) + 1e-9
-    return float(va @ vb / denom)
-
-def summarize_and_tag(text_dump: str) -> (str, list):
+        return _provider().embed(texts)
+    except Exception as e:
+        _error("embed", e)
+        _unavailable(e)
+        return [[0.0]*EMBED_DIM for _ in texts]
+
+
+# --- async path (ASGI views) ----------------------------------------------
+# the semaphore is bound to an event loop, so one is kept per running loop
+
+def _semaphore() -> asyncio.Semaphore:
+    return providers.per_loop("llm_semaphore", lambda: asyncio.Semaphore(LLM_MAX_CONCURRENCY))
+
+@_observed("chat")
+async def agemini_chat(messages: List[Dict[str, str]], priority: int = INTERACTIVE) -> str:
+    """Async gemini_chat; at most LLM_MAX_CONCURRENCY calls in flight per loop."""
+    await scheduler.get().aacquire(priority, _tokens(messages))
+    async with _semaphore():
+        try:
+            reply = await _provider().achat(messages)
+        except Exception as e:
+            _error("chat", e)
+            _unavailable(e)
+            return f"(AI error: {e})"
+    scheduler.get().charge(_tokens(reply))
+    return reply
+
+@_observed("embed")
+async def agemini_embed(texts: Union[str, List[str]], priority: int = INTERACTIVE) -> List[List[float]]:
+    if isinstance(texts, str):
+        texts = [texts]
+    await scheduler.get().aacquire(priority, _tokens(texts))
+    async with _semaphore():
+        try:
+            return await _provider().aembed(texts)
+        except Exception as e:
+            _error("embed", e)
+            _unavailable(e)
+            return [[0.0]*EMBED_DIM for _ in texts]
+
+# --- caching -----------------------------------------------------------------
+
+def content_digest(model: str, text: str) -> str:
+    """Content address of `text` as seen by `model`: whitespace collapsed, casefolded."""
+    normalized = " ".join(text.split()).casefold()
+    return hashlib.sha1(f"{model}\x00{normalized}".encode("utf-8")).hexdigest()
+
+class LLMCache:
+    """
+    In-process LRU with TTL, optionally backed by a shared Django cache
+    (LLM_CACHE_SHARED) so several workers see each other's entries.
+    invalidate() bumps a generation number that is part of every key.
+    """
+    def __init__(self, name: str, maxsize: int = LLM_CACHE_SIZE, ttl: float = LLM_CACHE_TTL,
+                 shared_alias: str = LLM_CACHE_SHARED):
+        self.name = name
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.shared_alias = shared_alias
+        self.hits = 0
+        self.misses = 0
+        self._local: "OrderedDict[str, tuple]" = OrderedDict()
+        self._lock = threading.Lock()
+        self._generation = 0
+
+    def _shared(self):
+        if not self.shared_alias:
+            return None
+        from django.core.cache import caches
+        return caches[self.shared_alias]
+
+    def _gen_key(self) -> str:
+        return f"llmcache:{self.name}:gen"
+
+    def generation(self) -> int:
+        shared = self._shared()
+        if shared is not None:
+            return shared.get_or_set(self._gen_key(), 0, timeout=None)
+        return self._generation
+
+    def key(self, model: str, text: str) -> str:
+        return f"llmcache:{self.name}:{self.generation()}:{content_digest(model, text)}"
+
+    def get(self, key: str) -> Optional[Any]:
+        now = time.monotonic()
+        with self._lock:
+            entry = self._local.get(key)
+            if entry is not None and entry[0] > now:
+                self._local.move_to_end(key)
+                self.hits += 1
+                return entry[1]
+            if entry is not None:
+                del self._local[key]
+        shared = self._shared()
+        value = shared.get(key) if shared is not None else None
+        with self._lock:
+            if value is None:
+                self.misses += 1
+                return None
+            self.hits += 1
+        self._set_local(key, value)
+        return value
+
+    def _set_local(self, key: str, value: Any) -> None:
+        with self._lock:
+            self._local[key] = (time.monotonic() + self.ttl, value)
+            self._local.move_to_end(key)
+            while len(self._local) > self.maxsize:
+                self._local.popitem(last=False)
+
+    def set(self, key: str, value: Any) -> None:
+        self._set_local(key, value)
+        shared = self._shared()
+        if shared is not None:
+            shared.set(key, value, timeout=self.ttl)
+
+    def invalidate(self) -> None:
+        with self._lock:
+            self._local.clear()
+            self._generation += 1
+        shared = self._shared()
+        if shared is not None:
+            try:
+                shared.incr(self._gen_key())
+            except ValueError:
+                shared.set(self._gen_key(), 1, timeout=None)
+
+    def stats(self) -> Dict[str, Any]:
+        total = self.hits + self.misses
+        return {"hits": self.hits, "misses": self.misses, "size": len(self._local),
+                "hit_rate": round(self.hits / total, 4) if total else 0.0}
+
+
+embedding_cache = LLMCache("embed")
+answer_cache = LLMCache("answer")
+
+def cache_stats() -> Dict[str, Dict[str, Any]]:
+    return {"embed": embedding_cache.stats(), "answer": answer_cache.stats()}
+
+def _cache_metrics():
+    for name, st in cache_stats().items():
+        yield "llm_cache_hits_total", "counter", "LLM cache hits.", {"cache": name}, st["hits"]
+        yield "llm_cache_misses_total", "counter", "LLM cache misses.", {"cache": name}, st["misses"]
+        yield "llm_cache_entries", "gauge", "Entries in the in-process LLM cache.", {"cache": name}, st["size"]
+
+metrics.register_collector(_cache_metrics)
+
+def _is_zero(vec: List[float]) -> bool:
+    return not any(vec)
+
+# concurrent query embeddings are sent as one batched call, see embed_batch.py
+_query_batcher = EmbedBatcher(lambda texts: gemini_embed(texts))
+
+def _async_query_batcher() -> AsyncEmbedBatcher:
+    return providers.per_loop("query_batcher", lambda: AsyncEmbedBatcher(agemini_embed))
+
+def embed_query(text: str) -> List[float]:
+    """gemini_embed for one query string, served from embedding_cache when possible."""
+    key = embedding_cache.key(EMBED_MODEL, text)
+    vec = embedding_cache.get(key)
+    if vec is None:
+        vec = _query_batcher.embed(text)
+        if not _is_zero(vec):  # don't pin the zero-vector fallback
+            embedding_cache.set(key, vec)
+    return vec
+
+async def aembed_query(text: str) -> List[float]:
+    key = embedding_cache.key(EMBED_MODEL, text)
+    vec = embedding_cache.get(key)
+    if vec is None:
+        vec = await _async_query_batcher().embed(text)
+        if not _is_zero(vec):
+            embedding_cache.set(key, vec)
+    return vec
+
+def _summary_prompt(text_dump: str) -> List[Dict[str, str]]:
     sys = {"role":"system","content":"You are a concise conversation analyst."}
     user = {"role":"user","content":(
         "Summarize the conversation in 5–8 bullet points.\n"
@@ -44,10 +322,12 @@ def summarize_and_tag(text_dump: str) -> (str, list):
         "Finally output a line exactly like: TAGS: tag1, tag2, tag3\n\n"
         f"Conversation:\n{text_dump}"
     )}
-    out = gemini_chat([sys, user])
+    return [sys, user]
+
+def _parse_tags(out: str) -> list:
     tags = []
     for line in out.splitlines()[::-1]:
         if line.strip().upper().startswith("TAGS:"):
             tags = [t.strip() for t in line.split(":",1)[1].split(",") if t.strip()]
             break
-    return out, tags
+    return tags
@@ -0,0 +1,233 @@
+"""
+Rollups behind the analytics endpoints.
+
+Aggregating over the raw tables would scan every message, and
+Conversation.tags is JSON that can't be indexed, so counters are kept
+instead:
+
+    DailyStats        per day: conversations started and ended, user and
+                      assistant messages, reply count and latency sum,
+                      message count and duration of the conversations
+                      ended that day
+    ConversationTag   Conversation.tags, one normalized row per tag
+    TagDaily          conversations ended per tag per day
+
+Counters are incremented as rows are written: conversations on post_save
+(signals.py), messages by the worker's message jobs, one write per day
+for the whole batch, and endings when the summarize job stores the tags
+(jobs.py), archives per imported batch (archive.py). Editing an ended
+conversation's tags moves its tag rows (record_retag). A reply's
+latency runs from the user message to the assistant message right after
+it. Counters are not decremented when rows are deleted;
+`manage.py rebuild_analytics` recomputes everything from history.
+
+Reads cover at most MAX_DAYS days of rollup rows, whatever the size of
+the corpus.
+"""
+from collections import Counter, defaultdict
+from contextlib import nullcontext
+from datetime import date, datetime, timedelta
+from typing import Dict, List, Optional, Tuple
+
+from django.db import IntegrityError, transaction
+from django.db.models import Count, F, Sum
+from django.utils import timezone
+
+from .models import Conversation, ConversationTag, DailyStats, Message, TagDaily
+
+MAX_DAYS = 366
+DEFAULT_DAYS = 30
+
+
+def normalize_tag(tag: str) -> str:
+    return " ".join(str(tag).split()).casefold()[:64]
+
+
+def _day(at: Optional[datetime]) -> date:
+    return timezone.localdate(at or timezone.now())
+
+
+def _tag_set(tags) -> set:
+    return {normalize_tag(t) for t in tags or []} - {""}
+
+
+class Rollup:
+    """Counter increments gathered in memory, then written one row per day (and tag)."""
+
+    def __init__(self):
+        self.daily: Dict[date, Counter] = defaultdict(Counter)
+        self.tags: Counter = Counter()  # (day, tag) -> conversations
+        self.conversation_tags: List[ConversationTag] = []
+
+    def started(self, at: datetime) -> None:
+        self.daily[_day(at)]["conversations_started"] += 1
+
+    def message(self, role: str, at: datetime, prev: Optional[Tuple[str, datetime]] = None) -> None:
+        """`prev` is (role, created_at) of the message before it in its conversation."""
+        day = self.daily[_day(at)]
+        day["user_messages" if role == "user" else "assistant_messages"] += 1
+        if role == "assistant" and prev and prev[0] == "user":
+            day["replies"] += 1
+            day["reply_seconds"] += max((at - prev[1]).total_seconds(), 0.0)
+
+    def ended(self, conv: Conversation, messages: int) -> None:
+        day = _day(conv.ended_at)
+        self.daily[day]["conversations_ended"] += 1
+        self.daily[day]["ended_messages"] += messages
+        if conv.ended_at and conv.started_at:
+            self.daily[day]["ended_seconds"] += max((conv.ended_at - conv.started_at).total_seconds(), 0.0)
+        for tag in _tag_set(conv.tags):
+            self.tags[(day, tag)] += 1
+            self.conversation_tags.append(ConversationTag(conversation=conv, tag=tag))
+
+    def apply(self) -> None:
+        """Add the gathered increments to the stored counters."""
+        writes = len(self.daily) + len(self.tags) + bool(self.conversation_tags)
+        with transaction.atomic() if writes > 1 else nullcontext():  # a new conversation writes one row
+            for day, amounts in self.daily.items():
+                _increment(DailyStats, {"day": day}, amounts)
+            for (day, tag), n in self.tags.items():
+                _increment(TagDaily, {"day": day, "tag": tag}, {"conversations": n})
+            ConversationTag.objects.bulk_create(self.conversation_tags, ignore_conflicts=True)
+
+
+def _increment(model, key: dict, amounts: dict) -> None:
+    amounts = {f: v for f, v in amounts.items() if v}
+    if not amounts:
+        return
+    if model.objects.filter(**key).update(**{f: F(f) + v for f, v in amounts.items()}):
+        return
+    try:
+        with transaction.atomic():
+            model.objects.create(**key, **amounts)
+    except IntegrityError:  # another writer created the row first
+        model.objects.filter(**key).update(**{f: F(f) + v for f, v in amounts.items()})
+
+
+def record_conversation(conv: Conversation) -> None:
+    r = Rollup()
+    r.started(conv.started_at)
+    r.apply()
+
+
+def record_messages(messages: List[Message]) -> None:
+    r = Rollup()
+    for msg in messages:
+        prev = None
+        if msg.role == "assistant":
+            prev = (Message.objects.filter(conversation_id=msg.conversation_id, id__lt=msg.id)
+                    .order_by("-id").values_list("role", "created_at").first())
+        r.message(msg.role, msg.created_at, prev)
+    r.apply()
+
+
+def record_end(conv: Conversation) -> None:
+    """Count an ended conversation and its tags; called once, when the summary is stored."""
+    r = Rollup()
+    r.ended(conv, conv.messages.count())
+    r.apply()
+
+
+def record_retag(conv: Conversation, old_tags: list) -> None:
+    """Move an ended conversation's tag rows and per-day counts from `old_tags` to its current tags."""
+    if conv.status != "ended":  # not counted yet; the summarize job counts the tags it stores
+        return
+    old, new = _tag_set(old_tags), _tag_set(conv.tags)
+    if old == new:
+        return
+    day = _day(conv.ended_at)
+    with transaction.atomic():
+        if old - new:
+            ConversationTag.objects.filter(conversation=conv, tag__in=old - new).delete()
+            TagDaily.objects.filter(day=day, tag__in=old - new, conversations__gt=0).update(
+                conversations=F("conversations") - 1)
+            TagDaily.objects.filter(day=day, tag__in=old - new, conversations=0).delete()
+        ConversationTag.objects.bulk_create([ConversationTag(conversation=conv, tag=t) for t in new - old],
+                                            ignore_conflicts=True)
+        for tag in new - old:
+            _increment(TagDaily, {"day": day, "tag": tag}, {"conversations": 1})
+
+
+def rebuild(chunk_size: int = 2000) -> Dict[str, int]:
+    """Recompute every rollup from conversations and messages. Returns rows written."""
+    r = Rollup()
+    with transaction.atomic():
+        for model in (DailyStats, TagDaily, ConversationTag):
+            model.objects.all().delete()
+        for at in Conversation.objects.values_list("started_at", flat=True).iterator(chunk_size):
+            r.started(at)
+        prev = None
+        for cid, role, at in (Message.objects.order_by("conversation_id", "id")
+                              .values_list("conversation_id", "role", "created_at").iterator(chunk_size)):
+            r.message(role, at, prev[1:] if prev and prev[0] == cid else None)
+            prev = (cid, role, at)
+        tag_rows = 0
+        ended = (Conversation.objects.filter(status="ended").annotate(n=Count("messages"))
+                 .only("id", "started_at", "ended_at", "tags"))
+        for conv in ended.iterator(chunk_size):
+            r.ended(conv, conv.n)
+            if len(r.conversation_tags) >= chunk_size:
+                tag_rows += len(ConversationTag.objects.bulk_create(r.conversation_tags))
+                r.conversation_tags = []
+        tag_rows += len(ConversationTag.objects.bulk_create(r.conversation_tags))
+        DailyStats.objects.bulk_create([DailyStats(day=d, **a) for d, a in r.daily.items()], batch_size=chunk_size)
+        TagDaily.objects.bulk_create([TagDaily(day=d, tag=t, conversations=n) for (d, t), n in r.tags.items()],
+                                     batch_size=chunk_size)
+    return {"days": len(r.daily), "tag_days": len(r.tags), "conversation_tags": tag_rows}
+
+
+# --- reads -------------------------------------------------------------------
+
+def date_range(date_from: Optional[date] = None, date_to: Optional[date] = None) -> Tuple[date, date]:
+    """Defaults to the last DEFAULT_DAYS days; capped at MAX_DAYS."""
+    date_to = date_to or timezone.localdate()
+    date_from = date_from or date_to - timedelta(days=DEFAULT_DAYS - 1)
+    return max(date_from, date_to - timedelta(days=MAX_DAYS - 1)), date_to
+
+
+def _ratio(a: float, b: float) -> Optional[float]:
+    return round(a / b, 2) if b else None
+
+
+def daily(date_from: date, date_to: date) -> dict:
+    """Per-day counters and range totals with averages (one query)."""
+    fields = [f.name for f in DailyStats._meta.fields if f.name not in ("id", "day")]
+    rows = list(DailyStats.objects.filter(day__range=(date_from, date_to)).order_by("day").values("day", *fields))
+    totals = {f: sum(r[f] for r in rows) for f in fields}
+    days = [{
+        "day": r["day"],
+        "conversations_started": r["conversations_started"],
+        "conversations_ended": r["conversations_ended"],
+        "messages": r["user_messages"] + r["assistant_messages"],
+        "avg_reply_seconds": _ratio(r["reply_seconds"], r["replies"]),
+    } for r in rows]
+    return {
+        "date_from": date_from,
+        "date_to": date_to,
+        "days": days,
+        "totals": {
+            "conversations_started": totals["conversations_started"],
+            "conversations_ended": totals["conversations_ended"],
+            "user_messages": totals["user_messages"],
+            "assistant_messages": totals["assistant_messages"],
+            "avg_reply_seconds": _ratio(totals["reply_seconds"], totals["replies"]),
+            "avg_conversation_messages": _ratio(totals["ended_messages"], totals["conversations_ended"]),
+            "avg_conversation_minutes": _ratio(totals["ended_seconds"] / 60, totals["conversations_ended"]),
+        },
+    }
+
+
+def top_tags(date_from: date, date_to: date, limit: int = 10) -> dict:
+    """The `limit` most frequent tags in the range, each with its per-day counts (two queries)."""
+    in_range = TagDaily.objects.filter(day__range=(date_from, date_to))
+    top = list(in_range.values("tag").annotate(conversations=Sum("conversations"))
+               .order_by("-conversations", "tag")[:limit])
+    series = defaultdict(list)
+    for tag, day, n in (in_range.filter(tag__in=[t["tag"] for t in top])
+                        .order_by("day").values_list("tag", "day", "conversations")):
+        series[tag].append({"day": day, "conversations": n})
+    return {
+        "date_from": date_from,
+        "date_to": date_to,
+        "tags": [{**t, "days": series[t["tag"]]} for t in top],
+    }
@@ -4,3 +4,9 @@ from django.apps import AppConfig
 class ConversationsConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'conversations'
+
+    def ready(self):
+        from django.db.backends.signals import connection_created
+        from . import signals  # noqa: F401
+        from .metrics import install_db_wrapper
+        connection_created.connect(install_db_wrapper, dispatch_uid="conversations.metrics.db")
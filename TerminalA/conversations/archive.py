@@ -0,0 +1,221 @@
+"""
+Streaming NDJSON export/import of conversations, messages and embeddings.
+
+An archive is one JSON object per line, grouped by conversation:
+
+    {"type": "conversation", "id": 7, "title": ..., "started_at": ..., ...}
+    {"type": "message", "id": 91, "conversation": 7, "role": ..., "content": ..., "created_at": ...}
+    {"type": "embedding", "message": 91, "start": 0, "end": 120, "digest": ..., "dtype": "f4", "scale": 1.0, "vector": "<base64>"}
+
+Export reads three id-ordered iterators (chunked, server-side cursors
+where the backend has them) and merge-joins them, so it runs a constant
+number of queries and holds one chunk at a time. Import
+bulk_creates rows in batches, one transaction per batch, and remembers
+source ids only for the conversation being read, so memory does not grow
+with the archive. Analytics counters are added per batch. Conversations
+archived while "ending" get their summarize and embed jobs again. Imported rows get new ids; ids inside an archive are
+only used to link its records. Embeddings whose digest is already stored
+reuse the stored vector (see EmbeddingVector).
+"""
+import base64
+import json
+from typing import IO, Dict, Iterable, Iterator, List, Optional
+
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db import transaction
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+
+from . import analytics, keyword_index
+from .jobs import end_jobs
+from .ai import EMBED_MODEL, content_digest
+from .models import Conversation, EmbeddingVector, Job, Message, MessageEmbedding
+from .services import stored_vectors
+from .vector_index import get_index
+
+CHUNK_SIZE = 2000
+
+# meta keys that point at message ids of the source database
+_ID_BOUND_META = ("rolling_summary", "summary_windows")
+
+_END = object()
+
+
+def _merge(head: Iterator, key_of, key) -> Iterator:
+    """Yield items of a sorted iterator while key_of(item) == key; `head` is [iterator, peeked]."""
+    it, peeked = head
+    while peeked is not _END and key_of(peeked) == key:
+        yield peeked
+        peeked = next(it, _END)
+    head[1] = peeked
+
+
+def export_records(status: Optional[str] = None, embeddings: bool = True,
+                   chunk_size: int = CHUNK_SIZE) -> Iterator[dict]:
+    convs = Conversation.objects.order_by("id")
+    msgs = Message.objects.order_by("conversation_id", "id")
+    embs = MessageEmbedding.objects.order_by("message__conversation_id", "message_id", "start")
+    if status:
+        convs = convs.filter(status=status)
+        msgs = msgs.filter(conversation__status=status)
+        embs = embs.filter(message__conversation__status=status)
+
+    msg_it = msgs.values_list("id", "conversation_id", "role", "content", "created_at").iterator(chunk_size)
+    msg_head = [msg_it, next(msg_it, _END)]
+    emb_head = [iter(()), _END]
+    if embeddings:
+        emb_it = embs.values_list("message__conversation_id", "message_id", "start", "end", "vector__digest",
+                                  "vector__dtype", "vector__scale", "vector__vector").iterator(chunk_size)
+        emb_head = [emb_it, next(emb_it, _END)]
+
+    fields = ("id", "title", "started_at", "ended_at", "status", "summary", "tags", "meta")
+    for c in convs.values(*fields).iterator(chunk_size):
+        yield {"type": "conversation", **c}
+        for mid, cid, role, content, created_at in _merge(msg_head, lambda r: r[1], c["id"]):
+            yield {"type": "message", "id": mid, "conversation": cid, "role": role,
+                   "content": content, "created_at": created_at}
+        for _, mid, start, end, digest, dtype, scale, vector in _merge(emb_head, lambda r: r[0], c["id"]):
+            yield {"type": "embedding", "message": mid, "start": start, "end": end, "digest": digest,
+                   "dtype": dtype, "scale": scale, "vector": base64.b64encode(bytes(vector)).decode("ascii")}
+
+
+def export_ndjson(lines_per_chunk: int = 500, **filters) -> Iterator[str]:
+    """export_records as NDJSON text, a few hundred lines per yielded string."""
+    buf: List[str] = []
+    for rec in export_records(**filters):
+        buf.append(json.dumps(rec, cls=DjangoJSONEncoder, ensure_ascii=False))
+        if len(buf) >= lines_per_chunk:
+            yield "\n".join(buf) + "\n"
+            buf = []
+    if buf:
+        yield "\n".join(buf) + "\n"
+
+
+class ArchiveError(ValueError):
+    """Malformed or out-of-order archive."""
+
+
+class _Importer:
+    def __init__(self, batch_size: int):
+        self.batch_size = batch_size
+        self.convs: List[Conversation] = []
+        self.msgs: List[Message] = []
+        self.embs: List[MessageEmbedding] = []
+        self.vectors: Dict[str, EmbeddingVector] = {}  # digest -> unsaved vector of this batch
+        self.conv_by_src: Dict[int, Conversation] = {}  # current conversation only
+        self.msg_by_src: Dict[int, Message] = {}
+        self.rollup = analytics.Rollup()
+        self.current: Optional[Conversation] = None  # for analytics: its message count, last message
+        self.current_messages = 0
+        self.prev = None
+        self.counts = {"conversations": 0, "messages": 0, "embeddings": 0}
+
+    def add(self, rec: dict) -> None:
+        kind = rec.get("type")
+        if kind == "conversation":
+            self.finish_conversation()
+            self.conv_by_src.clear()
+            self.msg_by_src.clear()
+            meta = {k: v for k, v in (rec.get("meta") or {}).items() if k not in _ID_BOUND_META}
+            conv = Conversation(title=rec.get("title", ""), status=rec.get("status", "ended"),
+                                summary=rec.get("summary", ""), tags=rec.get("tags") or [], meta=meta,
+                                started_at=parse_datetime(rec["started_at"]) if rec.get("started_at") else None,
+                                ended_at=parse_datetime(rec["ended_at"]) if rec.get("ended_at") else None)
+            if conv.status == "ending" and conv.ended_at is None:
+                conv.ended_at = timezone.now()
+            self.conv_by_src[rec["id"]] = conv
+            self.convs.append(conv)
+            self.current = conv
+            self.rollup.started(conv.started_at)
+        elif kind == "message":
+            conv = self.conv_by_src.get(rec["conversation"])
+            if conv is None:
+                raise ArchiveError(f"message {rec.get('id')} precedes its conversation")
+            msg = Message(conversation=conv, role=rec["role"], content=rec["content"],
+                          created_at=parse_datetime(rec["created_at"]) if rec.get("created_at") else timezone.now())
+            self.msg_by_src[rec["id"]] = msg
+            self.msgs.append(msg)
+            self.rollup.message(msg.role, msg.created_at, self.prev)
+            self.prev = (msg.role, msg.created_at)
+            self.current_messages += 1
+        elif kind == "embedding":
+            msg = self.msg_by_src.get(rec["message"])
+            if msg is None:
+                raise ArchiveError(f"embedding for message {rec['message']} precedes the message")
+            digest = rec.get("digest") or content_digest(EMBED_MODEL, msg.content[rec["start"]:rec["end"]])
+            if digest not in self.vectors:
+                self.vectors[digest] = EmbeddingVector(digest=digest, dtype=rec["dtype"], scale=rec["scale"],
+                                                       vector=base64.b64decode(rec["vector"]))
+            self.embs.append(MessageEmbedding(message=msg, start=rec["start"], end=rec["end"],
+                                              vector=self.vectors[digest]))
+        else:
+            raise ArchiveError(f"unknown record type {kind!r}")
+        if len(self.convs) + len(self.msgs) + len(self.embs) >= self.batch_size:
+            self.flush()
+
+    def finish_conversation(self) -> None:
+        if self.current is not None and self.current.status == "ended":
+            self.rollup.ended(self.current, self.current_messages)
+        self.current, self.current_messages, self.prev = None, 0, None
+
+    def flush(self) -> None:
+        with transaction.atomic():
+            # auto_now_add overwrites started_at on insert; restore the archived one
+            started = [c.started_at for c in self.convs]
+            Conversation.objects.bulk_create(self.convs)
+            self._restore(self.convs, "started_at", started)
+            Job.objects.bulk_create(j for c in self.convs if c.status == "ending" for j in end_jobs(c))
+            Message.objects.bulk_create(self.msgs)
+            keyword_index.index_messages(self.msgs)
+            # vectors already stored (or stored concurrently) keep their row
+            EmbeddingVector.objects.bulk_create(self.vectors.values(), ignore_conflicts=True)
+            stored = stored_vectors(self.vectors)
+            for me in self.embs:
+                me.vector = stored[me.vector.digest]
+            MessageEmbedding.objects.bulk_create(self.embs)
+            self.rollup.apply()
+        self.rollup = analytics.Rollup()
+        get_index().add(self.embs)
+        self.counts["conversations"] += len(self.convs)
+        self.counts["messages"] += len(self.msgs)
+        self.counts["embeddings"] += len(self.embs)
+        self.convs, self.msgs, self.embs, self.vectors = [], [], [], {}
+
+    @staticmethod
+    def _restore(objs, field: str, values) -> None:
+        changed = []
+        for obj, value in zip(objs, values):
+            if value is not None:
+                setattr(obj, field, value)
+                changed.append(obj)
+        if changed:
+            type(objs[0]).objects.bulk_update(changed, [field])
+
+
+def import_ndjson(lines: Iterable, batch_size: int = CHUNK_SIZE) -> Dict[str, int]:
+    """Import an archive from an iterable of NDJSON lines (str or bytes). Returns row counts."""
+    importer = _Importer(batch_size)
+    for n, line in enumerate(lines, 1):
+        if not line.strip():
+            continue
+        try:
+            rec = json.loads(line)
+        except ValueError as e:
+            raise ArchiveError(f"line {n}: {e}") from None
+        try:
+            importer.add(rec)
+        except ArchiveError as e:
+            raise ArchiveError(f"line {n}: {e}") from None
+        except (KeyError, TypeError, ValueError) as e:
+            raise ArchiveError(f"line {n}: {type(e).__name__}: {e}") from None
+    importer.finish_conversation()
+    importer.flush()
+    return importer.counts
+
+
+def copy_to(out: IO[str], **filters) -> int:
+    written = 0
+    for chunk in export_ndjson(**filters):
+        out.write(chunk)
+        written += chunk.count("\n")
+    return written
@@ -0,0 +1,125 @@
+"""
+Async counterparts of the LLM-bound endpoints, for ASGI deployments.
+
+While a reply is being generated the request is parked on the event loop
+instead of pinning a worker thread, so one process can keep hundreds of
+chats in flight. Outbound LLM concurrency is capped by ai.LLM_MAX_CONCURRENCY.
+
+    /api/async/conversations/{id}/messages/  POST user message + AI reply
+    /api/async/conversations/{id}/end/       POST finalize conversation; summary is queued
+    /api/async/query/                        POST search past conversations
+"""
+import json
+
+from asgiref.sync import sync_to_async
+from django.http import JsonResponse
+from django.utils import timezone
+from django.views.decorators.csrf import csrf_exempt
+from django.views.decorators.http import require_POST
+
+from .ai import agemini_chat
+from .context import abuild_llm_context
+from .jobs import enqueue_conversation_end
+from .models import Conversation, Message
+from .routing import replica_reads
+from .serializers import (
+    ConversationDetailSerializer,
+    MessageSerializer,
+    QuerySerializer,
+    SendMessageSerializer,
+)
+from . import retrieval
+from .services import aanswer_over_context
+from .views import SYSTEM_PROMPT
+
+
+def _body(request) -> dict:
+    try:
+        return json.loads(request.body or b"{}")
+    except ValueError:
+        return {}
+
+
+async def _get_conversation(pk):
+    try:
+        return await Conversation.objects.aget(pk=pk)
+    except Conversation.DoesNotExist:
+        return None
+
+
+@csrf_exempt
+@require_POST
+async def send_message(request, pk):
+    conv = await _get_conversation(pk)
+    if conv is None:
+        return JsonResponse({"detail": "No Conversation matches the given query."}, status=404)
+    if conv.status != "active":
+        return JsonResponse({"detail": "Conversation has ended."}, status=400)
+
+    msg_ser = SendMessageSerializer(data=_body(request))
+    if not msg_ser.is_valid():
+        return JsonResponse(msg_ser.errors, status=400)
+
+    # saved only once the reply was admitted (see views.ConversationViewSet._new_message)
+    user_msg = Message(
+        conversation=conv,
+        role=msg_ser.validated_data["role"],
+        content=msg_ser.validated_data["content"],
+        created_at=timezone.now(),
+    )
+
+    ai_msg = None
+    if user_msg.role == "user":
+        messages = await abuild_llm_context(conv, SYSTEM_PROMPT, pending=user_msg)
+        ai_text = await agemini_chat(messages) or "..."
+        await user_msg.asave()
+        ai_msg = await Message.objects.acreate(conversation=conv, role="assistant", content=ai_text)
+    else:
+        await user_msg.asave()
+
+    return JsonResponse(
+        {
+            "user_message": MessageSerializer(user_msg).data,
+            "assistant_message": MessageSerializer(ai_msg).data if ai_msg else None,
+        },
+        status=201,
+    )
+
+
+@csrf_exempt
+@require_POST
+async def end_conversation(request, pk):
+    conv = await _get_conversation(pk)
+    if conv is None:
+        return JsonResponse({"detail": "No Conversation matches the given query."}, status=404)
+    if conv.status != "active":
+        return JsonResponse({"detail": "Already ended."}, status=400)
+
+    await sync_to_async(enqueue_conversation_end)(conv)
+
+    data = await sync_to_async(lambda: ConversationDetailSerializer(conv).data)()
+    return JsonResponse(data, status=202)
+
+
+@csrf_exempt
+@require_POST
+async def query_past_conversations(request):
+    ser = QuerySerializer(data=_body(request))
+    if not ser.is_valid():
+        return JsonResponse(ser.errors, status=400)
+    q = ser.validated_data["query"].strip()
+
+    if not q:
+        return JsonResponse({"answer": "Please type something to search.", "excerpts": []})
+
+    # retrieval is DB + CPU work; only the optional answer step awaits the LLM
+    payload, context_text = await sync_to_async(replica_reads()(retrieval.retrieve))(
+        q,
+        analysis_depth=ser.validated_data["analysis_depth"],
+        date_from=ser.validated_data.get("date_from"),
+        date_to=ser.validated_data.get("date_to"),
+        keywords=ser.validated_data.get("keywords"),
+    )
+    if context_text is not None:
+        payload["answer"] = await aanswer_over_context(q, context_text)
+    return JsonResponse(payload)
@@ -0,0 +1,66 @@
+"""
+Split message text into overlapping chunks for embedding.
+
+Chunks end on paragraph or sentence boundaries, stay under MAX_CHARS, and
+repeat up to OVERLAP_CHARS of trailing sentences at the start of the next
+chunk. Each chunk is returned as (start, end) offsets into the source text.
+"""
+import os
+import re
+from typing import List, Tuple
+
+MAX_CHARS = int(os.getenv("EMBED_CHUNK_CHARS", "800"))
+OVERLAP_CHARS = int(os.getenv("EMBED_CHUNK_OVERLAP", "150"))
+
+Span = Tuple[int, int]
+
+# a sentence ends at . ! ? (plus closing quotes/brackets) followed by space,
+# a paragraph at a blank line
+_BOUNDARY_RE = re.compile(r"(?<=[.!?])[\"')\]]*\s+|\n\s*\n")
+
+
+def _units(text: str, max_chars: int) -> List[Span]:
+    """Sentence/paragraph spans, whitespace-trimmed; oversize ones split at spaces."""
+    spans, pos = [], 0
+    for m in _BOUNDARY_RE.finditer(text):
+        spans.append((pos, m.start()))
+        pos = m.end()
+    spans.append((pos, len(text)))
+
+    out: List[Span] = []
+    for a, b in spans:
+        while a < b and text[a].isspace():
+            a += 1
+        while b > a and text[b - 1].isspace():
+            b -= 1
+        while b - a > max_chars:
+            cut = text.rfind(" ", a + 1, a + max_chars)
+            cut = cut if cut > a else a + max_chars
+            out.append((a, cut))
+            a = cut
+            while a < b and text[a].isspace():
+                a += 1
+        if b > a:
+            out.append((a, b))
+    return out
+
+
+def split_text(text: str, max_chars: int = MAX_CHARS, overlap: int = OVERLAP_CHARS) -> List[Span]:
+    if len(text) <= max_chars:
+        return [(0, len(text))]
+    units = _units(text, max_chars)
+    chunks: List[Span] = []
+    i = 0
+    while i < len(units):
+        start, j = units[i][0], i
+        while j + 1 < len(units) and units[j + 1][1] - start <= max_chars:
+            j += 1
+        end = units[j][1]
+        chunks.append((start, end))
+        if j + 1 >= len(units):
+            break
+        k = j + 1
+        while k - 1 > i and end - units[k - 1][0] <= overlap:
+            k -= 1
+        i = k
+    return chunks
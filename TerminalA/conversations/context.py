@@ -0,0 +1,110 @@
+"""
+Bounded LLM context for chat turns.
+
+A prompt is the system prompt, a rolling summary of older turns and the
+last RECENT_MESSAGES raw messages, trimmed to TOKEN_BUDGET. The summary is
+kept on Conversation.meta["rolling_summary"] as {"text", "upto_id"} and is
+extended only when at least FOLD_BATCH messages have fallen out of the
+recent window, so most turns touch just the recent rows and make no
+extra LLM call. Messages that have left the window but are not folded
+yet (fewer than FOLD_BATCH, or the fold call failed) are sent raw ahead
+of it, so no turn drops out of the prompt; while catching up on more
+than FOLD_MAX of them, only the oldest FOLD_MAX are read per turn.
+"""
+import os
+from typing import Callable, Dict, List, Optional, Tuple
+
+from asgiref.sync import sync_to_async
+
+from .ai import agemini_chat, gemini_chat
+from .metrics import timed
+from .models import Conversation, Message
+
+RECENT_MESSAGES = int(os.getenv("CONTEXT_RECENT_MESSAGES", "12"))
+TOKEN_BUDGET = int(os.getenv("CONTEXT_TOKEN_BUDGET", "3000"))
+FOLD_BATCH = int(os.getenv("CONTEXT_FOLD_BATCH", "6"))
+FOLD_MAX = 50  # messages folded per turn while catching up on old history
+CHARS_PER_TOKEN = 4
+
+Plan = Tuple[str, int, List[Message], List[Message]]
+
+
+def estimate_tokens(text: str) -> int:
+    return len(text) // CHARS_PER_TOKEN + 1
+
+
+def _load(conv: Conversation) -> Plan:
+    """(current summary, last id it covers, unfolded messages before the window, recent window)."""
+    state = (conv.meta or {}).get("rolling_summary") or {}
+    upto = state.get("upto_id", 0)
+    recent = list(conv.messages.order_by("-id")[:RECENT_MESSAGES])[::-1]
+    if not recent:
+        return state.get("text", ""), upto, [], []
+    unfolded = list(conv.messages.filter(id__gt=upto, id__lt=recent[0].id).order_by("id")[:FOLD_MAX])
+    return state.get("text", ""), upto, unfolded, recent
+
+
+def _fold_prompt(summary: str, to_fold: List[Message]) -> List[Dict[str, str]]:
+    turns = "\n".join(f"{m.role}: {m.content}" for m in to_fold)
+    return [
+        {"role": "system", "content": "You maintain a running summary of a chat. Keep facts, names, decisions and open questions."},
+        {"role": "user", "content": (
+            f"Current summary:\n{summary or '(none)'}\n\n"
+            f"New turns:\n{turns}\n\n"
+            "Write the updated summary in at most 200 words."
+        )},
+    ]
+
+
+def _save(conv: Conversation, text: str, upto_id: int) -> None:
+    conv.set_meta("rolling_summary", {"text": text, "upto_id": upto_id})
+
+
+def _fold(conv: Conversation, summary: str, upto: int, to_fold: List[Message], new_text: str) -> Tuple[str, int]:
+    """The summary and the last id it covers after folding `to_fold`."""
+    if new_text.startswith("(AI error:"):
+        return summary, upto  # keep the old summary; these rows go raw and are retried next turn
+    _save(conv, new_text.strip(), to_fold[-1].id)
+    return new_text.strip(), to_fold[-1].id
+
+
+def _assemble(system_prompt: str, summary: str, recent: List[Message]) -> List[Dict[str, str]]:
+    head = [{"role": "system", "content": system_prompt}]
+    if summary:
+        head.append({"role": "system", "content": f"Summary of the earlier conversation:\n{summary}"})
+    budget = TOKEN_BUDGET - sum(estimate_tokens(m["content"]) for m in head)
+
+    tail: List[Dict[str, str]] = []
+    for m in reversed(recent):
+        cost = estimate_tokens(m.content)
+        if cost > budget:
+            if not tail:  # always keep the latest turn, truncated from the front
+                keep = max(budget, 1) * CHARS_PER_TOKEN
+                tail.append({"role": m.role, "content": m.content[-keep:]})
+            break
+        tail.append({"role": m.role, "content": m.content})
+        budget -= cost
+    return head + tail[::-1]
+
+
+@timed("context")
+def build_llm_context(conv: Conversation, system_prompt: str,
+                      chat: Callable[[List[Dict[str, str]]], str] = gemini_chat,
+                      pending: Optional[Message] = None) -> List[Dict[str, str]]:
+    """`pending` is the turn being answered, not saved yet; it goes last."""
+    summary, upto, unfolded, recent = _load(conv)
+    if len(unfolded) >= FOLD_BATCH:
+        summary, upto = _fold(conv, summary, upto, unfolded, chat(_fold_prompt(summary, unfolded)))
+    window = [m for m in unfolded if m.id > upto] + recent
+    return _assemble(system_prompt, summary, window + [pending] if pending else window)
+
+
+@timed("context")
+async def abuild_llm_context(conv: Conversation, system_prompt: str,
+                             pending: Optional[Message] = None) -> List[Dict[str, str]]:
+    summary, upto, unfolded, recent = await sync_to_async(_load)(conv)
+    if len(unfolded) >= FOLD_BATCH:
+        new_text = await agemini_chat(_fold_prompt(summary, unfolded))
+        summary, upto = await sync_to_async(_fold)(conv, summary, upto, unfolded, new_text)
+    window = [m for m in unfolded if m.id > upto] + recent
+    return _assemble(system_prompt, summary, window + [pending] if pending else window)
@@ -0,0 +1,140 @@
+"""
+Micro-batching for single-text embedding calls.
+
+Concurrent searches each need one query vector. Instead of one embedding
+round-trip per request, a batcher holds texts for up to EMBED_BATCH_WINDOW_MS
+(or until EMBED_BATCH_MAX are queued), sends them as one batched call and
+hands each caller its vector. A text that is already queued or in flight
+is not sent twice; the second caller waits on the first caller's result.
+
+EmbedBatcher is for threads (WSGI workers): the first caller of a window
+waits and flushes, so no background thread is needed. AsyncEmbedBatcher
+does the same on one event loop with a timer.
+"""
+import asyncio
+import os
+import threading
+from concurrent.futures import Future
+from typing import Awaitable, Callable, Dict, List, Optional, Set
+
+from . import metrics
+
+EMBED_BATCH_WINDOW_MS = float(os.getenv("EMBED_BATCH_WINDOW_MS", "10"))  # 0 disables batching
+EMBED_BATCH_MAX = int(os.getenv("EMBED_BATCH_MAX", "64"))
+
+COALESCED = metrics.counter("embed_coalesced_total",
+                            "Embed requests served by an identical queued or in-flight text.", ("mode",))
+
+Vector = List[float]
+
+
+class EmbedBatcher:
+    def __init__(self, embed_many: Callable[[List[str]], List[Vector]],
+                 window_ms: float = EMBED_BATCH_WINDOW_MS, max_batch: int = EMBED_BATCH_MAX):
+        self.embed_many = embed_many
+        self.window = window_ms / 1000
+        self.max_batch = max_batch
+        self._lock = threading.Lock()
+        self._full = threading.Event()
+        self._pending: Dict[str, Future] = {}
+        self._inflight: Dict[str, Future] = {}
+
+    def embed(self, text: str) -> Vector:
+        if self.window <= 0:
+            return self.embed_many([text])[0]
+        with self._lock:
+            fut = self._pending.get(text) or self._inflight.get(text)
+            leader = False
+            if fut is not None:
+                COALESCED.inc(mode="sync")
+            else:
+                fut = self._pending[text] = Future()
+                leader = len(self._pending) == 1
+                if len(self._pending) >= self.max_batch:
+                    self._full.set()
+        if leader:
+            self._full.wait(self.window)
+            self._flush()
+        return fut.result()
+
+    def _flush(self) -> None:
+        with self._lock:
+            batch, self._pending = self._pending, {}
+            self._full.clear()
+            self._inflight.update(batch)
+        texts = list(batch)
+        try:
+            vecs = self.embed_many(texts)
+        except Exception as e:
+            for fut in batch.values():
+                fut.set_exception(e)
+        else:
+            for text, vec in zip(texts, vecs):
+                batch[text].set_result(vec)
+            for fut in batch.values():
+                if not fut.done():
+                    fut.set_exception(RuntimeError("embedding batch returned too few vectors"))
+        finally:
+            with self._lock:
+                for text in texts:
+                    self._inflight.pop(text, None)
+
+
+class AsyncEmbedBatcher:
+    """Loop-bound; create one per event loop."""
+
+    def __init__(self, embed_many: Callable[[List[str]], Awaitable[List[Vector]]],
+                 window_ms: float = EMBED_BATCH_WINDOW_MS, max_batch: int = EMBED_BATCH_MAX):
+        self.embed_many = embed_many
+        self.window = window_ms / 1000
+        self.max_batch = max_batch
+        self._pending: Dict[str, asyncio.Future] = {}
+        self._inflight: Dict[str, asyncio.Future] = {}
+        self._timer: Optional[asyncio.TimerHandle] = None
+        self._tasks: Set[asyncio.Task] = set()
+
+    async def embed(self, text: str) -> Vector:
+        if self.window <= 0:
+            return (await self.embed_many([text]))[0]
+        fut = self._pending.get(text) or self._inflight.get(text)
+        if fut is not None:
+            COALESCED.inc(mode="async")
+        else:
+            loop = asyncio.get_running_loop()
+            fut = self._pending[text] = loop.create_future()
+            if len(self._pending) >= self.max_batch:
+                self._flush()
+            elif len(self._pending) == 1:
+                self._timer = loop.call_later(self.window, self._flush)
+        return await asyncio.shield(fut)  # a cancelled caller must not cancel the others
+
+    def _flush(self) -> None:
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+        batch, self._pending = self._pending, {}
+        if not batch:
+            return
+        self._inflight.update(batch)
+        task = asyncio.get_running_loop().create_task(self._run(batch))
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+
+    async def _run(self, batch: Dict[str, asyncio.Future]) -> None:
+        texts = list(batch)
+        try:
+            vecs = await self.embed_many(texts)
+        except Exception as e:
+            for fut in batch.values():
+                if not fut.done():
+                    fut.set_exception(e)
+        else:
+            for text, vec in zip(texts, vecs):
+                if not batch[text].done():
+                    batch[text].set_result(vec)
+            for fut in batch.values():
+                if not fut.done():
+                    fut.set_exception(RuntimeError("embedding batch returned too few vectors"))
+        finally:
+            for text in texts:
+                self._inflight.pop(text, None)
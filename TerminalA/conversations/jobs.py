@@ -0,0 +1,221 @@
+"""
+DB-backed background jobs.
+
+Ending a conversation only flips it to "ending" and enqueues work; a
+`manage.py run_jobs` worker claims queued jobs in batches and runs them:
+
+    message    keyword postings and analytics counters for new messages,
+               and a window job once a full window is unsummarized; all
+               message jobs in a batch share one write per counter row;
+               they are deleted once done, one is queued per message
+    window     partial summaries of full message windows while a
+               conversation is active (see summaries.py)
+    summarize  summary + tags for one conversation from its cached
+               windows, then status -> "ended" (counted in analytics); if
+               it fails for good the conversation still ends, with an
+               empty summary and the error in meta["summary_error"]
+    embed      embeddings for a conversation's messages; all embed jobs in
+               a batch are embedded together
+
+Failures are retried with exponential backoff up to Job.max_attempts.
+A job whose LLM calls were shed (scheduler.Overloaded) is put back for
+its Retry-After without spending an attempt.
+"""
+import logging
+import os
+from datetime import timedelta
+from typing import Callable, Dict, List
+
+from django.db import transaction
+from django.db.models import F, Q
+from django.utils import timezone
+
+from . import analytics
+from .ai import Overloaded, answer_cache
+from .keyword_index import index_messages
+from .models import Conversation, Job, Message
+from .services import embed_conversations
+from .summaries import has_full_window, summarize_conversation, summarize_windows
+
+logger = logging.getLogger(__name__)
+
+RETRY_BASE_SECONDS = float(os.getenv("JOB_RETRY_BASE_SECONDS", "2"))
+RETRY_MAX_SECONDS = float(os.getenv("JOB_RETRY_MAX_SECONDS", "300"))
+LEASE_SECONDS = float(os.getenv("JOB_LEASE_SECONDS", "600"))  # reclaim jobs from crashed workers
+DEFER_SECONDS = 2.0
+
+
+class JobError(Exception):
+    """Raised by a handler when the job should be retried."""
+
+
+def end_jobs(conv: Conversation) -> List[Job]:
+    """The unsaved jobs that take an "ending" conversation to "ended"."""
+    return [Job(kind="summarize", conversation=conv), Job(kind="embed", conversation=conv)]
+
+
+def enqueue_conversation_end(conv: Conversation) -> None:
+    with transaction.atomic():
+        conv.status = "ending"
+        conv.ended_at = timezone.now()
+        conv.save(update_fields=["status", "ended_at"])
+        Job.objects.bulk_create(end_jobs(conv))
+
+
+def enqueue_window_summary(conv: Conversation) -> bool:
+    """Queue a window job once a full window of messages is unsummarized."""
+    if conv.status != "active" or not has_full_window(conv):
+        return False
+    if Job.objects.filter(kind="window", conversation=conv, status__in=("queued", "running")).exists():
+        return False
+    Job.objects.create(kind="window", conversation=conv)
+    return True
+
+
+def claim(batch_size: int) -> List[Job]:
+    now = timezone.now()
+    ready = Q(status="queued", run_after__lte=now) | Q(
+        status="running", locked_at__lt=now - timedelta(seconds=LEASE_SECONDS)
+    )
+    with transaction.atomic():
+        ids = list(
+            Job.objects.select_for_update(skip_locked=True)
+            .filter(ready)
+            .order_by("run_after", "id")
+            .values_list("id", flat=True)[:batch_size]
+        )
+        Job.objects.filter(id__in=ids).update(
+            status="running", locked_at=now, attempts=F("attempts") + 1
+        )
+    return list(Job.objects.filter(id__in=ids).select_related("conversation").order_by("id"))
+
+
+def _done(jobs: List[Job]) -> None:
+    Job.objects.filter(id__in=[j.id for j in jobs]).update(
+        status="done", locked_at=None, last_error=""
+    )
+
+
+def _defer(jobs: List[Job], delay: float = DEFER_SECONDS) -> None:
+    """Put jobs back without spending an attempt (a prerequisite isn't ready, or the LLM is busy)."""
+    Job.objects.filter(id__in=[j.id for j in jobs]).update(
+        status="queued", locked_at=None, attempts=F("attempts") - 1,
+        run_after=timezone.now() + timedelta(seconds=delay),
+    )
+
+
+def _fail(jobs: List[Job], error: Exception) -> None:
+    now = timezone.now()
+    for job in jobs:
+        if job.attempts >= job.max_attempts:
+            job.status = "failed"
+        else:
+            job.status = "queued"
+            delay = min(RETRY_BASE_SECONDS * 2 ** (job.attempts - 1), RETRY_MAX_SECONDS)
+            job.run_after = now + timedelta(seconds=delay)
+        job.locked_at = None
+        job.last_error = f"{type(error).__name__}: {error}"
+        logger.warning("job %s attempt %s failed: %s", job, job.attempts, job.last_error)
+    Job.objects.bulk_update(jobs, ["status", "run_after", "locked_at", "last_error"])
+
+
+def run_message(jobs: List[Job]) -> None:
+    ids = [j.payload.get("message_id") for j in jobs]
+    messages = list(Message.objects.filter(id__in=ids).order_by("id"))  # deleted ones are skipped
+    try:
+        with transaction.atomic():  # a retry must not count or index twice
+            index_messages(messages)
+            analytics.record_messages(messages)
+            for conv in {j.conversation_id: j.conversation for j in jobs if j.conversation}.values():
+                enqueue_window_summary(conv)
+            Job.objects.filter(id__in=[j.id for j in jobs]).delete()  # not kept: as many as messages
+    except Exception as e:
+        _fail(jobs, e)
+
+
+def run_window(jobs: List[Job]) -> None:
+    for job in jobs:
+        try:
+            summarize_windows(job.conversation)
+        except Overloaded as e:
+            _defer([job], e.retry_after)
+        except Exception as e:
+            _fail([job], e)
+        else:
+            _done([job])
+
+
+def _end(conv: Conversation, summary: str, tags: list) -> None:
+    conv.summary = summary
+    conv.tags = tags
+    conv.status = "ended"
+    with transaction.atomic():
+        conv.save(update_fields=["summary", "tags", "status"])
+        analytics.record_end(conv)
+
+
+def run_summarize(jobs: List[Job]) -> None:
+    for job in jobs:
+        conv = job.conversation
+        try:
+            _end(conv, *summarize_conversation(conv))
+        except Overloaded as e:
+            _defer([job], e.retry_after)
+        except Exception as e:
+            with transaction.atomic():  # the embed job must not see a failed job and an "ending" conversation
+                _fail([job], e)
+                if job.status == "failed":
+                    conv.set_meta("summary_error", job.last_error)
+                    _end(conv, "", [])
+        else:
+            _done([job])
+            answer_cache.invalidate()
+
+
+def run_embed(jobs: List[Job]) -> None:
+    # re-read: a summarize job earlier in this batch may have just ended it
+    status = dict(Conversation.objects.filter(id__in=[j.conversation_id for j in jobs])
+                  .values_list("id", "status"))
+    ready = [j for j in jobs if status.get(j.conversation_id) == "ended"]
+    waiting = [j for j in jobs if status.get(j.conversation_id) != "ended"]
+    if waiting:
+        pending = set(
+            Job.objects.filter(kind="summarize", status__in=("queued", "running"),
+                               conversation_id__in=[j.conversation_id for j in waiting])
+            .values_list("conversation_id", flat=True)
+        )
+        _defer([j for j in waiting if j.conversation_id in pending])
+        orphaned = [j for j in waiting if j.conversation_id not in pending]
+        if orphaned:
+            _fail(orphaned, JobError("conversation has not been summarized"))
+    if not ready:
+        return
+    try:
+        embed_conversations([j.conversation_id for j in ready])
+    except Overloaded as e:
+        _defer(ready, e.retry_after)
+    except Exception as e:
+        _fail(ready, e)
+    else:
+        _done(ready)
+        answer_cache.invalidate()  # newly searchable context
+
+
+# Handlers run in this order within a batch, so a conversation summarized
+# in this batch can be embedded in the same batch.
+HANDLERS: Dict[str, Callable[[List[Job]], None]] = {
+    "message": run_message,
+    "window": run_window,
+    "summarize": run_summarize,
+    "embed": run_embed,
+}
+
+
+def run_batch(batch_size: int = 50) -> int:
+    """Claim and run up to batch_size jobs; returns how many were claimed."""
+    jobs = claim(batch_size)
+    for kind, handler in HANDLERS.items():
+        group = [j for j in jobs if j.kind == kind]
+        if group:
+            handler(group)
+    return len(jobs)
@@ -0,0 +1,120 @@
+"""
+Persisted inverted index over message text, scored with BM25.
+
+Postings are written by the worker's message jobs (see jobs.py) or in
+bulk via index_messages(); a query only reads the postings of its own terms.
+"""
+import math
+import re
+from collections import Counter, defaultdict
+from datetime import date
+from typing import Dict, Iterable, List, Optional, Tuple
+
+from django.db import transaction
+from django.db.models import F
+
+from .models import KeywordIndexStats, Message, Posting
+
+K1 = 1.2
+B = 0.75
+MAX_TERM_LEN = 64
+
+_TOKEN_RE = re.compile(r"\w+", re.UNICODE)
+
+
+def tokenize(text: str) -> List[str]:
+    return [t for t in _TOKEN_RE.findall((text or "").lower()) if len(t) <= MAX_TERM_LEN]
+
+
+def _stats() -> KeywordIndexStats:
+    stats, _ = KeywordIndexStats.objects.get_or_create(pk=1)
+    return stats
+
+
+def index_messages(messages: Iterable[Message]) -> int:
+    """Write postings for messages that have none yet. Returns postings written."""
+    messages = [m for m in messages if tokenize(m.content)]
+    if not messages:
+        return 0
+    with transaction.atomic():
+        KeywordIndexStats.objects.select_for_update().get_or_create(pk=1)  # one writer at a time
+        indexed = set(Posting.objects.filter(message_id__in=[m.id for m in messages])
+                      .values_list("message_id", flat=True).distinct())
+        rows, docs, total = [], 0, 0
+        for m in messages:
+            if m.id in indexed:
+                continue
+            tokens = tokenize(m.content)
+            docs += 1
+            total += len(tokens)
+            rows += [Posting(term=t, message_id=m.id, tf=tf, doc_len=len(tokens))
+                     for t, tf in Counter(tokens).items()]
+        if not docs:
+            return 0
+        Posting.objects.bulk_create(rows, batch_size=1000)
+        KeywordIndexStats.objects.filter(pk=1).update(
+            doc_count=F("doc_count") + docs, total_terms=F("total_terms") + total
+        )
+    return len(rows)
+
+
+def rebuild(chunk_size: int = 2000) -> int:
+    """Drop and rebuild the whole index from the Message table."""
+    with transaction.atomic():
+        Posting.objects.all().delete()
+        KeywordIndexStats.objects.update_or_create(pk=1, defaults={"doc_count": 0, "total_terms": 0})
+    written, batch = 0, []
+    for m in Message.objects.only("id", "content").order_by("id").iterator(chunk_size=chunk_size):
+        batch.append(m)
+        if len(batch) >= chunk_size:
+            written += index_messages(batch)
+            batch = []
+    return written + index_messages(batch)
+
+
+def _postings(terms: List[str], date_from: Optional[date], date_to: Optional[date]):
+    qs = Posting.objects.filter(term__in=terms)
+    if date_from:
+        qs = qs.filter(message__created_at__date__gte=date_from)
+    if date_to:
+        qs = qs.filter(message__created_at__date__lte=date_to)
+    return qs.values_list("term", "message_id", "tf", "doc_len")
+
+
+def search(query: str, limit: int = 10, date_from: Optional[date] = None,
+           date_to: Optional[date] = None, keywords: Optional[List[str]] = None) -> List[Tuple[float, int]]:
+    """
+    BM25 over message postings. Every token of `keywords` must occur in a
+    hit; `date_from`/`date_to` bound the message's creation date.
+    Returns [(score, message_id)] best first.
+    """
+    terms = list(dict.fromkeys(tokenize(query)))
+    required = list(dict.fromkeys(t for k in (keywords or []) for t in tokenize(k)))
+    if not terms and not required:
+        return []
+
+    stats = _stats()
+    n_docs = max(stats.doc_count, 1)
+    avgdl = stats.total_terms / n_docs or 1.0
+
+    by_term: Dict[str, List[Tuple[int, int, int]]] = defaultdict(list)
+    for term, mid, tf, dl in _postings(list(dict.fromkeys(terms + required)), date_from, date_to):
+        by_term[term].append((mid, tf, dl))
+
+    allowed = None
+    for t in required:
+        ids = {mid for mid, _, _ in by_term.get(t, ())}
+        allowed = ids if allowed is None else allowed & ids
+        if not allowed:
+            return []
+
+    scores: Dict[int, float] = defaultdict(float)
+    for t in terms or required:
+        postings = by_term.get(t, ())
+        idf = math.log(1 + (n_docs - len(postings) + 0.5) / (len(postings) + 0.5))
+        for mid, tf, dl in postings:
+            if allowed is not None and mid not in allowed:
+                continue
+            scores[mid] += idf * tf * (K1 + 1) / (tf + K1 * (1 - B + B * dl / avgdl))
+
+    return sorted(((s, mid) for mid, s in scores.items()), reverse=True)[:limit]
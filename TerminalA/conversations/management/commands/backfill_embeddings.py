@@ -0,0 +1,31 @@
+from django.core.management.base import BaseCommand
+
+from conversations.models import Checkpoint
+from conversations.services import EMBED_BATCH_SIZE, backfill_embeddings
+
+
+class Command(BaseCommand):
+    help = "Embed all unembedded messages of ended conversations, resumably."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--chunk-size", type=int, default=EMBED_BATCH_SIZE,
+                            help="Texts per embedding call.")
+        parser.add_argument("--workers", type=int, default=4,
+                            help="Embedding calls in flight at once.")
+        parser.add_argument("--checkpoint", default="embeddings",
+                            help="Checkpoint name to resume from.")
+        parser.add_argument("--reset", action="store_true",
+                            help="Start from the first message instead of the checkpoint.")
+
+    def handle(self, *args, chunk_size, workers, checkpoint, reset, **options):
+        if reset:
+            Checkpoint.objects.filter(name=checkpoint).delete()
+
+        def progress(written, seconds):
+            self.stdout.write(f"{written} embedded, {written / max(seconds, 1e-9):.1f} msg/s")
+
+        written, seconds = backfill_embeddings(chunk_size=chunk_size, workers=workers,
+                                               checkpoint=checkpoint, progress=progress)
+        self.stdout.write(self.style.SUCCESS(
+            f"done: {written} messages in {seconds:.1f}s ({written / max(seconds, 1e-9):.1f} msg/s)"
+        ))
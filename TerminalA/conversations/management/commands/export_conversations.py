@@ -0,0 +1,21 @@
+from django.core.management.base import BaseCommand
+
+from conversations.archive import copy_to
+
+
+class Command(BaseCommand):
+    help = "Stream conversations, messages and embeddings to an NDJSON archive."
+
+    def add_arguments(self, parser):
+        parser.add_argument("path", nargs="?", default="-", help="Output file, or - for stdout.")
+        parser.add_argument("--status", help="Only conversations with this status, e.g. ended.")
+        parser.add_argument("--no-embeddings", action="store_true", help="Leave out embedding rows.")
+
+    def handle(self, *args, path, status, no_embeddings, **options):
+        filters = {"status": status, "embeddings": not no_embeddings}
+        if path == "-":
+            copy_to(self.stdout, **filters)
+            return
+        with open(path, "w", encoding="utf-8") as out:
+            lines = copy_to(out, **filters)
+        self.stderr.write(self.style.SUCCESS(f"wrote {lines} lines to {path}"))
@@ -0,0 +1,27 @@
+import sys
+
+from django.core.management.base import BaseCommand, CommandError
+
+from conversations.archive import CHUNK_SIZE, ArchiveError, import_ndjson
+
+
+class Command(BaseCommand):
+    help = "Import an NDJSON archive written by export_conversations (rows get new ids)."
+
+    def add_arguments(self, parser):
+        parser.add_argument("path", nargs="?", default="-", help="Input file, or - for stdin.")
+        parser.add_argument("--batch-size", type=int, default=CHUNK_SIZE,
+                            help="Rows per bulk insert transaction.")
+
+    def handle(self, *args, path, batch_size, **options):
+        try:
+            if path == "-":
+                counts = import_ndjson(sys.stdin.buffer, batch_size=batch_size)
+            else:
+                with open(path, "rb") as f:
+                    counts = import_ndjson(f, batch_size=batch_size)
+        except ArchiveError as e:
+            raise CommandError(f"{path}: {e}")
+        self.stdout.write(self.style.SUCCESS(
+            ", ".join(f"{n} {kind}" for kind, n in counts.items()) + " imported"
+        ))
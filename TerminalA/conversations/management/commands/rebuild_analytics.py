@@ -0,0 +1,14 @@
+from django.core.management.base import BaseCommand
+
+from conversations.analytics import rebuild
+
+
+class Command(BaseCommand):
+    help = "Recompute the analytics rollups (daily counters, tags) from all conversations and messages."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--chunk-size", type=int, default=2000)
+
+    def handle(self, *args, chunk_size, **options):
+        counts = rebuild(chunk_size=chunk_size)
+        self.stdout.write(", ".join(f"{n} {name.replace('_', ' ')}" for name, n in counts.items()))
@@ -0,0 +1,14 @@
+from django.core.management.base import BaseCommand
+
+from conversations.keyword_index import rebuild
+
+
+class Command(BaseCommand):
+    help = "Rebuild the inverted keyword index from all stored messages."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--chunk-size", type=int, default=2000)
+
+    def handle(self, *args, chunk_size, **options):
+        n = rebuild(chunk_size=chunk_size)
+        self.stdout.write(f"wrote {n} postings")
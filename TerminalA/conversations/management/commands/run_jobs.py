@@ -0,0 +1,26 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from conversations.jobs import run_batch
+
+
+class Command(BaseCommand):
+    help = "Run the background job worker (conversation summaries and embeddings)."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--batch-size", type=int, default=50)
+        parser.add_argument("--idle-sleep", type=float, default=1.0,
+                            help="Seconds to wait when the queue is empty.")
+        parser.add_argument("--once", action="store_true",
+                            help="Drain the queue and exit instead of polling.")
+
+    def handle(self, *args, batch_size, idle_sleep, once, **options):
+        while True:
+            n = run_batch(batch_size)
+            if n:
+                self.stdout.write(f"processed {n} job(s)")
+                continue
+            if once:
+                return
+            time.sleep(idle_sleep)
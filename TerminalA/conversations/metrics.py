@@ -0,0 +1,292 @@
+"""
+Process-local metrics, exported in Prometheus text format at /api/metrics/.
+
+Requests are timed by MetricsMiddleware; every DB query goes through a
+connection execute wrapper (installed on connection_created, see apps.py)
+and is attributed to the request in flight via a context variable, so it
+also works for async views whose ORM calls run in worker threads.
+Functions are instrumented with @timed(stage); the LLM entry points in
+ai.py also record call latency, batch sizes and estimated tokens. LLM
+errors (the exception) and fallbacks (the degraded value handed back to
+the caller) are counted separately.
+"""
+import asyncio
+import contextvars
+import functools
+import inspect
+import threading
+import time
+from collections import defaultdict
+from typing import Callable, Dict, Iterable, List, Optional, Tuple
+
+LATENCY_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+SIZE_BUCKETS = (1, 2, 5, 10, 20, 50, 100, 200, 500, 1000)
+
+LabelValues = Tuple[str, ...]
+
+
+class _Metric:
+    kind = ""
+
+    def __init__(self, name: str, doc: str, labels: Iterable[str] = ()):
+        self.name = name
+        self.doc = doc
+        self.labels = tuple(labels)
+        self._lock = threading.Lock()
+
+    def _key(self, labels: Dict[str, str]) -> LabelValues:
+        return tuple(str(labels.get(l, "")) for l in self.labels)
+
+    def _fmt(self, key: LabelValues, extra: str = "") -> str:
+        pairs = [f"{l}={_quote(v)}" for l, v in zip(self.labels, key)]
+        if extra:
+            pairs.append(extra)
+        return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+class Counter(_Metric):
+    kind = "counter"
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self._values: Dict[LabelValues, float] = defaultdict(float)
+
+    def inc(self, amount: float = 1.0, **labels) -> None:
+        with self._lock:
+            self._values[self._key(labels)] += amount
+
+    def value(self, **labels) -> float:
+        return self._values.get(self._key(labels), 0.0)
+
+    def samples(self) -> List[str]:
+        with self._lock:
+            return [f"{self.name}{self._fmt(k)} {_num(v)}" for k, v in sorted(self._values.items())]
+
+
+class Histogram(_Metric):
+    kind = "histogram"
+
+    def __init__(self, name: str, doc: str, labels: Iterable[str] = (), buckets=LATENCY_BUCKETS):
+        super().__init__(name, doc, labels)
+        self.buckets = tuple(buckets)
+        self._counts: Dict[LabelValues, List[int]] = {}
+        self._sums: Dict[LabelValues, float] = defaultdict(float)
+
+    def observe(self, value: float, **labels) -> None:
+        key = self._key(labels)
+        with self._lock:
+            counts = self._counts.setdefault(key, [0] * (len(self.buckets) + 1))
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    counts[i] += 1
+                    break
+            else:
+                counts[-1] += 1
+            self._sums[key] += value
+
+    def count(self, **labels) -> int:
+        return sum(self._counts.get(self._key(labels), ()))
+
+    def samples(self) -> List[str]:
+        out = []
+        with self._lock:
+            for key, counts in sorted(self._counts.items()):
+                acc = 0
+                for bound, c in zip(self.buckets + (float("inf"),), counts):
+                    acc += c
+                    le = "+Inf" if bound == float("inf") else _num(bound)
+                    out.append(f"{self.name}_bucket{self._fmt(key, 'le=%s' % _quote(le))} {acc}")
+                out.append(f"{self.name}_sum{self._fmt(key)} {_num(self._sums[key])}")
+                out.append(f"{self.name}_count{self._fmt(key)} {acc}")
+        return out
+
+
+def _escape(v: str) -> str:
+    return v.replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _quote(v: str) -> str:
+    return '"' + _escape(v) + '"'
+
+
+def _num(v: float) -> str:
+    return str(int(v)) if float(v).is_integer() else repr(float(v))
+
+
+# --- registry ------------------------------------------------------------------
+
+_registry: Dict[str, _Metric] = {}
+_collectors: List[Callable[[], Iterable[Tuple[str, str, str, Dict[str, str], float]]]] = []
+
+
+def counter(name: str, doc: str, labels: Iterable[str] = ()) -> Counter:
+    return _registry.setdefault(name, Counter(name, doc, labels))
+
+
+def histogram(name: str, doc: str, labels: Iterable[str] = (), buckets=LATENCY_BUCKETS) -> Histogram:
+    return _registry.setdefault(name, Histogram(name, doc, labels, buckets))
+
+
+def register_collector(fn: Callable[[], Iterable[Tuple[str, str, str, Dict[str, str], float]]]) -> None:
+    """fn() yields (name, kind, doc, labels, value) read at scrape time, e.g. cache counters."""
+    _collectors.append(fn)
+
+
+def render() -> str:
+    lines = []
+    for m in sorted(_registry.values(), key=lambda m: m.name):
+        samples = m.samples()
+        if samples:
+            lines += [f"# HELP {m.name} {m.doc}", f"# TYPE {m.name} {m.kind}", *samples]
+    grouped: Dict[str, List] = defaultdict(list)
+    for fn in _collectors:
+        for name, kind, doc, labels, value in fn():
+            grouped[name].append((kind, doc, labels, value))
+    for name, rows in sorted(grouped.items()):
+        lines += [f"# HELP {name} {rows[0][1]}", f"# TYPE {name} {rows[0][0]}"]
+        for _, _, labels, value in rows:
+            pairs = ",".join(f"{k}={_quote(str(v))}" for k, v in labels.items())
+            lines.append(f"{name}{{{pairs}}} {_num(value)}" if pairs else f"{name} {_num(value)}")
+    return "\n".join(lines) + "\n"
+
+
+# --- metrics -------------------------------------------------------------------
+
+HTTP_SECONDS = histogram("http_request_duration_seconds", "Request latency.", ("method", "route", "status"))
+HTTP_DB_QUERIES = histogram("http_request_db_queries", "DB queries per request.", ("route",), SIZE_BUCKETS)
+HTTP_DB_SECONDS = histogram("http_request_db_seconds", "DB time per request.", ("route",))
+DB_QUERIES = counter("db_queries_total", "DB queries executed.", ("alias",))
+DB_SECONDS = counter("db_query_seconds_total", "Time spent in DB queries.", ("alias",))
+DB_ERRORS = counter("db_query_errors_total", "DB queries that raised.", ("alias",))
+STAGE_SECONDS = histogram("stage_duration_seconds", "Latency of instrumented functions.", ("stage",))
+STAGE_ERRORS = counter("stage_errors_total", "Exceptions raised by instrumented functions.", ("stage", "error"))
+LLM_SECONDS = histogram("llm_call_duration_seconds", "LLM/embedding call latency.", ("op", "backend"))
+LLM_ERRORS = counter("llm_errors_total", "LLM calls that raised.", ("op", "backend", "error"))
+LLM_FALLBACKS = counter("llm_fallbacks_total", "Degraded values returned instead of a real result.", ("op", "kind"))
+LLM_TOKENS = counter("llm_tokens_total", "Estimated tokens (chars / 4) sent to and received from the LLM.",
+                     ("op", "direction"))
+EMBED_BATCH = histogram("embed_batch_size", "Texts per embedding call.", ("op",), SIZE_BUCKETS)
+SEARCH_CANDIDATES = histogram("search_candidates", "Candidates per retrieval source.", ("source",), SIZE_BUCKETS)
+
+
+# --- instrumentation -------------------------------------------------------------
+
+_request_stats: contextvars.ContextVar[Optional[list]] = contextvars.ContextVar("request_db_stats", default=None)
+
+
+def db_execute_wrapper(alias: str):
+    def wrapper(execute, sql, params, many, context):
+        started = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        except Exception:
+            DB_ERRORS.inc(alias=alias)
+            raise
+        finally:
+            elapsed = time.perf_counter() - started
+            DB_QUERIES.inc(alias=alias)
+            DB_SECONDS.inc(elapsed, alias=alias)
+            stats = _request_stats.get()
+            if stats is not None:
+                stats[0] += 1
+                stats[1] += elapsed
+    return wrapper
+
+
+def install_db_wrapper(sender, connection, **kwargs) -> None:
+    """connection_created receiver: count and time every query on this connection."""
+    if not any(getattr(w, "_metrics", False) for w in connection.execute_wrappers):
+        wrapper = db_execute_wrapper(connection.alias)
+        wrapper._metrics = True
+        connection.execute_wrappers.append(wrapper)
+
+
+def timed(stage: str):
+    """Record the latency of a sync, async or generator function as stage_duration_seconds."""
+    def deco(fn):
+        def _done(started, error=None):
+            STAGE_SECONDS.observe(time.perf_counter() - started, stage=stage)
+            if error is not None:
+                STAGE_ERRORS.inc(stage=stage, error=type(error).__name__)
+
+        if asyncio.iscoroutinefunction(fn):
+            @functools.wraps(fn)
+            async def awrapper(*args, **kwargs):
+                started = time.perf_counter()
+                try:
+                    result = await fn(*args, **kwargs)
+                except Exception as e:
+                    _done(started, e)
+                    raise
+                _done(started)
+                return result
+            return awrapper
+
+        if inspect.isgeneratorfunction(fn):
+            @functools.wraps(fn)
+            def gwrapper(*args, **kwargs):
+                started = time.perf_counter()
+                try:
+                    yield from fn(*args, **kwargs)
+                except Exception as e:
+                    _done(started, e)
+                    raise
+                _done(started)
+            return gwrapper
+
+        @functools.wraps(fn)
+        def wrapper(*args, **kwargs):
+            started = time.perf_counter()
+            try:
+                result = fn(*args, **kwargs)
+            except Exception as e:
+                _done(started, e)
+                raise
+            _done(started)
+            return result
+        return wrapper
+    return deco
+
+
+class MetricsMiddleware:
+    """Per-request latency plus DB query count/time, labelled by URL route."""
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if asyncio.iscoroutinefunction(get_response):
+            from asgiref.sync import markcoroutinefunction
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if asyncio.iscoroutinefunction(self):
+            return self.__acall__(request)
+        stats, token, started = self._start()
+        try:
+            response = self.get_response(request)
+        finally:
+            _request_stats.reset(token)
+        self._finish(request, response, stats, started)
+        return response
+
+    async def __acall__(self, request):
+        stats, token, started = self._start()
+        try:
+            response = await self.get_response(request)
+        finally:
+            _request_stats.reset(token)
+        self._finish(request, response, stats, started)
+        return response
+
+    def _start(self):
+        stats = [0, 0.0]
+        return stats, _request_stats.set(stats), time.perf_counter()
+
+    def _finish(self, request, response, stats, started) -> None:
+        match = getattr(request, "resolver_match", None)
+        route = (match.view_name or match.route) if match else "unmatched"
+        HTTP_SECONDS.observe(time.perf_counter() - started, method=request.method, route=route,
+                             status=response.status_code)
+        HTTP_DB_QUERIES.observe(stats[0], route=route)
+        HTTP_DB_SECONDS.observe(stats[1], route=route)
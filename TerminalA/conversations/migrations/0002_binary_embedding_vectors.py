@@ -0,0 +1,101 @@
+import json
+
+import numpy as np
+from django.db import migrations, models
+
+BATCH = 1000
+
+# Frozen copies of conversations.vectors as of this migration, so later
+# changes to the codec can't change what it writes.
+DEFAULT_DTYPE = "f4"
+
+
+def encode_vector(values, dtype):
+    v = np.asarray(values, dtype=np.float32)
+    if dtype == "f4":
+        return v.astype("<f4", copy=False).tobytes(), 1.0
+    if dtype == "f2":
+        return v.astype("<f2").tobytes(), 1.0
+    peak = float(np.abs(v).max()) if v.size else 0.0
+    scale = peak / 127.0 if peak else 1.0
+    return np.clip(np.rint(v / scale), -127, 127).astype("i1").tobytes(), scale
+
+
+def decode_vector(blob, dtype, scale):
+    out = np.frombuffer(blob, dtype={"f4": "<f4", "f2": "<f2", "i1": "i1"}[dtype]).astype(np.float32)
+    if dtype == "i1":
+        out *= scale
+    return out
+
+
+def json_to_binary(apps, schema_editor):
+    MessageEmbedding = apps.get_model("conversations", "MessageEmbedding")
+    batch = []
+    for me in MessageEmbedding.objects.only("id", "vector").iterator(chunk_size=BATCH):
+        values = me.vector if isinstance(me.vector, list) else json.loads(me.vector)
+        me.vector_blob, me.scale = encode_vector(values, DEFAULT_DTYPE)
+        me.dtype = DEFAULT_DTYPE
+        batch.append(me)
+        if len(batch) >= BATCH:
+            MessageEmbedding.objects.bulk_update(batch, ["vector_blob", "dtype", "scale"])
+            batch = []
+    if batch:
+        MessageEmbedding.objects.bulk_update(batch, ["vector_blob", "dtype", "scale"])
+
+
+def binary_to_json(apps, schema_editor):
+    MessageEmbedding = apps.get_model("conversations", "MessageEmbedding")
+    batch = []
+    for me in MessageEmbedding.objects.only("id", "vector_blob", "dtype", "scale").iterator(chunk_size=BATCH):
+        me.vector = decode_vector(me.vector_blob, me.dtype, me.scale).tolist()
+        batch.append(me)
+        if len(batch) >= BATCH:
+            MessageEmbedding.objects.bulk_update(batch, ["vector"])
+            batch = []
+    if batch:
+        MessageEmbedding.objects.bulk_update(batch, ["vector"])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('conversations', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='messageembedding',
+            name='vector_blob',
+            field=models.BinaryField(null=True),
+        ),
+        migrations.AddField(
+            model_name='messageembedding',
+            name='dtype',
+            field=models.CharField(choices=[('f4', 'float32'), ('f2', 'float16'), ('i1', 'int8')], default='f4', max_length=2),
+        ),
+        migrations.AddField(
+            model_name='messageembedding',
+            name='scale',
+            field=models.FloatField(default=1.0),
+        ),
+        migrations.AlterField(
+            model_name='messageembedding',
+            name='vector',
+            field=models.JSONField(null=True),
+        ),
+        migrations.RunPython(json_to_binary, binary_to_json),
+        migrations.RemoveField(
+            model_name='messageembedding',
+            name='vector',
+        ),
+        migrations.RenameField(
+            model_name='messageembedding',
+            old_name='vector_blob',
+            new_name='vector',
+        ),
+        migrations.AlterField(
+            model_name='messageembedding',
+            name='vector',
+            field=models.BinaryField(),
+        ),
+    ]
@@ -0,0 +1,66 @@
+# Generated by Django 5.2.18 on 2026-10-18 03:15
+
+import re
+from collections import Counter
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+_TOKEN_RE = re.compile(r"\w+", re.UNICODE)
+
+
+def tokenize(text):
+    # frozen copy of conversations.keyword_index.tokenize as of this migration
+    return [t for t in _TOKEN_RE.findall((text or "").lower()) if len(t) <= 64]
+
+
+def index_existing_messages(apps, schema_editor):
+    Message = apps.get_model("conversations", "Message")
+    Posting = apps.get_model("conversations", "Posting")
+    KeywordIndexStats = apps.get_model("conversations", "KeywordIndexStats")
+    rows, docs, total = [], 0, 0
+    for m in Message.objects.only("id", "content").order_by("id").iterator(chunk_size=2000):
+        tokens = tokenize(m.content)
+        if not tokens:
+            continue
+        docs += 1
+        total += len(tokens)
+        rows += [Posting(term=t, message_id=m.id, tf=tf, doc_len=len(tokens))
+                 for t, tf in Counter(tokens).items()]
+        if len(rows) >= 5000:
+            Posting.objects.bulk_create(rows)
+            rows = []
+    Posting.objects.bulk_create(rows)
+    KeywordIndexStats.objects.create(pk=1, doc_count=docs, total_terms=total)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('conversations', '0003_jobs'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='KeywordIndexStats',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('doc_count', models.PositiveBigIntegerField(default=0)),
+                ('total_terms', models.PositiveBigIntegerField(default=0)),
+            ],
+        ),
+        migrations.CreateModel(
+            name='Posting',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('term', models.CharField(max_length=64)),
+                ('tf', models.PositiveIntegerField()),
+                ('doc_len', models.PositiveIntegerField()),
+                ('message', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='postings', to='conversations.message')),
+            ],
+            options={
+                'indexes': [models.Index(fields=['term', 'message'], name='conversatio_term_00f060_idx')],
+            },
+        ),
+        migrations.RunPython(index_existing_messages, migrations.RunPython.noop),
+    ]
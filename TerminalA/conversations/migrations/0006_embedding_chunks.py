@@ -0,0 +1,46 @@
+# Generated by Django 5.2.18 on 2026-10-18 03:20
+
+import django.db.models.deletion
+from django.db import migrations, models
+from django.db.models import OuterRef, Subquery
+from django.db.models.functions import Length
+
+
+def whole_message_spans(apps, schema_editor):
+    # existing rows embedded the full message text
+    Message = apps.get_model("conversations", "Message")
+    MessageEmbedding = apps.get_model("conversations", "MessageEmbedding")
+    MessageEmbedding.objects.update(end=Subquery(
+        Message.objects.filter(id=OuterRef("message_id"))
+        .annotate(n=Length("content")).values("n")[:1]
+    ))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('conversations', '0005_checkpoint'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='messageembedding',
+            name='end',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='messageembedding',
+            name='start',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.RunPython(whole_message_spans, migrations.RunPython.noop),
+        migrations.AlterField(
+            model_name='messageembedding',
+            name='message',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='embeddings', to='conversations.message'),
+        ),
+        migrations.AddConstraint(
+            model_name='messageembedding',
+            constraint=models.UniqueConstraint(fields=('message', 'start'), name='uniq_embedding_chunk'),
+        ),
+    ]
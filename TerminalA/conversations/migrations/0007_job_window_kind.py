@@ -0,0 +1,18 @@
+# Generated by Django 5.2.18 on 2026-10-18 03:31
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('conversations', '0006_embedding_chunks'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='job',
+            name='kind',
+            field=models.CharField(choices=[('window', 'window'), ('summarize', 'summarize'), ('embed', 'embed')], max_length=16),
+        ),
+    ]
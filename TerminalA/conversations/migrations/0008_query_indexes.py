@@ -0,0 +1,31 @@
+# Generated by Django 5.2.18 on 2026-10-18 03:37
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('conversations', '0007_job_window_kind'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='conversation',
+            index=models.Index(fields=['-started_at', '-id'], name='conv_started_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='conversation',
+            index=models.Index(fields=['status', 'started_at'], name='conv_status_started_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='message',
+            index=models.Index(fields=['conversation', 'created_at'], name='msg_conv_created_idx'),
+        ),
+        # without statistics SQLite drives "ended" joins from conv_status_started_idx
+        # (status is ~90% ended) and sorts; with them it keeps the id-ordered scan
+        migrations.RunSQL(
+            ["ANALYZE conversations_conversation", "ANALYZE conversations_message"],
+            migrations.RunSQL.noop,
+        ),
+    ]
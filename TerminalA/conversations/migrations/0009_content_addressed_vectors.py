@@ -0,0 +1,119 @@
+# Generated by Django 5.2.18 on 2026-10-18 04:30
+
+import hashlib
+import os
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+# frozen copies of conversations.providers.EMBED_MODEL and ai.content_digest as of this migration
+EMBED_MODEL = os.getenv("LLM_EMBED_MODEL", "text-embedding-004")
+
+
+def content_digest(model, text):
+    normalized = " ".join(text.split()).casefold()
+    return hashlib.sha1(f"{model}\x00{normalized}".encode("utf-8")).hexdigest()
+
+
+def share_vectors(apps, schema_editor):
+    # existing rows were embedded with the configured model; identical chunks
+    # collapse onto one EmbeddingVector
+    EmbeddingVector = apps.get_model("conversations", "EmbeddingVector")
+    MessageEmbedding = apps.get_model("conversations", "MessageEmbedding")
+    last_id = 0
+    while True:
+        rows = list(MessageEmbedding.objects.filter(id__gt=last_id).order_by("id")
+                    .select_related("message").only("id", "start", "end", "vector", "dtype", "scale",
+                                                    "message__content")[:2000])
+        if not rows:
+            break
+        digests = [content_digest(EMBED_MODEL, me.message.content[me.start:me.end]) for me in rows]
+        known = set(EmbeddingVector.objects.filter(digest__in=set(digests)).values_list("digest", flat=True))
+        fresh = {}
+        for d, me in zip(digests, rows):
+            if d not in known and d not in fresh:
+                fresh[d] = EmbeddingVector(digest=d, vector=me.vector, dtype=me.dtype, scale=me.scale)
+        EmbeddingVector.objects.bulk_create(fresh.values())
+        ids = dict(EmbeddingVector.objects.filter(digest__in=set(digests)).values_list("digest", "id"))
+        for d, me in zip(digests, rows):
+            me.shared_id = ids[d]
+        MessageEmbedding.objects.bulk_update(rows, ["shared"])
+        last_id = rows[-1].id
+
+
+def unshare_vectors(apps, schema_editor):
+    MessageEmbedding = apps.get_model("conversations", "MessageEmbedding")
+    last_id = 0
+    while True:
+        rows = list(MessageEmbedding.objects.filter(id__gt=last_id).order_by("id")
+                    .select_related("shared")[:2000])
+        if not rows:
+            break
+        for me in rows:
+            me.vector, me.dtype, me.scale = me.shared.vector, me.shared.dtype, me.shared.scale
+        MessageEmbedding.objects.bulk_update(rows, ["vector", "dtype", "scale"])
+        last_id = rows[-1].id
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('conversations', '0008_query_indexes'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='EmbeddingVector',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('digest', models.CharField(max_length=40, unique=True)),
+                ('vector', models.BinaryField()),
+                ('dtype', models.CharField(choices=[('f4', 'float32'), ('f2', 'float16'), ('i1', 'int8')], default='f4', max_length=2)),
+                ('scale', models.FloatField(default=1.0)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+            ],
+        ),
+        migrations.CreateModel(
+            name='ContentSummary',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('digest', models.CharField(max_length=40, unique=True)),
+                ('text', models.TextField()),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+            ],
+        ),
+        migrations.AddField(
+            model_name='messageembedding',
+            name='shared',
+            field=models.ForeignKey(null=True, on_delete=django.db.models.deletion.PROTECT, to='conversations.embeddingvector'),
+        ),
+        migrations.RunPython(share_vectors, unshare_vectors),
+        # a default only so that unapplying can re-add the column before unshare_vectors fills it
+        migrations.AlterField(
+            model_name='messageembedding',
+            name='vector',
+            field=models.BinaryField(default=b''),
+        ),
+        migrations.RemoveField(
+            model_name='messageembedding',
+            name='vector',
+        ),
+        migrations.RemoveField(
+            model_name='messageembedding',
+            name='dtype',
+        ),
+        migrations.RemoveField(
+            model_name='messageembedding',
+            name='scale',
+        ),
+        migrations.RenameField(
+            model_name='messageembedding',
+            old_name='shared',
+            new_name='vector',
+        ),
+        migrations.AlterField(
+            model_name='messageembedding',
+            name='vector',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.PROTECT, related_name='chunks', to='conversations.embeddingvector'),
+        ),
+    ]
@@ -0,0 +1,53 @@
+# Generated by Django 5.2.18 on 2026-10-18 04:30
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('conversations', '0009_content_addressed_vectors'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='DailyStats',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('day', models.DateField(unique=True)),
+                ('conversations_started', models.PositiveIntegerField(default=0)),
+                ('conversations_ended', models.PositiveIntegerField(default=0)),
+                ('user_messages', models.PositiveIntegerField(default=0)),
+                ('assistant_messages', models.PositiveIntegerField(default=0)),
+                ('replies', models.PositiveIntegerField(default=0)),
+                ('reply_seconds', models.FloatField(default=0)),
+                ('ended_messages', models.PositiveIntegerField(default=0)),
+                ('ended_seconds', models.FloatField(default=0)),
+            ],
+        ),
+        migrations.CreateModel(
+            name='TagDaily',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('day', models.DateField()),
+                ('tag', models.CharField(max_length=64)),
+                ('conversations', models.PositiveIntegerField(default=0)),
+            ],
+            options={
+                'constraints': [models.UniqueConstraint(fields=('day', 'tag'), name='uniq_tag_day')],
+            },
+        ),
+        migrations.CreateModel(
+            name='ConversationTag',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('tag', models.CharField(max_length=64)),
+                ('conversation', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='tag_rows', to='conversations.conversation')),
+            ],
+            options={
+                'indexes': [models.Index(fields=['tag', 'conversation'], name='tag_conv_idx')],
+                'constraints': [models.UniqueConstraint(fields=('conversation', 'tag'), name='uniq_conversation_tag')],
+            },
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 5.2.18 on 2026-10-18 04:51
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('conversations', '0011_message_created_at_default'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='job',
+            name='kind',
+            field=models.CharField(choices=[('message', 'message'), ('window', 'window'), ('summarize', 'summarize'), ('embed', 'embed')], max_length=16),
+        ),
+    ]
@@ -1,9 +1,14 @@
-from django.db import models
+import numpy as np
+from django.db import models, transaction
+from django.utils import timezone
+
+from .vectors import DEFAULT_DTYPE, DTYPE_CHOICES, decode_vector, encode_vector
 
 
 class Conversation(models.Model):
     """
-    A chat session. Starts 'active', becomes 'ended' when summarized.
+    A chat session. Starts 'active', moves to 'ending' when the user ends it
+    and becomes 'ended' once the background summary job has run.
     """
     title = models.CharField(max_length=160, blank=True)
     started_at = models.DateTimeField(auto_now_add=True)
@@ -13,9 +18,28 @@ class Conversation(models.Model):
     tags = models.JSONField(default=list, blank=True)          
     meta = models.JSONField(default=dict, blank=True)          
 
+    class Meta:
+        indexes = [
+            # list pagination: ORDER BY started_at DESC, id DESC
+            models.Index(fields=["-started_at", "-id"], name="conv_started_idx"),
+            models.Index(fields=["status", "started_at"], name="conv_status_started_idx"),
+        ]
+
     def __str__(self) -> str:
         return f"{self.id} • {self.title or 'Untitled'}"
 
+    def set_meta(self, key: str, value) -> None:
+        """
+        Set one meta key without clobbering keys written concurrently by
+        other processes (chat turns and background jobs both write meta).
+        """
+        with transaction.atomic():
+            meta = (Conversation.objects.select_for_update()
+                    .values_list("meta", flat=True).get(pk=self.pk)) or {}
+            meta[key] = value
+            Conversation.objects.filter(pk=self.pk).update(meta=meta)
+        self.meta = meta
+
 
 class Message(models.Model):
     """
@@ -28,15 +52,176 @@ class Message(models.Model):
     )
     role = models.CharField(max_length=16, choices=ROLE_CHOICES)
     content = models.TextField()
+    # not auto_now_add: a chat turn is saved only once its reply is admitted,
+    # with the time it was received
+    created_at = models.DateTimeField(default=timezone.now)
+
+    class Meta:
+        # transcript reads: WHERE conversation_id = ? ORDER BY created_at
+        indexes = [models.Index(fields=["conversation", "created_at"], name="msg_conv_created_idx")]
+
+
+class EmbeddingVector(models.Model):
+    """
+    One stored embedding, addressed by content: digest is
+    ai.content_digest(model, chunk text). Identical chunks ("thanks", "ok",
+    boilerplate) share a row instead of each being embedded and stored.
+    Stored as packed little-endian bytes; see conversations.vectors.
+    """
+    digest = models.CharField(max_length=40, unique=True)
+    vector = models.BinaryField()
+    dtype = models.CharField(max_length=2, choices=DTYPE_CHOICES, default="f4")
+    scale = models.FloatField(default=1.0)  # int8 dequantization factor
     created_at = models.DateTimeField(auto_now_add=True)
 
+    def set_vector(self, values, dtype: str = DEFAULT_DTYPE) -> None:
+        self.vector, self.scale = encode_vector(values, dtype)
+        self.dtype = dtype
+
+    def get_vector(self) -> np.ndarray:
+        return decode_vector(self.vector, self.dtype, self.scale)
+
 
 class MessageEmbedding(models.Model):
     """
-    Embedding vector for a message (for semantic search). Stored as JSON list[float].
+    One chunk of a message (for semantic search) and its shared vector.
+    [start, end) are character offsets into message.content; short messages
+    have a single chunk covering the whole text (see conversations.chunking).
     """
-    message = models.OneToOneField(
-        Message, on_delete=models.CASCADE, related_name="embedding"
+    message = models.ForeignKey(
+        Message, on_delete=models.CASCADE, related_name="embeddings"
     )
-    vector = models.JSONField()  # [0.123, -0.045, ...]
+    start = models.PositiveIntegerField(default=0)
+    end = models.PositiveIntegerField(default=0)
+    vector = models.ForeignKey(EmbeddingVector, on_delete=models.PROTECT, related_name="chunks")
     created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=["message", "start"], name="uniq_embedding_chunk"),
+        ]
+
+    @property
+    def text(self) -> str:
+        return self.message.content[self.start:self.end]
+
+    def get_vector(self) -> np.ndarray:
+        return self.vector.get_vector()
+
+
+class ContentSummary(models.Model):
+    """
+    LLM output for a summarization prompt, addressed like EmbeddingVector
+    (digest of the chat model and the normalized prompt), so identical
+    transcripts and summary windows are summarized once.
+    """
+    digest = models.CharField(max_length=40, unique=True)
+    text = models.TextField()
+    created_at = models.DateTimeField(auto_now_add=True)
+
+
+class DailyStats(models.Model):
+    """
+    Per-day counters behind the analytics endpoints (see
+    conversations.analytics). Sums rather than averages, so rows can be
+    incremented in place and added up over any range of days.
+    """
+    day = models.DateField(unique=True)
+    conversations_started = models.PositiveIntegerField(default=0)
+    conversations_ended = models.PositiveIntegerField(default=0)
+    user_messages = models.PositiveIntegerField(default=0)
+    assistant_messages = models.PositiveIntegerField(default=0)
+    replies = models.PositiveIntegerField(default=0)  # assistant messages answering a user message
+    reply_seconds = models.FloatField(default=0)
+    ended_messages = models.PositiveIntegerField(default=0)  # messages of the conversations ended that day
+    ended_seconds = models.FloatField(default=0)  # their total duration
+
+
+class ConversationTag(models.Model):
+    """
+    Conversation.tags, one normalized row per tag, so conversations can be
+    found by tag through an index instead of by scanning the JSON.
+    """
+    conversation = models.ForeignKey(Conversation, on_delete=models.CASCADE, related_name="tag_rows")
+    tag = models.CharField(max_length=64)
+
+    class Meta:
+        constraints = [models.UniqueConstraint(fields=["conversation", "tag"], name="uniq_conversation_tag")]
+        indexes = [models.Index(fields=["tag", "conversation"], name="tag_conv_idx")]
+
+
+class TagDaily(models.Model):
+    """
+    Conversations ended on `day` that carry `tag`.
+    """
+    day = models.DateField()
+    tag = models.CharField(max_length=64)
+    conversations = models.PositiveIntegerField(default=0)
+
+    class Meta:
+        constraints = [models.UniqueConstraint(fields=["day", "tag"], name="uniq_tag_day")]
+
+
+class Posting(models.Model):
+    """
+    Inverted keyword index entry: `term` occurs `tf` times in `message`.
+    doc_len (the message's token count) is denormalized for BM25.
+    """
+    term = models.CharField(max_length=64)
+    message = models.ForeignKey(Message, on_delete=models.CASCADE, related_name="postings")
+    tf = models.PositiveIntegerField()
+    doc_len = models.PositiveIntegerField()
+
+    class Meta:
+        indexes = [models.Index(fields=["term", "message"])]
+
+
+class KeywordIndexStats(models.Model):
+    """
+    Single row of corpus totals for BM25 (document count, total tokens).
+    """
+    doc_count = models.PositiveBigIntegerField(default=0)
+    total_terms = models.PositiveBigIntegerField(default=0)
+
+
+class Checkpoint(models.Model):
+    """
+    Named resume position for long-running batch commands (last processed id).
+    """
+    name = models.CharField(max_length=64, unique=True)
+    position = models.BigIntegerField(default=0)
+    updated_at = models.DateTimeField(auto_now=True)
+
+
+class Job(models.Model):
+    """
+    A unit of background work (see conversations.jobs), picked up by
+    `manage.py run_jobs`. Failed jobs are retried with backoff.
+    """
+    KIND_CHOICES = (("message", "message"), ("window", "window"), ("summarize", "summarize"), ("embed", "embed"))
+    STATUS_CHOICES = (
+        ("queued", "queued"),
+        ("running", "running"),
+        ("done", "done"),
+        ("failed", "failed"),
+    )
+
+    kind = models.CharField(max_length=16, choices=KIND_CHOICES)
+    conversation = models.ForeignKey(
+        Conversation, on_delete=models.CASCADE, related_name="jobs", null=True, blank=True
+    )
+    payload = models.JSONField(default=dict, blank=True)
+    status = models.CharField(max_length=16, choices=STATUS_CHOICES, default="queued")
+    attempts = models.PositiveIntegerField(default=0)
+    max_attempts = models.PositiveIntegerField(default=5)
+    run_after = models.DateTimeField(default=timezone.now)
+    locked_at = models.DateTimeField(null=True, blank=True)
+    last_error = models.TextField(blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        indexes = [models.Index(fields=["status", "run_after"])]
+
+    def __str__(self) -> str:
+        return f"{self.kind} #{self.id} ({self.status})"
@@ -0,0 +1,76 @@
+import base64
+from datetime import datetime
+
+from django.db.models import Q
+from rest_framework.exceptions import NotFound
+from rest_framework.pagination import BasePagination
+from rest_framework.response import Response
+from rest_framework.utils.urls import replace_query_param
+
+
+class StartedAtCursorPagination(BasePagination):
+    """
+    Keyset pagination over (-started_at, -id). The cursor is the last row's
+    (started_at, id), so each page is one indexed range scan no matter how
+    deep the client scrolls.
+    """
+    cursor_query_param = "cursor"
+    page_size_query_param = "page_size"
+    page_size = 25
+    max_page_size = 100
+
+    def _encode(self, obj) -> str:
+        raw = f"{obj.started_at.isoformat()}|{obj.id}"
+        return base64.urlsafe_b64encode(raw.encode()).decode()
+
+    def _decode(self, cursor: str):
+        try:
+            started_at, pk = base64.urlsafe_b64decode(cursor.encode()).decode().split("|")
+            return datetime.fromisoformat(started_at), int(pk)
+        except (ValueError, UnicodeDecodeError):
+            raise NotFound("Invalid cursor.")
+
+    def get_page_size(self, request) -> int:
+        try:
+            size = int(request.query_params.get(self.page_size_query_param, self.page_size))
+        except ValueError:
+            return self.page_size
+        return max(1, min(size, self.max_page_size))
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.request = request
+        size = self.get_page_size(request)
+        queryset = queryset.order_by("-started_at", "-id")
+        cursor = request.query_params.get(self.cursor_query_param)
+        if cursor:
+            started_at, pk = self._decode(cursor)
+            queryset = queryset.filter(Q(started_at__lt=started_at) | Q(started_at=started_at, id__lt=pk))
+        rows = list(queryset[: size + 1])
+        self.next_cursor = self._encode(rows[size - 1]) if len(rows) > size else None
+        return rows[:size]
+
+    def get_next_link(self):
+        if self.next_cursor is None:
+            return None
+        return replace_query_param(self.request.build_absolute_uri(), self.cursor_query_param, self.next_cursor)
+
+    def get_paginated_response(self, data):
+        return Response({"next": self.get_next_link(), "results": data})
+
+    def get_paginated_response_schema(self, schema):
+        return {
+            "type": "object",
+            "required": ["results"],
+            "properties": {
+                "next": {"type": "string", "nullable": True, "format": "uri"},
+                "results": schema,
+            },
+        }
+
+    def get_schema_operation_parameters(self, view):
+        return [
+            {"name": self.cursor_query_param, "required": False, "in": "query",
+             "schema": {"type": "string"}, "description": "Opaque cursor from the previous page's `next`."},
+            {"name": self.page_size_query_param, "required": False, "in": "query",
+             "schema": {"type": "integer"}, "description": f"Page size (max {self.max_page_size})."},
+        ]
@@ -0,0 +1,409 @@
+"""
+LLM providers behind conversations.ai.
+
+Each provider (gemini, http, fake) exposes chat / chat_stream / embed and
+async achat / aembed, and raises on failure; ai.py turns failures into
+its "(AI error" text and zero-vector fallbacks, or into
+scheduler.Overloaded when the backend is down. Shared behaviour:
+
+- clients are created on first use and reused: the Gemini SDK is only
+  imported and configured when a Gemini call is made, HTTP calls go
+  through one pooled requests.Session (sync) and one httpx.AsyncClient
+  per event loop (async);
+- every call has a timeout (LLM_CONNECT_TIMEOUT / LLM_TIMEOUT);
+- 429, 5xx, timeouts and connection errors are retried LLM_RETRIES
+  times with full-jitter exponential backoff, honouring Retry-After;
+- a per-provider circuit breaker opens after LLM_BREAKER_FAILURES
+  consecutive calls that still fail after retries, fails fast for
+  LLM_BREAKER_COOLDOWN seconds, then lets one trial call through.
+"""
+import asyncio
+import hashlib
+import os
+import random
+import threading
+import time
+import weakref
+from typing import Callable, Dict, Iterator, List, Optional
+
+import numpy as np
+
+from . import metrics
+
+CHAT_MODEL = os.getenv("LLM_CHAT_MODEL", "gemini-2.0-flash")
+EMBED_MODEL = os.getenv("LLM_EMBED_MODEL", "text-embedding-004")
+EMBED_DIM = 768
+FAKE_LATENCY = float(os.getenv("FAKE_LLM_LATENCY", "0"))  # seconds per fake chat/embed call
+
+# "http" talks to an OpenAI-compatible server (LM Studio, a local fake, ...)
+LLM_BASE_URL = os.getenv("LLM_BASE_URL", "http://127.0.0.1:1234/v1").rstrip("/")
+LLM_TIMEOUT = float(os.getenv("LLM_TIMEOUT", "60"))
+LLM_CONNECT_TIMEOUT = float(os.getenv("LLM_CONNECT_TIMEOUT", "5"))
+LLM_MAX_CONCURRENCY = int(os.getenv("LLM_MAX_CONCURRENCY", "64"))  # per process, async path
+LLM_RETRIES = int(os.getenv("LLM_RETRIES", "3"))
+LLM_BACKOFF_BASE = float(os.getenv("LLM_BACKOFF_BASE", "0.5"))
+LLM_BACKOFF_MAX = float(os.getenv("LLM_BACKOFF_MAX", "8"))
+LLM_BREAKER_FAILURES = int(os.getenv("LLM_BREAKER_FAILURES", "5"))
+LLM_BREAKER_COOLDOWN = float(os.getenv("LLM_BREAKER_COOLDOWN", "30"))
+
+Messages = List[Dict[str, str]]
+
+RETRIES = metrics.counter("llm_retries_total", "LLM calls retried after a transient error.", ("backend",))
+BREAKER_OPENED = metrics.counter("llm_circuit_opened_total", "Times a provider's circuit breaker opened.",
+                                 ("backend",))
+
+
+class CircuitOpenError(RuntimeError):
+    pass
+
+
+def _status(e: Exception) -> Optional[int]:
+    response = getattr(e, "response", None)
+    status = getattr(response, "status_code", None) or getattr(e, "code", None)
+    return status if isinstance(status, int) else None
+
+
+_TRANSIENT = {"TimeoutError", "ConnectionError", "Timeout", "TransportError"}
+
+
+def retryable(e: Exception) -> bool:
+    """429/5xx (requests, httpx, google.api_core) or a timeout/connection error."""
+    status = _status(e)
+    if status is not None:
+        return status == 429 or status >= 500
+    return any(c.__name__ in _TRANSIENT for c in type(e).__mro__)
+
+
+def backoff(attempt: int, e: Optional[Exception] = None) -> float:
+    delay = random.uniform(0, min(LLM_BACKOFF_MAX, LLM_BACKOFF_BASE * 2 ** attempt))
+    headers = getattr(getattr(e, "response", None), "headers", None) or {}
+    try:
+        return min(max(delay, float(headers.get("Retry-After", 0))), LLM_BACKOFF_MAX)
+    except (TypeError, ValueError):
+        return delay
+
+
+class CircuitBreaker:
+    def __init__(self, name: str, failures: int = LLM_BREAKER_FAILURES, cooldown: float = LLM_BREAKER_COOLDOWN):
+        self.name = name
+        self.failures = failures
+        self.cooldown = cooldown
+        self._lock = threading.Lock()
+        self._count = 0
+        self._opened_at: Optional[float] = None
+        self._trial = False
+
+    @property
+    def state(self) -> str:
+        if self._opened_at is None:
+            return "closed"
+        return "half-open" if time.monotonic() - self._opened_at >= self.cooldown else "open"
+
+    def before(self) -> None:
+        with self._lock:
+            if self._opened_at is None:
+                return
+            if time.monotonic() - self._opened_at < self.cooldown or self._trial:
+                raise CircuitOpenError(f"{self.name} circuit open")
+            self._trial = True  # half-open: this call decides
+
+    def success(self) -> None:
+        with self._lock:
+            self._count, self._opened_at, self._trial = 0, None, False
+
+    def failure(self) -> None:
+        with self._lock:
+            self._count += 1
+            if self._trial or (self._opened_at is None and self._count >= self.failures):
+                BREAKER_OPENED.inc(backend=self.name)
+                self._opened_at = time.monotonic()
+            self._trial = False
+
+
+_loop_state: "weakref.WeakKeyDictionary[asyncio.AbstractEventLoop, dict]" = weakref.WeakKeyDictionary()
+
+
+def per_loop(key: str, factory: Callable[[], object]):
+    """One `factory()` result per running event loop (asyncio primitives and clients are loop-bound)."""
+    state = _loop_state.setdefault(asyncio.get_running_loop(), {})
+    if key not in state:
+        state[key] = factory()
+    return state[key]
+
+
+class Provider:
+    name = ""
+
+    def __init__(self):
+        self.breaker = CircuitBreaker(self.name)
+
+    # subclasses implement these; they raise on failure
+    def _chat(self, messages: Messages) -> str:
+        raise NotImplementedError
+
+    def _stream(self, messages: Messages) -> Iterator[str]:
+        """Start a streamed reply; the request is made before this returns."""
+        return iter([self._chat(messages)])
+
+    def _embed(self, texts: List[str]) -> List[List[float]]:
+        raise NotImplementedError
+
+    async def _achat(self, messages: Messages) -> str:
+        return await asyncio.to_thread(self._chat, messages)
+
+    async def _aembed(self, texts: List[str]) -> List[List[float]]:
+        return await asyncio.to_thread(self._embed, texts)
+
+    # retry + breaker around them
+    def _call(self, fn, *args):
+        self.breaker.before()
+        for attempt in range(LLM_RETRIES + 1):
+            try:
+                result = fn(*args)
+            except Exception as e:
+                if not retryable(e):
+                    self.breaker.success()  # the service answered; the request was bad
+                    raise
+                if attempt < LLM_RETRIES:
+                    RETRIES.inc(backend=self.name)
+                    time.sleep(backoff(attempt, e))
+                    continue
+                self.breaker.failure()
+                raise
+            self.breaker.success()
+            return result
+
+    async def _acall(self, fn, *args):
+        self.breaker.before()
+        for attempt in range(LLM_RETRIES + 1):
+            try:
+                result = await fn(*args)
+            except Exception as e:
+                if not retryable(e):
+                    self.breaker.success()  # the service answered; the request was bad
+                    raise
+                if attempt < LLM_RETRIES:
+                    RETRIES.inc(backend=self.name)
+                    await asyncio.sleep(backoff(attempt, e))
+                    continue
+                self.breaker.failure()
+                raise
+            self.breaker.success()
+            return result
+
+    def chat(self, messages: Messages) -> str:
+        return self._call(self._chat, messages)
+
+    def chat_stream(self, messages: Messages) -> Iterator[str]:
+        # only the request is retried; a stream that breaks midway raises to the caller
+        yield from self._call(self._stream, messages)
+
+    def embed(self, texts: List[str]) -> List[List[float]]:
+        return self._call(self._embed, texts)
+
+    async def achat(self, messages: Messages) -> str:
+        return await self._acall(self._achat, messages)
+
+    async def aembed(self, texts: List[str]) -> List[List[float]]:
+        return await self._acall(self._aembed, texts)
+
+
+# --- gemini ----------------------------------------------------------------------
+
+def build_prompt(messages: Messages) -> str:
+    sys_text = "\n".join(m["content"] for m in messages if m["role"]=="system").strip()
+    lines = [f'{m["role"].upper()}: {m["content"]}' for m in messages if m["role"] in ("user","assistant")]
+    return (f"SYSTEM:\n{sys_text}\n\n" if sys_text else "") + "\n".join(lines) + "\nASSISTANT:"
+
+def parse_embed_response(res) -> List[List[float]]:
+    if isinstance(res, dict) and "embedding" in res:
+        emb = res["embedding"]
+        return emb if emb and isinstance(emb[0], list) else [emb]  # batch | single
+    if isinstance(res, dict) and "embeddings" in res:  # batch
+        return [e.get("values", e) for e in res["embeddings"]]
+    return res  # best effort
+
+
+class GeminiProvider(Provider):
+    name = "gemini"
+
+    def __init__(self):
+        super().__init__()
+        self._genai = None
+        self._model = None
+        self._lock = threading.Lock()
+
+    def _sdk(self):
+        if self._genai is None:
+            with self._lock:
+                if self._genai is None:
+                    from google import generativeai as genai
+                    genai.configure(api_key=os.getenv("GEMINI_API_KEY"))
+                    self._model = genai.GenerativeModel(CHAT_MODEL)
+                    self._genai = genai
+        return self._genai
+
+    @property
+    def _options(self) -> dict:
+        return {"timeout": LLM_TIMEOUT}
+
+    def _chat(self, messages: Messages) -> str:
+        self._sdk()
+        resp = self._model.generate_content(build_prompt(messages), request_options=self._options)
+        return (resp.text or "").strip()
+
+    def _stream(self, messages: Messages) -> Iterator[str]:
+        self._sdk()
+        resp = self._model.generate_content(build_prompt(messages), stream=True, request_options=self._options)
+        return (chunk.text for chunk in resp if chunk.text)
+
+    def _embed(self, texts: List[str]) -> List[List[float]]:
+        res = self._sdk().embed_content(model=EMBED_MODEL, content=texts, request_options=self._options)
+        return parse_embed_response(res)
+
+    async def _achat(self, messages: Messages) -> str:
+        self._sdk()
+        resp = await self._model.generate_content_async(build_prompt(messages), request_options=self._options)
+        return (resp.text or "").strip()
+
+    async def _aembed(self, texts: List[str]) -> List[List[float]]:
+        res = await self._sdk().embed_content_async(model=EMBED_MODEL, content=texts,
+                                                    request_options=self._options)
+        return parse_embed_response(res)
+
+
+# --- OpenAI-compatible HTTP --------------------------------------------------------
+
+class HttpProvider(Provider):
+    name = "http"
+
+    def __init__(self, base_url: str = LLM_BASE_URL):
+        super().__init__()
+        self.base_url = base_url
+        self._session = None
+        self._lock = threading.Lock()
+
+    def session(self):
+        if self._session is None:
+            with self._lock:
+                if self._session is None:
+                    import requests
+                    from requests.adapters import HTTPAdapter
+                    s = requests.Session()  # keep-alive across calls
+                    s.mount("http://", HTTPAdapter(pool_maxsize=LLM_MAX_CONCURRENCY))
+                    s.mount("https://", HTTPAdapter(pool_maxsize=LLM_MAX_CONCURRENCY))
+                    self._session = s
+        return self._session
+
+    def async_client(self):
+        def make():
+            import httpx
+            limits = httpx.Limits(max_connections=LLM_MAX_CONCURRENCY,
+                                  max_keepalive_connections=LLM_MAX_CONCURRENCY)
+            return httpx.AsyncClient(base_url=self.base_url, limits=limits,
+                                     timeout=httpx.Timeout(LLM_TIMEOUT, connect=LLM_CONNECT_TIMEOUT))
+        return per_loop(f"httpx:{self.base_url}", make)
+
+    def _post(self, path: str, payload: dict) -> dict:
+        r = self.session().post(f"{self.base_url}{path}", json=payload,
+                                timeout=(LLM_CONNECT_TIMEOUT, LLM_TIMEOUT))
+        r.raise_for_status()
+        return r.json()
+
+    async def _apost(self, path: str, payload: dict) -> dict:
+        r = await self.async_client().post(path, json=payload)
+        r.raise_for_status()
+        return r.json()
+
+    @staticmethod
+    def _text(data: dict) -> str:
+        return (data["choices"][0]["message"]["content"] or "").strip()
+
+    @staticmethod
+    def _vectors(data: dict) -> List[List[float]]:
+        return [d["embedding"] for d in sorted(data["data"], key=lambda d: d.get("index", 0))]
+
+    def _chat(self, messages: Messages) -> str:
+        return self._text(self._post("/chat/completions", {"model": CHAT_MODEL, "messages": messages}))
+
+    def _embed(self, texts: List[str]) -> List[List[float]]:
+        return self._vectors(self._post("/embeddings", {"model": EMBED_MODEL, "input": texts}))
+
+    async def _achat(self, messages: Messages) -> str:
+        return self._text(await self._apost("/chat/completions", {"model": CHAT_MODEL, "messages": messages}))
+
+    async def _aembed(self, texts: List[str]) -> List[List[float]]:
+        return self._vectors(await self._apost("/embeddings", {"model": EMBED_MODEL, "input": texts}))
+
+
+# --- offline fake --------------------------------------------------------------------
+
+def fake_embed(text: str) -> List[float]:
+    seed = int.from_bytes(hashlib.sha1(text.encode("utf-8")).digest()[:8], "little")
+    return np.random.default_rng(seed).standard_normal(EMBED_DIM).astype(np.float32).tolist()
+
+
+class FakeProvider(Provider):
+    """
+    Offline stand-in: echoes the last user turn back after FAKE_LATENCY
+    (streamed word by word, FAKE_CHAT_DELAY apart) and embeds text into
+    deterministic pseudo-random vectors.
+    """
+    name = "fake"
+
+    def __init__(self, delay: float = float(os.getenv("FAKE_CHAT_DELAY", "0"))):
+        super().__init__()
+        self.delay = delay
+
+    def _words(self, messages: Messages) -> List[str]:
+        last = ""
+        for line in build_prompt(messages).splitlines():
+            if line.startswith("USER: "):
+                last = line[len("USER: "):]
+        return f"You said: {last}".split(" ")
+
+    def _chat(self, messages: Messages) -> str:
+        words = self._words(messages)
+        time.sleep(FAKE_LATENCY + self.delay * len(words))
+        return " ".join(words)
+
+    def _stream(self, messages: Messages) -> Iterator[str]:
+        words = self._words(messages)
+        time.sleep(FAKE_LATENCY)
+
+        def chunks():
+            for i, w in enumerate(words):
+                time.sleep(self.delay)
+                yield w if i == 0 else " " + w
+        return chunks()
+
+    def _embed(self, texts: List[str]) -> List[List[float]]:
+        time.sleep(FAKE_LATENCY)
+        return [fake_embed(t) for t in texts]
+
+    async def _achat(self, messages: Messages) -> str:
+        words = self._words(messages)
+        await asyncio.sleep(FAKE_LATENCY + self.delay * len(words))
+        return " ".join(words)
+
+    async def _aembed(self, texts: List[str]) -> List[List[float]]:
+        await asyncio.sleep(FAKE_LATENCY)
+        return [fake_embed(t) for t in texts]
+
+
+PROVIDERS = {"gemini": GeminiProvider, "http": HttpProvider, "fake": FakeProvider}
+_instances: Dict[str, Provider] = {}
+_instances_lock = threading.Lock()
+
+
+def get(name: str) -> Provider:
+    """The process-wide provider for a backend name, created on first use."""
+    provider = _instances.get(name)
+    if provider is None:
+        with _instances_lock:
+            provider = _instances.get(name)
+            if provider is None:
+                if name not in PROVIDERS:
+                    raise ValueError(f"unknown CHAT_BACKEND {name!r}")
+                provider = _instances[name] = PROVIDERS[name]()
+    return provider
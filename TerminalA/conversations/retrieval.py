@@ -0,0 +1,156 @@
+"""
+Hybrid retrieval for /api/query/.
+
+Two candidate generators run side by side, BM25 over the keyword index
+and cosine similarity over the vector index. Their rankings are merged
+with reciprocal rank fusion, de-duplicated to the best message per
+conversation, and an LLM answer is only produced when analysis_depth
+calls for it.
+"""
+from collections import defaultdict
+from datetime import date
+from typing import Dict, List, Optional, Tuple
+
+from django.utils import timezone
+
+from . import keyword_index, metrics
+from .models import Message
+from .services import answer_over_context, build_context_snippets, semantic_search
+
+RRF_K = 60
+
+Span = Optional[Tuple[int, int]]
+Hit = Tuple[float, Message, Span]  # span: the matching chunk of a vector hit, else None
+
+# k: excerpts returned; llm: False / "auto" (only for question-like queries) / True;
+# conversations: how many conversations (nearest by centroid) the vector search scores
+DEPTHS = {
+    "light": {"k": 5, "llm": False, "conversations": 32},
+    "normal": {"k": 8, "llm": "auto", "conversations": 128},
+    "deep": {"k": 15, "llm": True, "conversations": 512},
+}
+
+_QUESTION_WORDS = {
+    "what", "why", "how", "when", "who", "which", "where", "did", "does", "do",
+    "is", "are", "was", "were", "can", "could", "should", "summarize", "explain", "compare",
+}
+
+
+def _score(text, terms):
+    t = (text or "").lower()
+    return sum(t.count(term) for term in terms if term)
+
+
+def _snippet(text, term, pad=80):
+    t = text or ""
+    i = t.lower().find(term.lower())
+    if i < 0:
+        return (t[: pad * 2] + "…") if len(t) > pad * 2 else t
+    a = max(0, i - pad)
+    b = min(len(t), i + len(term) + pad)
+    return ("…" if a else "") + t[a:b] + ("…" if b < len(t) else "")
+
+
+def _is_question(q: str) -> bool:
+    words = keyword_index.tokenize(q)
+    return q.rstrip().endswith("?") or bool(words and words[0] in _QUESTION_WORDS)
+
+
+@metrics.timed("search.keyword")
+def keyword_candidates(q, n, date_from=None, date_to=None, keywords=None) -> List[Hit]:
+    """BM25 hits, boosted when the conversation title/summary mentions the terms."""
+    terms = keyword_index.tokenize(q)
+    hits = keyword_index.search(q, limit=n, date_from=date_from, date_to=date_to, keywords=keywords)
+    msgs = Message.objects.select_related("conversation").in_bulk([mid for _, mid in hits])
+    out = []
+    for sc, mid in hits:
+        m = msgs.get(mid)
+        if m is not None:
+            c = m.conversation
+            out.append((sc + _score(f"{c.title or ''} {c.summary or ''}", terms), m, None))
+    out.sort(key=lambda x: -x[0])
+    return out
+
+
+def vector_candidates(q, n, date_from=None, date_to=None, keywords=None,
+                      conversations: Optional[int] = None) -> List[Hit]:
+    required = [t for k in (keywords or []) for t in keyword_index.tokenize(k)]
+    out = []
+    for sc, me in semantic_search(q, k=n, conversations=conversations):
+        m = me.message
+        d = timezone.localdate(m.created_at)  # same day boundaries as the keyword side
+        if (date_from and d < date_from) or (date_to and d > date_to):
+            continue
+        if required and not set(required) <= set(keyword_index.tokenize(m.content)):
+            continue
+        out.append((sc, m, (me.start, me.end)))
+    return out
+
+
+def fuse(*rankings: List[Hit]) -> List[Hit]:
+    """Reciprocal rank fusion, keeping the best message per conversation."""
+    fused: Dict[int, float] = defaultdict(float)
+    by_id: Dict[int, Message] = {}
+    spans: Dict[int, Span] = {}
+    for ranking in rankings:
+        for rank, (_, m, span) in enumerate(ranking):
+            fused[m.id] += 1.0 / (RRF_K + rank + 1)
+            by_id[m.id] = m
+            spans[m.id] = spans.get(m.id) or span
+    best: Dict[int, Hit] = {}
+    for mid, sc in fused.items():
+        m = by_id[mid]
+        if m.conversation_id not in best or sc > best[m.conversation_id][0]:
+            best[m.conversation_id] = (sc, m, spans[mid])
+    return sorted(best.values(), key=lambda x: -x[0])
+
+
+@metrics.timed("retrieve")
+def retrieve(q: str, analysis_depth: str = "normal", date_from: Optional[date] = None,
+             date_to: Optional[date] = None, keywords: Optional[List[str]] = None) -> Tuple[dict, Optional[str]]:
+    """
+    Returns (QueryOutSerializer payload, LLM context). The context is None
+    unless analysis_depth wants an LLM answer; the caller then fills "answer".
+    """
+    depth = DEPTHS.get(analysis_depth, DEPTHS["normal"])
+    k = depth["k"]
+    filters = {"date_from": date_from, "date_to": date_to, "keywords": keywords}
+
+    kw = keyword_candidates(q, k * 5, **filters)
+    vec = vector_candidates(q, k * 3, conversations=depth["conversations"], **filters)
+    metrics.SEARCH_CANDIDATES.observe(len(kw), source="keyword")
+    metrics.SEARCH_CANDIDATES.observe(len(vec), source="vector")
+    top = fuse(kw, vec)[:k]
+
+    if not top:
+        return {"answer": "No relevant results found.", "excerpts": []}, None
+
+    terms = keyword_index.tokenize(q)
+    excerpts = []
+    for sc, m, span in top:
+        text = m.content[span[0]:span[1]] if span else m.content
+        term = next((t for t in terms if t in text.lower()), None)
+        if term is None:  # the query terms sit outside the best-matching chunk
+            text = m.content
+            lowered = text.lower()
+            term = next((t for t in terms if t in lowered), terms[0] if terms else "")
+        excerpts.append({
+            "conversation_id": str(m.conversation_id),
+            "message_id": str(m.id),
+            "snippet": _snippet(text, term),
+            "timestamp": m.created_at,
+            "score": round(sc, 4),
+        })
+
+    payload = {"answer": f"Found {len(top)} relevant excerpts.", "excerpts": excerpts}
+    if depth["llm"] is True or (depth["llm"] == "auto" and _is_question(q)):
+        context_text, _ = build_context_snippets(top)
+        return payload, context_text
+    return payload, None
+
+
+def search(q: str, analysis_depth: str = "normal", **filters) -> dict:
+    payload, context_text = retrieve(q, analysis_depth, **filters)
+    if context_text is not None:
+        payload["answer"] = answer_over_context(q, context_text)
+    return payload
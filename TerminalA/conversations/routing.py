@@ -0,0 +1,44 @@
+"""
+Read-replica routing for the heavy read paths.
+
+Reads go to the "replica" alias (see backend/database.py) only inside
+replica_reads(), which wraps the conversation list, /api/query/ and
+semantic_search; everything else, and every write, uses "default". The
+replica may lag the primary by a moment, so these paths may not see a
+row written just before; they don't need to. Without a replica alias
+replica_reads() does nothing.
+"""
+import contextlib
+from contextvars import ContextVar
+
+from django.conf import settings
+
+REPLICA = "replica"
+
+_reading = ContextVar("replica_reads", default=False)
+
+
+@contextlib.contextmanager
+def replica_reads():
+    """Send ORM reads to the replica for the duration (usable as a decorator)."""
+    token = _reading.set(True)
+    try:
+        yield
+    finally:
+        _reading.reset(token)
+
+
+class ReadReplicaRouter:
+    def db_for_read(self, model, **hints):
+        if _reading.get() and REPLICA in settings.DATABASES:
+            return REPLICA
+        return None
+
+    def db_for_write(self, model, **hints):
+        return "default"
+
+    def allow_relation(self, obj1, obj2, **hints):
+        return True  # same data on both aliases
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        return db != REPLICA
@@ -0,0 +1,257 @@
+"""
+Admission control in front of the LLM provider (see ai.py).
+
+Every chat and embed call takes a slot from the process-wide scheduler
+before it is sent:
+
+- two token buckets, LLM_RPM requests and LLM_TPM tokens per minute
+  (0 = unlimited), refilled continuously and holding LLM_BURST_SECONDS
+  of quota, so a burst can't spend a minute's worth at once (keep the
+  limits a little under the provider's). A call is charged its prompt
+  (chars / 4) up front and its reply when it comes back, so the next
+  calls wait for what the last ones actually used;
+- calls that can't go at once wait in one queue, served by priority
+  class and FIFO within a class: INTERACTIVE (chat replies, context
+  folding, search) before SUMMARY (window and final summaries) before
+  BACKFILL (embeddings of ended conversations);
+- at most LLM_QUEUE_MAX calls wait at a time. When the queue is full a
+  new call evicts the newest waiter of a lower class, or is refused if
+  there is none; a call still waiting after its class's deadline
+  (LLM_QUEUE_TIMEOUT interactive, LLM_BACKGROUND_QUEUE_TIMEOUT otherwise)
+  gives up. Either way it raises Overloaded, which OverloadMiddleware
+  turns into a 429 with Retry-After, and jobs put back for later.
+
+The limits are per process: with N workers, give each 1/N of the
+provider's quota.
+"""
+import asyncio
+import heapq
+import itertools
+import math
+import os
+import threading
+import time
+from typing import List, Optional
+
+from django.http import JsonResponse
+from django.utils.deprecation import MiddlewareMixin
+
+from . import metrics
+
+LLM_RPM = float(os.getenv("LLM_RPM", "0"))
+LLM_TPM = float(os.getenv("LLM_TPM", "0"))
+LLM_BURST_SECONDS = float(os.getenv("LLM_BURST_SECONDS", "1"))  # bucket size, in seconds of quota
+LLM_QUEUE_MAX = int(os.getenv("LLM_QUEUE_MAX", "256"))
+LLM_QUEUE_TIMEOUT = float(os.getenv("LLM_QUEUE_TIMEOUT", "10"))
+LLM_BACKGROUND_QUEUE_TIMEOUT = float(os.getenv("LLM_BACKGROUND_QUEUE_TIMEOUT", "120"))
+
+INTERACTIVE, SUMMARY, BACKFILL = 0, 1, 2
+PRIORITIES = ("interactive", "summary", "backfill")
+
+POLL_SECONDS = 0.02  # how often an async waiter behind the head re-checks
+
+QUEUE_WAIT = metrics.histogram("llm_queue_wait_seconds", "Time LLM calls waited for admission.", ("priority",))
+SHED = metrics.counter("llm_shed_total", "LLM calls refused by admission control.", ("priority", "reason"))
+
+
+class Overloaded(RuntimeError):
+    """
+    The LLM call was not made. `status` is what to answer the client with:
+    429 when shed here, 503 when the provider itself is unavailable.
+    """
+
+    def __init__(self, message: str, retry_after: float = 1.0, status: int = 429):
+        super().__init__(message)
+        self.retry_after = retry_after
+        self.status = status
+
+
+class TokenBucket:
+    """
+    `per_minute` units per minute, bursting up to `burst` seconds' worth.
+    A cost above the burst waits for a full bucket and leaves it in debt.
+    Not locked.
+    """
+
+    def __init__(self, per_minute: float, burst: float = LLM_BURST_SECONDS):
+        self.rate = per_minute / 60
+        self.capacity = max(self.rate * burst, 1.0)
+        self.level = self.capacity
+        self._stamp = time.monotonic()
+
+    def _refill(self, now: float) -> None:
+        self.level = min(self.capacity, self.level + (now - self._stamp) * self.rate)
+        self._stamp = now
+
+    def wait(self, n: float, now: float) -> float:
+        """Seconds until `n` units may be taken."""
+        self._refill(now)
+        n = min(n, self.capacity)
+        return 0.0 if self.level >= n else (n - self.level) / self.rate
+
+    def take(self, n: float) -> None:
+        self.level -= n
+
+    def charge(self, n: float, now: float) -> None:
+        """Debit usage known only afterwards."""
+        self._refill(now)
+        self.level -= n
+
+
+class _Ticket:
+    __slots__ = ("priority", "seq", "tokens", "shed")
+
+    def __init__(self, priority: int, seq: int, tokens: int):
+        self.priority, self.seq, self.tokens, self.shed = priority, seq, tokens, False
+
+    def __lt__(self, other: "_Ticket") -> bool:
+        return (self.priority, self.seq) < (other.priority, other.seq)
+
+
+class Scheduler:
+    def __init__(self, rpm: float = LLM_RPM, tpm: float = LLM_TPM, queue_max: int = LLM_QUEUE_MAX,
+                 timeouts=(LLM_QUEUE_TIMEOUT, LLM_BACKGROUND_QUEUE_TIMEOUT, LLM_BACKGROUND_QUEUE_TIMEOUT)):
+        self.requests = TokenBucket(rpm) if rpm else None
+        self.tokens = TokenBucket(tpm) if tpm else None
+        self.queue_max = queue_max
+        self.timeouts = timeouts
+        self._cond = threading.Condition()
+        self._waiting: List[_Ticket] = []  # heap; the head is served next
+        self._seq = itertools.count()
+
+    def depth(self, priority: Optional[int] = None) -> int:
+        return sum(1 for t in self._waiting if priority is None or t.priority == priority)
+
+    # everything below runs under self._cond
+
+    def _take(self, tokens: int, now: float) -> float:
+        """Take one request and `tokens` if both are available; else seconds to wait."""
+        wait = max(self.requests.wait(1, now) if self.requests else 0.0,
+                   self.tokens.wait(tokens, now) if self.tokens else 0.0)
+        if not wait:
+            if self.requests:
+                self.requests.take(1)
+            if self.tokens:
+                self.tokens.take(tokens)
+        return wait
+
+    def _retry_after(self) -> float:
+        if not self.requests:
+            return 1.0
+        return max(1.0, (len(self._waiting) + 1) / self.requests.rate)
+
+    def _shed(self, priority: int, reason: str) -> Overloaded:
+        SHED.inc(priority=PRIORITIES[priority], reason=reason)
+        return Overloaded(f"LLM queue {reason} ({PRIORITIES[priority]})", self._retry_after())
+
+    def _enter(self, priority: int, tokens: int) -> Optional[_Ticket]:
+        """Admit at once (None) or queue a ticket; raises Overloaded when the queue is full."""
+        with self._cond:
+            if not self._waiting and not self._take(tokens, time.monotonic()):
+                return None
+            if len(self._waiting) >= self.queue_max:
+                victim = max(self._waiting, default=None)  # lowest class, newest arrival
+                if victim is None or victim.priority <= priority:
+                    raise self._shed(priority, "full")
+                victim.shed = True
+                self._waiting.remove(victim)
+                heapq.heapify(self._waiting)
+                SHED.inc(priority=PRIORITIES[victim.priority], reason="evicted")
+                self._cond.notify_all()
+            ticket = _Ticket(priority, next(self._seq), tokens)
+            heapq.heappush(self._waiting, ticket)
+            return ticket
+
+    def _poll(self, ticket: _Ticket) -> Optional[float]:
+        """None once `ticket` is admitted, else seconds worth waiting before asking again."""
+        if ticket.shed:
+            raise Overloaded(f"LLM queue evicted ({PRIORITIES[ticket.priority]})", self._retry_after())
+        if self._waiting[0] is not ticket:
+            return POLL_SECONDS
+        wait = self._take(ticket.tokens, time.monotonic())
+        if wait:
+            return wait
+        heapq.heappop(self._waiting)
+        self._cond.notify_all()
+        return None
+
+    def _give_up(self, ticket: _Ticket) -> Overloaded:
+        self._waiting.remove(ticket)
+        heapq.heapify(self._waiting)
+        self._cond.notify_all()
+        return self._shed(ticket.priority, "timeout")
+
+    # public API
+
+    def acquire(self, priority: int = INTERACTIVE, tokens: int = 0) -> None:
+        """Block until a call of `priority` costing `tokens` may be sent."""
+        started = time.monotonic()
+        ticket = self._enter(priority, tokens)
+        if ticket is not None:
+            deadline = started + self.timeouts[priority]
+            with self._cond:
+                while True:
+                    wait = self._poll(ticket)
+                    if wait is None:
+                        break
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        raise self._give_up(ticket)
+                    self._cond.wait(min(wait, remaining))
+        QUEUE_WAIT.observe(time.monotonic() - started, priority=PRIORITIES[priority])
+
+    async def aacquire(self, priority: int = INTERACTIVE, tokens: int = 0) -> None:
+        """acquire() for the event loop: waits with asyncio.sleep instead of blocking."""
+        started = time.monotonic()
+        ticket = self._enter(priority, tokens)
+        if ticket is not None:
+            deadline = started + self.timeouts[priority]
+            while True:
+                with self._cond:
+                    wait = self._poll(ticket)
+                    if wait is None:
+                        break
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        raise self._give_up(ticket)
+                await asyncio.sleep(min(wait, remaining))
+        QUEUE_WAIT.observe(time.monotonic() - started, priority=PRIORITIES[priority])
+
+    def charge(self, tokens: int) -> None:
+        """Charge reply tokens to the TPM bucket once they are known."""
+        if self.tokens and tokens:
+            with self._cond:
+                self.tokens.charge(tokens, time.monotonic())
+
+
+_scheduler: Optional[Scheduler] = None
+_scheduler_lock = threading.Lock()
+
+
+def get() -> Scheduler:
+    global _scheduler
+    if _scheduler is None:
+        with _scheduler_lock:
+            if _scheduler is None:
+                _scheduler = Scheduler()
+    return _scheduler
+
+
+def _queue_metrics():
+    s = _scheduler
+    for p, name in enumerate(PRIORITIES):
+        yield ("llm_queue_depth", "gauge", "LLM calls waiting for admission.", {"priority": name},
+               s.depth(p) if s else 0)
+
+metrics.register_collector(_queue_metrics)
+
+
+class OverloadMiddleware(MiddlewareMixin):
+    """Answer Overloaded from any view with its status and a Retry-After header."""
+
+    def process_exception(self, request, exception):
+        if not isinstance(exception, Overloaded):
+            return None
+        response = JsonResponse({"detail": str(exception)}, status=exception.status)
+        response["Retry-After"] = str(max(1, math.ceil(exception.retry_after)))
+        return response
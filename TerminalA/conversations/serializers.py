@@ -1,4 +1,6 @@
+from django.db import transaction
 from rest_framework import serializers
+from . import analytics
 from .models import Conversation, Message
 
 
@@ -9,9 +11,13 @@ class MessageSerializer(serializers.ModelSerializer):
 
 
 class ConversationListSerializer(serializers.ModelSerializer):
+    message_count = serializers.IntegerField(read_only=True)
+    last_message_at = serializers.DateTimeField(read_only=True, allow_null=True)
+
     class Meta:
         model = Conversation
-        fields = ["id", "title", "started_at", "ended_at", "status", "tags"]
+        fields = ["id", "title", "started_at", "ended_at", "status", "tags",
+                  "message_count", "last_message_at"]
 
 
 class ConversationDetailSerializer(serializers.ModelSerializer):
@@ -30,6 +36,25 @@ class ConversationDetailSerializer(serializers.ModelSerializer):
             "messages",
         ]
 
+    def update(self, instance, validated_data):
+        old_tags = instance.tags
+        with transaction.atomic():
+            conv = super().update(instance, validated_data)
+            if "tags" in validated_data:
+                analytics.record_retag(conv, old_tags)
+        return conv
+
+
+class MessagePageQuerySerializer(serializers.Serializer):
+    after_id = serializers.IntegerField(min_value=0, default=0)
+    limit = serializers.IntegerField(min_value=1, max_value=500, default=100)
+
+
+class MessagePageSerializer(serializers.Serializer):
+    results = MessageSerializer(many=True)
+    next_after_id = serializers.IntegerField()
+    status = serializers.CharField()
+
 
 class ConversationCreateSerializer(serializers.ModelSerializer):
     class Meta:
@@ -77,4 +102,56 @@ class QueryMatchOutSerializer(serializers.Serializer):
 class QueryOutSerializer(serializers.Serializer):
     answer = serializers.CharField()
     excerpts = QueryMatchOutSerializer(many=True)
-   
\ No newline at end of file
+
+
+class AnalyticsQuerySerializer(serializers.Serializer):
+    date_from = serializers.DateField(required=False)
+    date_to = serializers.DateField(required=False)
+    limit = serializers.IntegerField(min_value=1, max_value=50, default=10)
+
+    def validate(self, attrs):
+        if attrs.get("date_from") and attrs.get("date_to") and attrs["date_from"] > attrs["date_to"]:
+            raise serializers.ValidationError("date_from is after date_to.")
+        return attrs
+
+
+class AnalyticsDaySerializer(serializers.Serializer):
+    day = serializers.DateField()
+    conversations_started = serializers.IntegerField()
+    conversations_ended = serializers.IntegerField()
+    messages = serializers.IntegerField()
+    avg_reply_seconds = serializers.FloatField(allow_null=True)
+
+
+class AnalyticsTotalsSerializer(serializers.Serializer):
+    conversations_started = serializers.IntegerField()
+    conversations_ended = serializers.IntegerField()
+    user_messages = serializers.IntegerField()
+    assistant_messages = serializers.IntegerField()
+    avg_reply_seconds = serializers.FloatField(allow_null=True)
+    avg_conversation_messages = serializers.FloatField(allow_null=True)
+    avg_conversation_minutes = serializers.FloatField(allow_null=True)
+
+
+class DailyAnalyticsSerializer(serializers.Serializer):
+    date_from = serializers.DateField()
+    date_to = serializers.DateField()
+    days = AnalyticsDaySerializer(many=True)
+    totals = AnalyticsTotalsSerializer()
+
+
+class TagDaySerializer(serializers.Serializer):
+    day = serializers.DateField()
+    conversations = serializers.IntegerField()
+
+
+class TagCountSerializer(serializers.Serializer):
+    tag = serializers.CharField()
+    conversations = serializers.IntegerField()
+    days = TagDaySerializer(many=True)
+
+
+class TagAnalyticsSerializer(serializers.Serializer):
+    date_from = serializers.DateField()
+    date_to = serializers.DateField()
+    tags = TagCountSerializer(many=True)
@@ -1,45 +1,198 @@
-from typing import List, Tuple
-from .models import Conversation, Message, MessageEmbedding
-from .ai import gemini_chat, gemini_embed, cosine
-
-def messages_to_llm_format(conv: Conversation) -> List[dict]:
-    return [{"role": m.role, "content": m.content} for m in conv.messages.order_by("created_at")]
-
-def ensure_embeddings_for_ended_conversations() -> None:
-    embedded_ids = set(MessageEmbedding.objects.values_list("message_id", flat=True))
-    to_embed = (Message.objects.select_related("conversation")
-                .filter(conversation__status="ended")
-                .exclude(id__in=embedded_ids)
-                .order_by("id"))
-    if not to_embed:
-        return
-    vecs = gemini_embed([m.content for m in to_embed])
-    for m, v in zip(to_embed, vecs):
-        MessageEmbedding.objects.create(message=m, vector=v)
-
-def semantic_search(query: str, k: int = 8) -> List[Tuple[float, MessageEmbedding]]:
-    qv = gemini_embed(query)[0]
-    hits: List[Tuple[float, MessageEmbedding]] = []
-    for me in MessageEmbedding.objects.select_related("message","message__conversation"):
-        if me.message.conversation.status != "ended":
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Dict, Iterable, List, Optional, Tuple
+from django.db import transaction
+from . import metrics
+from .metrics import timed
+from .models import Checkpoint, EmbeddingVector, Message, MessageEmbedding
+from .ai import (BACKFILL, CHAT_MODEL, EMBED_MODEL, Overloaded, _is_zero, agemini_chat, answer_cache,
+                 content_digest, embed_query, gemini_chat, gemini_embed)
+from .chunking import split_text
+from .routing import replica_reads
+from .vector_index import get_index
+
+EMBED_BATCH_SIZE = int(os.getenv("EMBED_BATCH_SIZE", "100"))
+
+Piece = Tuple[Message, int, int]  # message, start, end
+
+EMBED_REUSED = metrics.counter("embed_reused_total",
+                               "Chunks whose vector was already stored under the same content digest.")
+
+def _pieces(messages: Iterable[Message]) -> List[Piece]:
+    return [(m, a, b) for m in messages for a, b in split_text(m.content)]
+
+def _embed_chunk(texts: List[str]) -> List[List[float]]:
+    vecs = gemini_embed(texts, priority=BACKFILL)
+    if len(vecs) != len(texts) or not any(any(v) for v in vecs):
+        raise RuntimeError("embedding call failed")  # gemini_embed falls back to zeros
+    return vecs
+
+def stored_vectors(digests: Iterable[str]) -> Dict[str, EmbeddingVector]:
+    digests = list(set(digests))
+    found = {}
+    for i in range(0, len(digests), 500):
+        found.update((v.digest, v) for v in EmbeddingVector.objects.filter(digest__in=digests[i:i + 500]))
+    return found
+
+def save_vectors(vectors: Dict[str, List[float]]) -> Dict[str, EmbeddingVector]:
+    """Store new vectors by digest; a digest another worker stored first keeps that row."""
+    rows = []
+    for digest, values in vectors.items():
+        ev = EmbeddingVector(digest=digest)
+        ev.set_vector(values)
+        rows.append(ev)
+    EmbeddingVector.objects.bulk_create(rows, ignore_conflicts=True)  # ids are not returned
+    return stored_vectors(vectors)
+
+def _embed_messages(messages: List[Message], chunk_size: int, map_fn=map,
+                    ignore_conflicts: bool = False) -> int:
+    """
+    Embed all chunks of `messages`; rows are written only if every call succeeds.
+    Chunks whose content digest is already stored reuse that vector, and
+    identical chunks within the batch are embedded once.
+    """
+    pieces = _pieces(messages)
+    digests = [content_digest(EMBED_MODEL, m.content[a:b]) for m, a, b in pieces]
+    vectors = stored_vectors(digests)
+    todo: Dict[str, str] = {}
+    for d, (m, a, b) in zip(digests, pieces):
+        if d not in vectors:
+            todo.setdefault(d, m.content[a:b])
+    EMBED_REUSED.inc(len(pieces) - len(todo))
+    keys = list(todo)
+    groups = [keys[i:i + chunk_size] for i in range(0, len(keys), chunk_size)]
+    results = list(map_fn(_embed_chunk, [[todo[d] for d in g] for g in groups]))
+    with transaction.atomic():  # never leave a message partially embedded
+        vectors.update(save_vectors({d: v for g, vecs in zip(groups, results) for d, v in zip(g, vecs)}))
+        created = MessageEmbedding.objects.bulk_create(
+            [MessageEmbedding(message=m, start=a, end=b, vector=vectors[d])
+             for d, (m, a, b) in zip(digests, pieces)],
+            ignore_conflicts=ignore_conflicts,
+        )
+    if not ignore_conflicts:
+        get_index().add(created)  # otherwise the index picks them up on its next refresh
+    return len(created)
+
+def _unembedded(after_id: int, limit: int) -> List[Message]:
+    # LEFT JOIN ... IS NULL anti-join, keyset on id
+    return list(Message.objects.select_related("conversation")
+                .filter(conversation__status="ended", embeddings__isnull=True, id__gt=after_id)
+                .order_by("id")[:limit])
+
+@timed("embed.backfill")
+def backfill_embeddings(chunk_size: int = EMBED_BATCH_SIZE, workers: int = 4,
+                        checkpoint: Optional[str] = "embeddings",
+                        progress: Optional[Callable[[int, float], None]] = None) -> Tuple[int, float]:
+    """
+    Embed every unembedded message of ended conversations.
+
+    Messages are read in id order, `workers` chunks at a time; the chunks
+    are embedded concurrently and written with bulk_create. After each
+    wave the named Checkpoint advances to the last id written, so an
+    interrupted run resumes where it stopped; a run that finishes resets
+    it, so the next run also sees lower ids (conversations ended since,
+    failed embed jobs). A wave shed by admission control is retried after
+    its Retry-After. Returns (messages, seconds).
+    """
+    cp = Checkpoint.objects.get_or_create(name=checkpoint)[0] if checkpoint else None
+    last_id = cp.position if cp else 0
+    written, started = 0, time.perf_counter()
+    with ThreadPoolExecutor(max_workers=max(workers, 1)) as pool:
+        while True:
+            batch = _unembedded(last_id, chunk_size * workers)
+            if not batch:
+                if cp and cp.position:
+                    cp.position = 0
+                    cp.save(update_fields=["position", "updated_at"])
+                break
+            try:
+                _embed_messages(batch, chunk_size, map_fn=pool.map, ignore_conflicts=True)
+            except Overloaded as e:
+                time.sleep(e.retry_after)
+                continue
+            written += len(batch)
+            last_id = batch[-1].id
+            if cp:
+                cp.position = last_id
+                cp.save(update_fields=["position", "updated_at"])
+            if progress:
+                progress(written, time.perf_counter() - started)
+    return written, time.perf_counter() - started
+
+@timed("embed.conversations")
+def embed_conversations(conversation_ids: Iterable[int]) -> int:
+    """
+    Embed every not-yet-embedded message of the given conversations, in
+    batches of EMBED_BATCH_SIZE chunks across conversations. Returns rows written.
+    """
+    to_embed = list(Message.objects.select_related("conversation")
+                    .filter(conversation_id__in=list(conversation_ids), embeddings__isnull=True)
+                    .order_by("id"))
+    return _embed_messages(to_embed, EMBED_BATCH_SIZE)
+
+@timed("search.vector")
+@replica_reads()
+def semantic_search(query: str, k: int = 8, conversations: Optional[int] = None) -> List[Tuple[float, MessageEmbedding]]:
+    """
+    Top-k messages by their best-matching chunk; each hit's chunk is the
+    matching span. With `conversations`, only messages of the C conversations
+    nearest the query (by centroid) are scored; None searches everything.
+    """
+    qv = embed_query(query)
+    if _is_zero(qv):  # the embedding call failed; every chunk would score 0
+        return []
+    top = get_index().search(qv, k=k * 3, ended_only=True, conversations=conversations)
+    rows = (MessageEmbedding.objects.select_related("message", "message__conversation")
+            .in_bulk([eid for _, eid in top]))
+    hits, seen = [], set()
+    for score, eid in top:
+        me = rows.get(eid)
+        if me is None or me.message_id in seen:
             continue
-        hits.append((cosine(qv, me.vector), me))
-    hits.sort(key=lambda x: x[0], reverse=True)
+        seen.add(me.message_id)
+        hits.append((score, me))
     return hits[:k]
 
-def build_context_snippets(top_hits: List[Tuple[float, MessageEmbedding]]) -> tuple[str, list]:
+def build_context_snippets(top_hits: List[Tuple[float, Message, Optional[Tuple[int, int]]]]) -> tuple[str, list]:
+    """top_hits: (score, message, span); span is the matching chunk, or None for the message head."""
     lines, excerpts = [], []
-    for score, me in top_hits:
-        m = me.message
-        snippet = m.content[:350] + ("..." if len(m.content) > 350 else "")
+    for score, m, span in top_hits:
+        if span:
+            a, b = span
+            snippet = ("..." if a else "") + m.content[a:b] + ("..." if b < len(m.content) else "")
+        else:
+            snippet = m.content[:350] + ("..." if len(m.content) > 350 else "")
         lines.append(f"[C{m.conversation_id}] {snippet}")
         excerpts.append({"conversation_id": m.conversation_id, "created_at": m.created_at,
                          "snippet": snippet, "score": round(score, 4)})
     return "\n\n".join(lines), excerpts
 
-def answer_over_context(user_query: str, context_text: str) -> str:
-    prompt = [
+def _answer_prompt(user_query: str, context_text: str) -> List[dict]:
+    return [
         {"role":"system","content":"You are a precise conversation analyst. Cite conversation IDs like [C123]."},
         {"role":"user","content":f"Context:\n{context_text}\n\nQuestion: {user_query}\n\nAnswer using only the context. If uncertain, say so."}
     ]
-    return gemini_chat(prompt)
+
+def _answer_key(user_query: str, context_text: str) -> str:
+    return answer_cache.key(CHAT_MODEL, f"{user_query}\x00{context_text}")
+
+@timed("answer")
+def answer_over_context(user_query: str, context_text: str) -> str:
+    key = _answer_key(user_query, context_text)
+    answer = answer_cache.get(key)
+    if answer is None:
+        answer = gemini_chat(_answer_prompt(user_query, context_text))
+        if not answer.startswith("(AI error:"):
+            answer_cache.set(key, answer)
+    return answer
+
+@timed("answer")
+async def aanswer_over_context(user_query: str, context_text: str) -> str:
+    key = _answer_key(user_query, context_text)
+    answer = answer_cache.get(key)
+    if answer is None:
+        answer = await agemini_chat(_answer_prompt(user_query, context_text))
+        if not answer.startswith("(AI error:"):
+            answer_cache.set(key, answer)
+    return answer
@@ -0,0 +1,19 @@
+from django.db.models.signals import post_save
+from django.dispatch import receiver
+
+from . import analytics
+from .models import Conversation, Job, Message
+
+
+@receiver(post_save, sender=Message)
+def queue_new_message(sender, instance, created, raw=False, **kwargs):
+    # indexing, counters and the window check run on the worker (jobs.run_message)
+    if created and not raw:
+        Job.objects.create(kind="message", conversation_id=instance.conversation_id,
+                           payload={"message_id": instance.id})
+
+
+@receiver(post_save, sender=Conversation)
+def count_new_conversation(sender, instance, created, raw=False, **kwargs):
+    if created and not raw:
+        analytics.record_conversation(instance)
@@ -0,0 +1,167 @@
+"""
+Map-reduce conversation summaries.
+
+While a conversation is active, every WINDOW_MESSAGES messages are
+summarized into a partial summary (a "window" job, queued from
+signals.py) and cached on Conversation.meta["summary_windows"] as
+[{"first_id", "last_id", "text"}] in message order. Ending the
+conversation summarizes only the messages after the last cached window
+and then reduces the partials into the final summary and tags. Once more
+than REDUCE_FANIN partials are cached, the window job merges the oldest
+ones into one, so the end step is at most two LLM calls however long the
+transcript is. Windows that are still missing (e.g. history imported in
+bulk) are summarized in parallel.
+
+A conversation that fits in one window is summarized from its
+transcript in a single call, as before.
+
+Every summarization call goes through ContentSummary first: a prompt
+whose normalized text was summarized before (by the same model) is not
+sent again, so repeated transcripts and windows cost one call in total.
+"""
+import functools
+import os
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, List, Tuple
+
+from . import metrics
+from .ai import CHAT_MODEL, SUMMARY, _build_prompt, _parse_tags, _summary_prompt, content_digest, gemini_chat
+from .models import ContentSummary, Conversation, Message
+
+WINDOW_MESSAGES = int(os.getenv("SUMMARY_WINDOW_MESSAGES", "40"))
+REDUCE_FANIN = int(os.getenv("SUMMARY_REDUCE_FANIN", "12"))  # partials merged per reduce call
+WORKERS = int(os.getenv("SUMMARY_WORKERS", "4"))
+
+SUMMARY_REUSED = metrics.counter("summary_reused_total",
+                                 "Summarization prompts answered from ContentSummary.")
+
+
+class SummaryError(RuntimeError):
+    pass
+
+
+def _transcript(messages: List[Message]) -> str:
+    return "\n".join(f"{m.role}: {m.content}" for m in messages)
+
+
+def _window_prompt(messages: List[Message]) -> List[Dict[str, str]]:
+    return [
+        {"role": "system", "content": "You are a concise conversation analyst."},
+        {"role": "user", "content": (
+            "Summarize this part of a conversation in at most 120 words. "
+            "Keep facts, names, decisions and open questions.\n\n"
+            f"{_transcript(messages)}"
+        )},
+    ]
+
+
+def _merge_prompt(partials: List[str]) -> List[Dict[str, str]]:
+    parts = "\n\n".join(f"[{i + 1}] {p}" for i, p in enumerate(partials))
+    return [
+        {"role": "system", "content": "You are a concise conversation analyst."},
+        {"role": "user", "content": (
+            "These are summaries of consecutive parts of one conversation. "
+            f"Merge them into one summary of at most 200 words.\n\n{parts}"
+        )},
+    ]
+
+
+def _final_prompt(partials: List[str]) -> List[Dict[str, str]]:
+    parts = "\n\n".join(f"[{i + 1}] {p}" for i, p in enumerate(partials))
+    return [
+        {"role": "system", "content": "You are a concise conversation analyst."},
+        {"role": "user", "content": (
+            "These are summaries of consecutive parts of one conversation.\n"
+            "Summarize the whole conversation in 5–8 bullet points.\n"
+            "Write a 2–3 line abstract.\n"
+            "Finally output a line exactly like: TAGS: tag1, tag2, tag3\n\n"
+            f"Parts:\n{parts}"
+        )},
+    ]
+
+
+def _chat_all(prompts: List[List[Dict[str, str]]]) -> List[str]:
+    """Answer each prompt, in parallel; prompts already in ContentSummary are not sent."""
+    keys = [content_digest(CHAT_MODEL, _build_prompt(p)) for p in prompts]
+    done = dict(ContentSummary.objects.filter(digest__in=set(keys)).values_list("digest", "text"))
+    todo = {k: p for k, p in zip(keys, prompts) if k not in done}
+    SUMMARY_REUSED.inc(len(prompts) - len(todo))
+    chat = functools.partial(gemini_chat, priority=SUMMARY)
+    if len(todo) <= 1 or WORKERS <= 1:
+        out = [chat(p) for p in todo.values()]
+    else:
+        with ThreadPoolExecutor(max_workers=min(WORKERS, len(todo))) as pool:
+            out = list(pool.map(chat, todo.values()))
+    for text in out:
+        if text.startswith("(AI error:"):
+            raise SummaryError(text)
+    fresh = {k: t.strip() for k, t in zip(todo, out)}
+    ContentSummary.objects.bulk_create(
+        [ContentSummary(digest=k, text=t) for k, t in fresh.items()], ignore_conflicts=True
+    )
+    done.update(fresh)
+    return [done[k] for k in keys]
+
+
+def cached_windows(conv: Conversation) -> List[dict]:
+    return list((conv.meta or {}).get("summary_windows") or [])
+
+
+def has_full_window(conv: Conversation) -> bool:
+    """True once WINDOW_MESSAGES messages follow the last cached window."""
+    windows = cached_windows(conv)
+    after = windows[-1]["last_id"] if windows else 0
+    return conv.messages.filter(id__gt=after)[WINDOW_MESSAGES - 1:WINDOW_MESSAGES].exists()
+
+
+def summarize_windows(conv: Conversation, final: bool = False) -> int:
+    """
+    Summarize uncached windows after the last cached one, in parallel.
+    Unless `final`, a trailing partial window is left for later. Returns
+    the number of windows added.
+    """
+    conv.refresh_from_db(fields=["meta"])
+    windows = cached_windows(conv)
+    after = windows[-1]["last_id"] if windows else 0
+    msgs = list(conv.messages.filter(id__gt=after).order_by("id").only("id", "role", "content"))
+    chunks = [msgs[i:i + WINDOW_MESSAGES] for i in range(0, len(msgs), WINDOW_MESSAGES)]
+    if chunks and not final and len(chunks[-1]) < WINDOW_MESSAGES:
+        chunks.pop()
+    if not chunks:
+        return 0
+    texts = _chat_all([_window_prompt(c) for c in chunks])
+    windows += [{"first_id": c[0].id, "last_id": c[-1].id, "text": t} for c, t in zip(chunks, texts)]
+    if not final:
+        windows = _compact(windows)
+    conv.set_meta("summary_windows", windows)
+    return len(chunks)
+
+
+def _compact(windows: List[dict]) -> List[dict]:
+    """Merge the oldest REDUCE_FANIN windows into one until at most REDUCE_FANIN remain."""
+    while len(windows) > REDUCE_FANIN:
+        head, windows = windows[:REDUCE_FANIN], windows[REDUCE_FANIN:]
+        merged = _chat_all([_merge_prompt([w["text"] for w in head])])[0]
+        windows.insert(0, {"first_id": head[0]["first_id"], "last_id": head[-1]["last_id"], "text": merged})
+    return windows
+
+
+def reduce_windows(partials: List[str]) -> Tuple[str, list]:
+    """Merge partials REDUCE_FANIN at a time (in parallel) until one final call remains."""
+    while len(partials) > REDUCE_FANIN:
+        groups = [partials[i:i + REDUCE_FANIN] for i in range(0, len(partials), REDUCE_FANIN)]
+        partials = _chat_all([_merge_prompt(g) for g in groups])
+    out = _chat_all([_final_prompt(partials)])[0]
+    return out, _parse_tags(out)
+
+
+def summarize_conversation(conv: Conversation) -> Tuple[str, list]:
+    """Final summary and tags; only the tail after the cached windows is read."""
+    windows = cached_windows(conv)
+    if not windows:
+        head = list(conv.messages.order_by("id")[:WINDOW_MESSAGES + 1])
+        if len(head) <= WINDOW_MESSAGES:
+            summary = _chat_all([_summary_prompt(_transcript(head))])[0]
+            return summary, _parse_tags(summary)
+    summarize_windows(conv, final=True)
+    return reduce_windows([w["text"] for w in cached_windows(conv)])
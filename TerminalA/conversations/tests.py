@@ -1,2 +1,581 @@
-from django.test import TestCase
+import json
+import re
+import threading
+import time
+from datetime import date, datetime, timezone as dt_timezone
+from unittest import mock
 
+from django.core.management import call_command
+from django.db.migrations.executor import MigrationExecutor
+from django.test import SimpleTestCase, TestCase, TransactionTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.db import connection
+from django.utils import timezone
+
+from benchmarks.corpus import generate, queries
+from . import (ai, analytics, archive, context, jobs, keyword_index, providers, retrieval, scheduler, services,
+               summaries, vector_index)
+from .chunking import split_text
+from .embed_batch import EmbedBatcher
+from .services import backfill_embeddings, embed_conversations
+from .vectors import decode_vector, encode_vector
+from .routing import ReadReplicaRouter, replica_reads
+from .models import (ContentSummary, Conversation, ConversationTag, DailyStats, EmbeddingVector,
+                     KeywordIndexStats, Message, MessageEmbedding, Posting, TagDaily)
+
+
+class FakeBackendMixin:
+    """Runs each test against the fake LLM provider."""
+
+    def setUp(self):
+        super().setUp()
+        self.enterContext(mock.patch.object(ai, "CHAT_BACKEND", "fake"))
+
+
+class QueryCountTests(FakeBackendMixin, TestCase):
+    """
+    DB queries per request must not grow with the corpus. Each endpoint is
+    measured on a small corpus, the corpus is grown, and it is measured again.
+    The absolute counts are pinned in BUDGET; change them deliberately.
+    """
+
+    BUDGET = {"list": 1, "detail": 2, "query light": 5, "query deep": 5, "send_message": 7,
+              "analytics daily": 1, "analytics tags": 2}
+
+    def count(self, fn) -> int:
+        fn()  # warm caches and the vector index
+        with CaptureQueriesContext(connection) as ctx:
+            fn()
+        return len(ctx.captured_queries)
+
+    def scenarios(self):
+        analytics.rebuild()  # the corpus is bulk-created, which bypasses the counters
+        ended = Conversation.objects.filter(status="ended").first()
+        active = Conversation.objects.create(title="bench")
+        q = iter(queries(100))
+        post = lambda url, body: self.client.post(url, body, content_type="application/json")
+        return {
+            "list": lambda: self.client.get("/api/conversations/"),
+            "detail": lambda: self.client.get(f"/api/conversations/{ended.id}/"),
+            "query light": lambda: post("/api/query/", {"query": next(q), "analysis_depth": "light"}),
+            "query deep": lambda: post("/api/query/", {"query": next(q), "analysis_depth": "deep"}),
+            "send_message": lambda: post(f"/api/conversations/{active.id}/messages/",
+                                         {"role": "user", "content": "hello"}),
+            "analytics daily": lambda: self.client.get("/api/analytics/daily/"),
+            "analytics tags": lambda: self.client.get("/api/analytics/tags/"),
+        }
+
+    def test_queries_do_not_grow_with_corpus(self):
+        generate(conversations=5, messages=4, seed=1)
+        small = {name: self.count(fn) for name, fn in self.scenarios().items()}
+        generate(conversations=40, messages=8, seed=2)
+        large = {name: self.count(fn) for name, fn in self.scenarios().items()}
+        self.assertEqual(small, large)
+
+    def test_query_budget(self):
+        generate(conversations=5, messages=4, seed=1)
+        for name, fn in self.scenarios().items():
+            with self.subTest(name):
+                self.assertEqual(self.count(fn), self.BUDGET[name])
+
+
+class VectorCodecTests(SimpleTestCase):
+    def test_round_trip_per_dtype(self):
+        values = [0.5, -1.25, 3.0, 0.0]
+        for dtype, places in (("f4", 6), ("f2", 2), ("i1", 1)):
+            with self.subTest(dtype):
+                blob, scale = encode_vector(values, dtype)
+                self.assertEqual(len(blob), len(values) * {"f4": 4, "f2": 2, "i1": 1}[dtype])
+                for got, want in zip(decode_vector(blob, dtype, scale), values):
+                    self.assertAlmostEqual(float(got), want, places=places)
+        self.assertRaises(ValueError, encode_vector, values, "f8")
+        self.assertRaises(ValueError, decode_vector, b"", "f8")
+
+
+class ChunkingTests(SimpleTestCase):
+    def test_chunks_are_bounded_overlapping_and_cover_the_text(self):
+        text = " ".join(f"Sentence number {i} is here." for i in range(100))
+        chunks = split_text(text, max_chars=200, overlap=50)
+        self.assertEqual(split_text("short", max_chars=200), [(0, 5)])
+        self.assertEqual((chunks[0][0], chunks[-1][1]), (0, len(text)))
+        for a, b in chunks:
+            self.assertLessEqual(b - a, 200)
+            self.assertTrue(text[a:b].endswith("."))
+        for (_, end), (start, _) in zip(chunks, chunks[1:]):
+            self.assertLess(start, end)
+
+
+class VectorIndexTests(TestCase):
+    def embed(self, conv, text, values, id=None) -> MessageEmbedding:
+        ev = EmbeddingVector(digest=text)
+        ev.set_vector(values)
+        ev.save()
+        msg = Message.objects.create(conversation=conv, role="user", content=text)
+        return MessageEmbedding.objects.create(id=id, message=msg, end=len(text), vector=ev)
+
+    def test_search_ranks_by_cosine(self):
+        near = self.embed(Conversation.objects.create(status="ended"), "near", [1, 0.1, 0])
+        far = self.embed(Conversation.objects.create(status="ended"), "far", [0, 0, 1])
+        index = vector_index.VectorIndex()
+        self.assertEqual([e for _, e in index.search([1, 0, 0], k=2)], [near.id, far.id])
+        self.assertEqual([e for _, e in index.search([1, 0, 0], k=1, conversations=1)], [near.id])
+
+    def test_refresh_loads_rows_committed_below_the_high_water_mark(self):
+        conv = Conversation.objects.create(status="ended")
+        first, late, last = (self.embed(conv, t, [1, i, 0]) for i, t in enumerate(("a", "b", "c")))
+        late_id = late.id
+        late.delete()  # its transaction has not committed yet
+        index = vector_index.VectorIndex()
+        index.refresh()
+        self.assertEqual(len(index), 2)
+        self.embed(conv, "b2", [0, 1, 0], id=late_id)
+        self.assertEqual(index.search([0, 1, 0], k=1), [(mock.ANY, late_id)])
+        self.assertEqual(len(index), 3)
+
+    def test_conversation_ended_after_loading_becomes_searchable(self):
+        conv = Conversation.objects.create()
+        emb = self.embed(conv, "hello", [1, 0, 0])
+        index = vector_index.VectorIndex()
+        self.assertEqual(index.search([1, 0, 0]), [])
+        self.assertEqual(len(index.search([1, 0, 0], ended_only=False)), 1)
+        Conversation.objects.filter(id=conv.id).update(status="ended")
+        with mock.patch.object(vector_index, "RECONCILE_SECONDS", 0):
+            self.assertEqual([e for _, e in index.search([1, 0, 0])], [emb.id])
+            self.assertEqual([e for _, e in index.search([1, 0, 0], conversations=1)], [emb.id])
+
+    def test_probe_scores_only_the_closest_centroids(self):
+        spread = Conversation.objects.create(status="ended")
+        exact = self.embed(spread, "x", [1, 0, 0])
+        self.embed(spread, "y", [0, 1, 0])
+        close = self.embed(Conversation.objects.create(status="ended"), "close", [0.9, 0.1, 0])
+        index = vector_index.VectorIndex()
+        self.assertEqual(index.search([1, 0, 0], k=1, conversations=1), [(mock.ANY, close.id)])
+        self.assertEqual(index.search([1, 0, 0], k=1, conversations=2), [(mock.ANY, exact.id)])
+
+
+class JobTests(FakeBackendMixin, TestCase):
+    def test_summary_that_fails_for_good_still_ends_the_conversation(self):
+        conv = Conversation.objects.create(title="doomed")
+        Message.objects.create(conversation=conv, role="user", content="hello there")
+        jobs.enqueue_conversation_end(conv)
+        conv.jobs.update(max_attempts=1)
+        with mock.patch.object(jobs, "summarize_conversation", side_effect=RuntimeError("model gone")):
+            jobs.run_batch()
+        conv.refresh_from_db()
+        self.assertEqual((conv.status, conv.summary), ("ended", ""))
+        self.assertIn("model gone", conv.meta["summary_error"])
+        self.assertEqual(dict(conv.jobs.exclude(kind="message").values_list("kind", "status")),
+                         {"summarize": "failed", "embed": "done"})
+        self.assertTrue(MessageEmbedding.objects.filter(message__conversation=conv).exists())
+
+    def test_message_jobs_are_counted_once_across_a_retry(self):
+        conv = Conversation.objects.create()
+        for role in ("user", "assistant"):
+            Message.objects.create(conversation=conv, role=role, content=f"{role} kiwi")
+        self.assertFalse(Posting.objects.exists())
+        with mock.patch.object(analytics, "record_messages", side_effect=RuntimeError("db hiccup")):
+            jobs.run_batch()
+        self.assertFalse(Posting.objects.exists())
+        conv.jobs.update(run_after=timezone.now())
+        jobs.run_batch()
+        self.assertEqual(KeywordIndexStats.objects.get().doc_count, 2)
+        self.assertEqual(DailyStats.objects.values_list("user_messages", "assistant_messages", "replies").get(),
+                         (1, 1, 1))
+        self.assertFalse(conv.jobs.exists())
+
+
+class RetrievalTests(FakeBackendMixin, TestCase):
+    def setUp(self):
+        super().setUp()
+        vector_index.get_index().reset()
+
+    def test_keyword_and_vector_sides_agree_on_local_dates(self):
+        conv = Conversation.objects.create(status="ended")
+        msg = Message.objects.create(conversation=conv, role="user", content="kiwi mango invoice")
+        # 01:00 on March 11 in Asia/Kolkata, still March 10 in UTC
+        Message.objects.filter(id=msg.id).update(created_at=datetime(2026, 3, 10, 19, 30, tzinfo=dt_timezone.utc))
+        jobs.run_batch()
+        embed_conversations([conv.id])
+        for day, expected in ((date(2026, 3, 11), [msg.id]), (date(2026, 3, 12), [])):
+            with self.subTest(day):
+                for side in (retrieval.keyword_candidates, retrieval.vector_candidates):
+                    self.assertEqual([m.id for _, m, _ in side("kiwi mango", 5, date_from=day, date_to=day)],
+                                     expected)
+
+    def test_failed_query_embedding_adds_no_vector_hits(self):
+        conv = Conversation.objects.create(status="ended")
+        Message.objects.create(conversation=conv, role="user", content="kiwi mango invoice")
+        jobs.run_batch()
+        embed_conversations([conv.id])
+        self.assertEqual(vector_index.get_index().search([0.0] * providers.EMBED_DIM), [])
+        with mock.patch.object(services, "embed_query", return_value=[0.0] * providers.EMBED_DIM):
+            r = self.client.post("/api/query/", {"query": "zzz nomatch", "analysis_depth": "light"},
+                                 content_type="application/json")
+        self.assertEqual(r.json()["excerpts"], [])
+
+
+class KeywordIndexTests(TestCase):
+    def test_bm25_ranking_and_required_keywords(self):
+        conv = Conversation.objects.create()
+        both, once, other = Message.objects.bulk_create(
+            Message(conversation=conv, role="user", content=t)
+            for t in ("apple apple banana", "apple cherry", "cherry pie"))
+        keyword_index.index_messages([both, once, other])
+        hits = lambda *a, **kw: [mid for _, mid in keyword_index.search(*a, **kw)]
+        self.assertEqual(hits("apple"), [both.id, once.id])
+        self.assertEqual(hits("apple", keywords=["cherry"]), [once.id])
+        self.assertEqual(hits("durian"), [])
+        keyword_index.rebuild()
+        self.assertEqual(hits("apple"), [both.id, once.id])
+
+    def test_messages_are_indexed_once(self):
+        conv = Conversation.objects.create()
+        Message.objects.create(conversation=conv, role="user", content="kiwi kiwi mango")
+        keyword_index.rebuild()  # indexes it while its message job is still queued
+        jobs.run_batch()
+        self.assertEqual(keyword_index.index_messages(conv.messages.all()), 0)
+        stats = KeywordIndexStats.objects.get()
+        self.assertEqual((stats.doc_count, stats.total_terms), (1, 3))
+        self.assertEqual(dict(Posting.objects.values_list("term", "tf")), {"kiwi": 2, "mango": 1})
+
+
+class ContextTests(TestCase):
+    def conversation(self, n: int) -> Conversation:
+        conv = Conversation.objects.create()
+        Message.objects.bulk_create(Message(conversation=conv, role="user" if i % 2 == 0 else "assistant",
+                                            content=f"turn {i}") for i in range(n))
+        return conv
+
+    def test_no_turn_is_missing_from_the_context(self):
+        summarize = lambda prompt: "summary of " + ", ".join(
+            line.split(": ", 1)[1] for line in prompt[-1]["content"].splitlines() if line.startswith(("user:", "assistant:")))
+        cases = {"unfolded": (15, summarize), "folded": (20, summarize),
+                 "fold failed": (20, lambda prompt: "(AI error: down)")}
+        for name, (n, chat) in cases.items():
+            with self.subTest(name):
+                msgs = context.build_llm_context(self.conversation(n), "sys", chat=chat)
+                seen = {int(i) for m in msgs for i in re.findall(r"turn (\d+)", m["content"])}
+                self.assertEqual(seen, set(range(n)))
+                self.assertEqual(msgs[-1]["content"], f"turn {n - 1}")
+
+
+class BackfillTests(FakeBackendMixin, TestCase):
+    def test_second_run_picks_up_lower_ids_ended_later(self):
+        later = Conversation.objects.create()
+        Message.objects.create(conversation=later, role="user", content="written first, ended last")
+        ended = Conversation.objects.create(status="ended")
+        Message.objects.create(conversation=ended, role="user", content="written last, ended first")
+        self.assertEqual(backfill_embeddings(workers=1)[0], 1)
+        Conversation.objects.filter(id=later.id).update(status="ended")
+        self.assertEqual(backfill_embeddings(workers=1)[0], 1)
+        self.assertEqual(MessageEmbedding.objects.count(), 2)
+
+
+class ConditionalGetTests(TestCase):
+    def test_edits_change_the_etag(self):
+        conv = Conversation.objects.create(title="old")
+        for url in (f"/api/conversations/{conv.id}/", "/api/conversations/"):
+            with self.subTest(url):
+                etag = self.client.get(url)["ETag"]
+                self.assertEqual(self.client.get(url, HTTP_IF_NONE_MATCH=etag).status_code, 304)
+                r = self.client.patch(f"/api/conversations/{conv.id}/", {"title": f"new {url}"},
+                                      content_type="application/json")
+                self.assertEqual(r.status_code, 200)
+                r = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+                self.assertEqual(r.status_code, 200)
+                self.assertIn(f"new {url}", r.content.decode())
+
+    def test_message_page_only_returns_newer_messages(self):
+        conv = Conversation.objects.create()
+        first, second = (Message.objects.create(conversation=conv, role="user", content=t) for t in ("a", "b"))
+        r = self.client.get(f"/api/conversations/{conv.id}/messages/", {"after_id": first.id}).json()
+        self.assertEqual([m["id"] for m in r["results"]], [second.id])
+        self.assertEqual((r["next_after_id"], r["status"]), (second.id, "active"))
+
+
+class StreamingTests(FakeBackendMixin, TestCase):
+    def test_tokens_add_up_to_the_stored_reply(self):
+        conv = Conversation.objects.create()
+        r = self.client.post(f"/api/conversations/{conv.id}/messages/stream/", {"role": "user", "content": "hello"},
+                             content_type="application/json")
+        self.assertEqual(r["Content-Type"], "application/x-ndjson")
+        events = [json.loads(line) for line in b"".join(r.streaming_content).decode().splitlines()]
+        self.assertEqual([events[0]["type"], events[-1]["type"]], ["user_message", "done"])
+        tokens = [e["text"] for e in events if e["type"] == "token"]
+        self.assertTrue(tokens)
+        reply = events[-1]["assistant_message"]
+        self.assertEqual(reply["content"], "".join(tokens).strip())
+        self.assertEqual(list(conv.messages.order_by("id").values_list("role", "content")),
+                         [("user", "hello"), ("assistant", reply["content"])])
+
+
+class PaginationTests(TestCase):
+    def test_cursor_walks_every_conversation_once(self):
+        ids = [Conversation.objects.create(title=f"c{i}").id for i in range(5)]
+        seen, url = [], "/api/conversations/?page_size=2"
+        while url:
+            page = self.client.get(url).json()
+            self.assertLessEqual(len(page["results"]), 2)
+            seen += [c["id"] for c in page["results"]]
+            url = page["next"]
+        self.assertEqual(seen, sorted(ids, reverse=True))
+        self.assertEqual(self.client.get("/api/conversations/?cursor=nonsense").status_code, 404)
+
+
+class DedupTests(FakeBackendMixin, TestCase):
+    def conversation(self, *texts) -> Conversation:
+        conv = Conversation.objects.create(status="ended")
+        for t in texts:
+            Message.objects.create(conversation=conv, role="user", content=t)
+        return conv
+
+    def test_identical_chunks_share_one_vector_and_are_embedded_once(self):
+        embed = mock.Mock(side_effect=lambda texts, **kw: [ai._fake_embed(t) for t in texts])
+        with mock.patch.object(services, "gemini_embed", embed):
+            a = self.conversation("Thanks!", "thanks!  ", "a different message")
+            self.assertEqual(embed_conversations([a.id]), 3)
+            b = self.conversation("THANKS!")
+            self.assertEqual(embed_conversations([b.id]), 1)
+        self.assertEqual([len(c.args[0]) for c in embed.call_args_list], [2])  # one call, two unique texts
+        self.assertEqual((MessageEmbedding.objects.count(), EmbeddingVector.objects.count()), (4, 2))
+
+    def test_identical_transcripts_are_summarized_once(self):
+        chat = mock.Mock(return_value="A greeting.\nTAGS: hello")
+        with mock.patch.object(summaries, "gemini_chat", chat):
+            first = summaries.summarize_conversation(self.conversation("hello", "hi there"))
+            second = summaries.summarize_conversation(self.conversation("hello", "hi there"))
+        self.assertEqual(first, second)
+        self.assertEqual((chat.call_count, ContentSummary.objects.count()), (1, 1))
+
+
+class ContentAddressMigrationTests(TransactionTestCase):
+    before, after = [("conversations", "0008_query_indexes")], [("conversations", "0009_content_addressed_vectors")]
+
+    def tearDown(self):
+        call_command("migrate", "conversations", verbosity=0)
+
+    def test_identical_chunks_are_folded_together(self):
+        call_command("migrate", "conversations", "0008_query_indexes", verbosity=0)
+        old = MigrationExecutor(connection).loader.project_state(self.before).apps
+        conv = old.get_model("conversations", "Conversation").objects.create()
+        Message, Embedding = old.get_model("conversations", "Message"), old.get_model("conversations", "MessageEmbedding")
+        for i, text in enumerate(("ok", "OK ", "something else")):
+            msg = Message.objects.create(conversation=conv, role="user", content=text)
+            Embedding.objects.create(message=msg, end=len(text), vector=bytes([i]) * 4)
+        call_command("migrate", "conversations", "0009_content_addressed_vectors", verbosity=0)
+        new = MigrationExecutor(connection).loader.project_state(self.after).apps
+        vectors = {me.message.content: me.vector_id for me in
+                   new.get_model("conversations", "MessageEmbedding").objects.select_related("message")}
+        self.assertEqual(vectors["ok"], vectors["OK "])
+        self.assertNotEqual(vectors["ok"], vectors["something else"])
+        self.assertEqual(new.get_model("conversations", "EmbeddingVector").objects.count(), 2)
+
+
+class SchedulerTests(SimpleTestCase):
+    """Admission order and load shedding; the request bucket starts in debt so calls queue."""
+
+    def scheduler(self, debt: float = 3, **kw) -> scheduler.Scheduler:
+        s = scheduler.Scheduler(rpm=1200, **kw)  # 20 requests/s
+        s.requests = scheduler.TokenBucket(1200, burst=0)
+        s.requests.level = -debt
+        return s
+
+    def start(self, s, priority, out):
+        def run():
+            try:
+                s.acquire(priority)
+                out.append(scheduler.PRIORITIES[priority])
+            except scheduler.Overloaded as e:
+                out.append(f"shed {scheduler.PRIORITIES[priority]} {e.status}")
+        t = threading.Thread(target=run)
+        t.start()
+        time.sleep(0.02)  # queued in this order
+        return t
+
+    def test_higher_classes_go_first(self):
+        s, out = self.scheduler(), []
+        threads = [self.start(s, p, out) for p in (scheduler.BACKFILL, scheduler.SUMMARY, scheduler.INTERACTIVE)]
+        for t in threads:
+            t.join()
+        self.assertEqual(out, ["interactive", "summary", "backfill"])
+
+    def test_full_queue_evicts_lower_class_then_refuses(self):
+        s, out = self.scheduler(queue_max=1), []
+        threads = [self.start(s, scheduler.BACKFILL, out), self.start(s, scheduler.INTERACTIVE, out)]
+        self.assertEqual(out, ["shed backfill 429"])
+        with self.assertRaises(scheduler.Overloaded):
+            s.acquire(scheduler.INTERACTIVE)
+        for t in threads:
+            t.join()
+        self.assertEqual(out, ["shed backfill 429", "interactive"])
+
+    def test_wait_past_deadline_is_shed(self):
+        s = self.scheduler(timeouts=(0.05, 1, 1))
+        with self.assertRaises(scheduler.Overloaded) as ctx:
+            s.acquire(scheduler.INTERACTIVE)
+        self.assertGreaterEqual(ctx.exception.retry_after, 1)
+        self.assertEqual(s.depth(), 0)
+
+
+class ProviderTests(SimpleTestCase):
+    def provider(self, *errors):
+        p = providers.Provider()
+        p.breaker = providers.CircuitBreaker("test", failures=1, cooldown=60)
+        p._chat = mock.Mock(side_effect=[*errors, "ok"])
+        return p
+
+    @mock.patch.object(providers.time, "sleep")
+    def test_transient_errors_are_retried_and_open_the_breaker(self, sleep):
+        p = self.provider(TimeoutError(), ConnectionError())
+        self.assertEqual(p.chat([]), "ok")
+        self.assertEqual((p._chat.call_count, sleep.call_count), (3, 2))
+
+        p = self.provider(*[TimeoutError()] * (providers.LLM_RETRIES + 1))
+        self.assertRaises(TimeoutError, p.chat, [])
+        self.assertEqual(p.breaker.state, "open")
+        self.assertRaises(providers.CircuitOpenError, p.chat, [])
+        self.assertEqual(p._chat.call_count, providers.LLM_RETRIES + 1)
+
+    def test_bad_request_is_not_retried(self):
+        p = self.provider(ValueError("bad prompt"))
+        self.assertRaises(ValueError, p.chat, [])
+        self.assertEqual((p._chat.call_count, p.breaker.state), (1, "closed"))
+
+
+class EmbedBatcherTests(SimpleTestCase):
+    def test_concurrent_texts_share_one_call(self):
+        calls = []
+        batcher = EmbedBatcher(lambda texts: calls.append(texts) or [[len(t)] for t in texts], window_ms=200)
+        results = {}
+        texts = ["a", "bb", "a", "ccc"]
+        threads = [threading.Thread(target=lambda i, t: results.__setitem__(i, batcher.embed(t)), args=(i, t))
+                   for i, t in enumerate(texts)]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+        self.assertEqual([sorted(c) for c in calls], [["a", "bb", "ccc"]])
+        self.assertEqual([results[i] for i in range(4)], [[1], [2], [1], [3]])
+
+
+class OverloadTests(FakeBackendMixin, TestCase):
+    def setUp(self):
+        super().setUp()
+        self.enterContext(mock.patch.object(scheduler, "_scheduler", scheduler.Scheduler(rpm=60, queue_max=0)))
+        scheduler._scheduler.requests.level = 0
+
+    def test_shed_reply_is_429_and_not_stored(self):
+        conv = Conversation.objects.create(title="busy")
+        for url in (f"/api/conversations/{conv.id}/messages/", f"/api/conversations/{conv.id}/messages/stream/"):
+            with self.subTest(url):
+                r = self.client.post(url, {"role": "user", "content": "hello"}, content_type="application/json")
+                self.assertEqual(r.status_code, 429)
+                self.assertIn("Retry-After", r)
+        self.assertFalse(conv.messages.exists())
+
+        scheduler._scheduler = scheduler.Scheduler()
+        r = self.client.post(f"/api/conversations/{conv.id}/messages/", {"role": "user", "content": "hello"},
+                             content_type="application/json")
+        self.assertEqual(r.status_code, 201)
+        self.assertEqual(conv.messages.filter(role="user").count(), 1)
+        self.assertEqual(conv.messages.filter(role="assistant").count(), 1)
+
+
+class AnalyticsTests(FakeBackendMixin, TestCase):
+    def rollups(self):
+        return (list(DailyStats.objects.order_by("day").values_list(
+                    "day", "conversations_started", "conversations_ended", "user_messages",
+                    "assistant_messages", "replies", "ended_messages")),
+                sorted(TagDaily.objects.values_list("day", "tag", "conversations")))
+
+    def test_live_counters_match_rebuild(self):
+        post = lambda url, body: self.client.post(url, body, content_type="application/json")
+        for i in range(3):
+            conv_id = post("/api/conversations/", {"title": f"c{i}"}).json()["id"]
+            for _ in range(i + 1):
+                post(f"/api/conversations/{conv_id}/messages/", {"role": "user", "content": "hello"})
+            if i:
+                post(f"/api/conversations/{conv_id}/end/", {})
+        jobs.run_batch()
+        live = self.rollups()
+        self.assertEqual(live[0][0][1:], (3, 2, 6, 6, 6, 10))
+        analytics.rebuild()
+        self.assertEqual(self.rollups(), live)
+
+        r = self.client.get("/api/analytics/daily/").json()
+        self.assertEqual(r["totals"]["avg_conversation_messages"], 5.0)
+        Conversation.objects.filter(status="ended").update(tags=["Python ", "python", "Django"])
+        analytics.rebuild()
+        tags = self.client.get("/api/analytics/tags/", {"limit": 1}).json()["tags"]
+        self.assertEqual([(t["tag"], t["conversations"]) for t in tags], [("django", 2)])
+        self.assertEqual(self.client.get("/api/analytics/daily/",
+                                         {"date_from": "2026-02-01", "date_to": "2026-01-01"}).status_code, 400)
+
+    def test_editing_tags_moves_the_tag_rows(self):
+        conv = Conversation.objects.create(status="ended", ended_at=timezone.now(), tags=["Python", "web"])
+        analytics.rebuild()
+        r = self.client.patch(f"/api/conversations/{conv.id}/", {"tags": ["Django ", "web"]},
+                              content_type="application/json")
+        self.assertEqual(r.status_code, 200)
+        live = self.rollups(), sorted(ConversationTag.objects.values_list("tag", flat=True))
+        self.assertEqual(live[1], ["django", "web"])
+        analytics.rebuild()
+        self.assertEqual((self.rollups(), sorted(ConversationTag.objects.values_list("tag", flat=True))), live)
+
+
+class ArchiveTests(FakeBackendMixin, TestCase):
+    def export(self) -> list:
+        r = self.client.get("/api/export/")
+        return [json.loads(line) for line in b"".join(r.streaming_content).decode().splitlines()]
+
+    @staticmethod
+    def without_ids(records: list) -> list:
+        drop = {"conversation": ("id",), "message": ("id", "conversation"), "embedding": ("message",)}
+        return [{k: v for k, v in r.items() if k not in drop[r["type"]]} for r in records]
+
+    def test_export_import_round_trip(self):
+        for status in ("ended", "active"):
+            conv = Conversation.objects.create(title=status, status=status, summary="s", tags=["t"],
+                                               meta={"note": status})
+            for role in ("user", "assistant"):
+                Message.objects.create(conversation=conv, role=role, content=f"{status} {role}")
+        embed_conversations(list(Conversation.objects.values_list("id", flat=True)))
+        Message.objects.filter(role="user").update(created_at=datetime(2026, 3, 10, 19, 30, tzinfo=dt_timezone.utc))
+        before = self.export()
+        self.assertEqual([r["type"] for r in before].count("embedding"), 4)
+
+        Conversation.objects.all().delete()
+        body = "".join(json.dumps(r) + "\n" for r in before)
+        r = self.client.post("/api/import/", body, content_type="application/x-ndjson")
+        self.assertEqual(r.json(), {"conversations": 2, "messages": 4, "embeddings": 4})
+        self.assertEqual(self.without_ids(self.export()), self.without_ids(before))
+
+        r = self.client.post("/api/import/", '{"type": "message"}\n', content_type="application/x-ndjson")
+        self.assertEqual(r.status_code, 400)
+        self.assertRaisesRegex(archive.ArchiveError, "line 2", archive.import_ndjson, ["", "not json"])
+
+    def test_conversation_archived_while_ending_is_ended_by_the_worker(self):
+        archive.import_ndjson([
+            json.dumps({"type": "conversation", "id": 1, "title": "mid-flight", "status": "ending"}),
+            json.dumps({"type": "message", "id": 1, "conversation": 1, "role": "user", "content": "hello"}),
+        ])
+        conv = Conversation.objects.get()
+        self.assertEqual(sorted(conv.jobs.values_list("kind", flat=True)), ["embed", "summarize"])
+        jobs.run_batch()
+        conv.refresh_from_db()
+        self.assertEqual(conv.status, "ended")
+        self.assertIsNotNone(conv.ended_at)
+        self.assertTrue(MessageEmbedding.objects.filter(message__conversation=conv).exists())
+
+
+class RoutingTests(SimpleTestCase):
+    def test_reads_go_to_replica_only_inside_replica_reads(self):
+        router = ReadReplicaRouter()
+        with replica_reads():
+            self.assertIsNone(router.db_for_read(Conversation))  # no replica configured
+        with override_settings(DATABASES={"default": {}, "replica": {}}):
+            self.assertIsNone(router.db_for_read(Conversation))
+            with replica_reads():
+                self.assertEqual(router.db_for_read(Conversation), "replica")
+                self.assertEqual(router.db_for_write(Conversation), "default")
+            self.assertFalse(router.allow_migrate("replica", "conversations"))
@@ -1,6 +1,8 @@
 from django.urls import path, include
 from rest_framework.routers import DefaultRouter
-from .views import ConversationViewSet, QueryPastConversations
+from .views import (ConversationViewSet, DailyAnalytics, QueryPastConversations, TagAnalytics, export_view,
+                    import_view, metrics_view)
+from . import async_views
 
 router = DefaultRouter()
 router.register(r"conversations", ConversationViewSet, basename="conversation")
@@ -8,4 +10,12 @@ router.register(r"conversations", ConversationViewSet, basename="conversation")
 urlpatterns = [
     path("", include(router.urls)),
     path("query/", QueryPastConversations.as_view(), name="query"),
+    path("async/conversations/<int:pk>/messages/", async_views.send_message, name="async-send-message"),
+    path("async/conversations/<int:pk>/end/", async_views.end_conversation, name="async-end-conversation"),
+    path("metrics/", metrics_view, name="metrics"),
+    path("export/", export_view, name="export"),
+    path("import/", import_view, name="import"),
+    path("async/query/", async_views.query_past_conversations, name="async-query"),
+    path("analytics/daily/", DailyAnalytics.as_view(), name="analytics-daily"),
+    path("analytics/tags/", TagAnalytics.as_view(), name="analytics-tags"),
 ]
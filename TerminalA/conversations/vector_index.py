@@ -0,0 +1,301 @@
+import itertools
+import os
+import threading
+import time
+from typing import Dict, Iterable, List, Optional, Tuple
+
+import numpy as np
+from django.db.models import Q
+
+from .models import Conversation, EmbeddingVector, MessageEmbedding
+from .vectors import decode_vector
+
+# An id skipped below the high-water mark may belong to a transaction that
+# commits later (ids are handed out before commit); it is looked for again
+# on every refresh for this long.
+GAP_SECONDS = float(os.getenv("VECTOR_INDEX_GAP_SECONDS", "3600"))
+MAX_GAPS = 500  # the highest ones; older gaps are rolled-back or deleted rows
+# How often conversations indexed while still active are checked for having ended.
+RECONCILE_SECONDS = float(os.getenv("VECTOR_INDEX_RECONCILE_SECONDS", "30"))
+
+# embedding id, message id, conversation id, ended, vector id, values (None if already loaded)
+Row = Tuple[int, int, int, bool, int, Optional[np.ndarray]]
+
+
+class VectorIndex:
+    """
+    Process-local, append-only index over MessageEmbedding vectors.
+
+    Unique vectors (EmbeddingVector rows) live in one contiguous float32
+    matrix (grown by doubling) with precomputed L2 norms; chunks are
+    parallel id arrays pointing at their vector's row. A query is a single
+    matrix-vector product over the unique vectors, gathered per chunk, so a
+    vector shared by many chunks is scored once.
+
+    Each conversation also has a centroid, the sum of its chunks' unit
+    vectors (same direction as their normalized mean), updated as chunks
+    are appended. search(conversations=C) ranks the centroids first and
+    then scores only the chunks of the top C conversations.
+
+    refresh() pulls rows above the highest id loaded, plus ids skipped
+    below it (see GAP_SECONDS), and every RECONCILE_SECONDS marks the
+    chunks of conversations that have ended since they were loaded.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._clear()
+
+    def _clear(self) -> None:
+        self._built = False
+        self._dim = 0
+        self._last_embedding_id = 0
+        self._gaps: Dict[int, float] = {}  # embedding id not seen below the high-water mark -> when noticed
+        self._reconciled = 0.0
+        # unique vectors
+        self._vector_count = 0
+        self._vector_row: Dict[int, int] = {}
+        self._matrix = np.empty((0, 0), dtype=np.float32)
+        self._norms = np.empty(0, dtype=np.float32)
+        # chunks
+        self._size = 0
+        self._embedding_ids = np.empty(0, dtype=np.int64)
+        self._message_ids = np.empty(0, dtype=np.int64)
+        self._conversation_ids = np.empty(0, dtype=np.int64)
+        self._ended = np.empty(0, dtype=bool)
+        self._rows = np.empty(0, dtype=np.int64)  # chunk -> row in _matrix
+        # per conversation: centroid row, running sum of unit vectors, member chunks
+        self._centroid_of: Dict[int, int] = {}
+        self._centroids = np.empty((0, 0), dtype=np.float32)
+        self._centroid_norms = np.empty(0, dtype=np.float32)
+        self._centroid_ended = np.empty(0, dtype=bool)
+        self._members: List[List[int]] = []
+
+    def __len__(self) -> int:
+        return self._size
+
+    @property
+    def unique_vectors(self) -> int:
+        return self._vector_count
+
+    def reset(self) -> None:
+        with self._lock:
+            self._clear()
+
+    def _rows_after(self, last_id: int, before_id: Optional[int] = None):
+        new = Q(id__gt=last_id) if before_id is None else Q(id__gt=last_id, id__lt=before_id)
+        now = time.monotonic()
+        self._gaps = {i: t for i, t in self._gaps.items() if now - t < GAP_SECONDS}
+        qs = MessageEmbedding.objects.filter(new | Q(id__in=list(self._gaps)) if self._gaps else new)
+        return (qs.order_by("id")
+                .values_list("id", "message_id", "message__conversation_id",
+                             "message__conversation__status", "vector_id")
+                .iterator(chunk_size=2000))
+
+    @staticmethod
+    def _grow(arrays: Dict[str, np.ndarray], size: int, need: int) -> Dict[str, np.ndarray]:
+        """Copies of `arrays` with capacity >= need (doubling); the first `size` rows kept."""
+        cap = len(next(iter(arrays.values())))
+        if need <= cap:
+            return arrays
+        new_cap = max(need, cap * 2, 1024)
+        out = {}
+        for name, arr in arrays.items():
+            grown = np.zeros((new_cap,) + arr.shape[1:], dtype=arr.dtype)
+            grown[:size] = arr[:size]
+            out[name] = grown
+        return out
+
+    def _reserve(self, chunks: int, vectors: int) -> None:
+        for names, size, extra in (
+            (("_matrix", "_norms"), self._vector_count, vectors),
+            (("_embedding_ids", "_message_ids", "_conversation_ids", "_ended", "_rows"), self._size, chunks),
+            (("_centroids", "_centroid_norms", "_centroid_ended"), len(self._members), chunks),
+        ):
+            grown = self._grow({n: getattr(self, n) for n in names}, size, size + extra)
+            for n, arr in grown.items():
+                setattr(self, n, arr)
+
+    def _append(self, rows: Iterable[Row]) -> None:
+        rows = list(rows)
+        if not self._dim:
+            first = next((r[5] for r in rows if r[5] is not None), None)
+            if first is None:
+                return
+            self._dim = len(first)
+            self._matrix = np.empty((0, self._dim), dtype=np.float32)
+            self._centroids = np.empty((0, self._dim), dtype=np.float32)
+        fresh: Dict[int, np.ndarray] = {}
+        for r in rows:
+            if r[4] not in self._vector_row and r[5] is not None and len(r[5]) == self._dim:
+                fresh.setdefault(r[4], r[5])
+        rows = [r for r in rows if (r[4] in self._vector_row or r[4] in fresh)
+                and (r[0] > self._last_embedding_id or r[0] in self._gaps)]  # not loaded yet
+        if not rows:
+            return
+        self._reserve(len(rows), len(fresh))
+
+        if fresh:
+            lo, hi = self._vector_count, self._vector_count + len(fresh)
+            block = np.stack(list(fresh.values())).astype(np.float32, copy=False)
+            self._matrix[lo:hi] = block
+            self._norms[lo:hi] = np.linalg.norm(block, axis=1)
+            for i, vector_id in enumerate(fresh):
+                self._vector_row[vector_id] = lo + i
+            self._vector_count = hi
+
+        lo, hi = self._size, self._size + len(rows)
+        self._embedding_ids[lo:hi] = [r[0] for r in rows]
+        self._message_ids[lo:hi] = [r[1] for r in rows]
+        self._conversation_ids[lo:hi] = [r[2] for r in rows]
+        self._ended[lo:hi] = [r[3] for r in rows]
+        self._rows[lo:hi] = [self._vector_row[r[4]] for r in rows]
+        self._size = hi
+        self._track_gaps([r[0] for r in rows])
+        self._update_centroids(lo, hi)
+
+    def _track_gaps(self, ids: List[int]) -> None:
+        for i in ids:
+            self._gaps.pop(i, None)
+        new = np.array([i for i in ids if i > self._last_embedding_id], dtype=np.int64)
+        if not len(new):
+            return
+        top = int(new.max())
+        lo = max(self._last_embedding_id + 1, top - len(new) - MAX_GAPS)
+        now = time.monotonic()
+        self._gaps.update((int(i), now) for i in np.setdiff1d(np.arange(lo, top, dtype=np.int64), new))
+        for i in sorted(self._gaps)[:-MAX_GAPS]:
+            del self._gaps[i]
+        self._last_embedding_id = top
+
+    def _update_centroids(self, lo: int, hi: int) -> None:
+        rows = np.empty(hi - lo, dtype=np.int64)
+        for i, conv_id in enumerate(self._conversation_ids[lo:hi].tolist()):
+            c = self._centroid_of.get(conv_id)
+            if c is None:
+                c = self._centroid_of[conv_id] = len(self._members)
+                self._members.append([])
+            self._members[c].append(lo + i)
+            rows[i] = c
+        vec = self._rows[lo:hi]
+        unit = self._matrix[vec] / (self._norms[vec, None] + 1e-9)
+        np.add.at(self._centroids, rows, unit)
+        touched = np.unique(rows)
+        self._centroid_norms[touched] = np.linalg.norm(self._centroids[touched], axis=1)
+        np.logical_or.at(self._centroid_ended, rows, self._ended[lo:hi])
+
+    def _load_after(self, last_id: int, before_id: Optional[int] = None) -> None:
+        batch = []
+        for row in self._rows_after(last_id, before_id):
+            batch.append(row)
+            if len(batch) >= 2000:
+                self._append(self._with_vectors(batch))
+                batch = []
+        self._append(self._with_vectors(batch))
+
+    def _with_vectors(self, batch) -> List[Row]:
+        """Attach values for vectors not loaded yet (one query per batch)."""
+        missing = {vector_id for *_, vector_id in batch if vector_id not in self._vector_row}
+        values = {vid: decode_vector(blob, dtype, scale) for vid, blob, dtype, scale in
+                  EmbeddingVector.objects.filter(id__in=missing).values_list("id", "vector", "dtype", "scale")
+                  } if missing else {}
+        return [(emb_id, msg_id, conv_id, status == "ended", vector_id, values.get(vector_id))
+                for emb_id, msg_id, conv_id, status, vector_id in batch]
+
+    def _mark_ended(self) -> None:
+        """Flag the chunks of conversations that ended after they were loaded."""
+        self._reconciled = time.monotonic()
+        active = [conv_id for conv_id, c in self._centroid_of.items() if not self._centroid_ended[c]]
+        for i in range(0, len(active), 500):
+            ended = Conversation.objects.filter(id__in=active[i:i + 500], status="ended")
+            for conv_id in ended.values_list("id", flat=True):
+                c = self._centroid_of[conv_id]
+                self._centroid_ended[c] = True
+                self._ended[self._members[c]] = True
+
+    def refresh(self) -> None:
+        """Build on first use, then pull only rows written since the last load."""
+        with self._lock:
+            self._load_after(self._last_embedding_id)
+            if not self._built or time.monotonic() - self._reconciled >= RECONCILE_SECONDS:
+                self._mark_ended()
+            self._built = True
+
+    def add(self, embeddings: Iterable[MessageEmbedding]) -> None:
+        """Append freshly created embeddings; a no-op until the index is built."""
+        with self._lock:
+            if not self._built:
+                return
+            fresh = sorted((me for me in embeddings if me.id > self._last_embedding_id or me.id in self._gaps),
+                           key=lambda me: me.id)
+            if not fresh:
+                return
+            # rows written by other processes in between must not be skipped
+            self._load_after(self._last_embedding_id, before_id=fresh[0].id)
+            fresh = [me for me in fresh if me.id > self._last_embedding_id or me.id in self._gaps]
+            self._append(
+                (me.id, me.message_id, me.message.conversation_id,
+                 me.message.conversation.status == "ended", me.vector_id,
+                 None if me.vector_id in self._vector_row else me.vector.get_vector())
+                for me in fresh
+            )
+
+    def search(self, query_vec: List[float], k: int = 8, ended_only: bool = True,
+               conversations: Optional[int] = None) -> List[Tuple[float, int]]:
+        """
+        Return [(score, embedding_id)] for the top-k chunks by cosine similarity.
+        With `conversations`, only the chunks of the C conversations whose
+        centroids are closest to the query are scored (approximate).
+        """
+        self.refresh()
+        with self._lock:
+            n = self._size
+            if not n or k <= 0:
+                return []
+            q = np.asarray(query_vec, dtype=np.float32)
+            if q.shape != (self._dim,):
+                return []
+            qn = np.linalg.norm(q)
+            if not qn:
+                return []
+            if conversations and len(self._members) > conversations:
+                chunks = self._probe(q, qn, conversations, ended_only)
+                unique, inverse = np.unique(self._rows[chunks], return_inverse=True)
+            else:
+                chunks = None
+                unique, inverse = slice(0, self._vector_count), self._rows[:n]
+            scores = self._matrix[unique] @ q
+            scores /= self._norms[unique] * qn + 1e-9
+            scores = scores[inverse]  # one score per chunk; shared vectors scored once
+            if ended_only:
+                scores = np.where(self._ended[:n] if chunks is None else self._ended[chunks], scores, -np.inf)
+            if not len(scores):
+                return []
+            k = min(k, len(scores))
+            top = np.argpartition(-scores, k - 1)[:k]
+            top = top[np.argsort(-scores[top])]
+            top = top[np.isfinite(scores[top])]
+            ids = self._embedding_ids[top if chunks is None else chunks[top]]
+            return [(float(scores[i]), int(e)) for i, e in zip(top, ids)]
+
+    def _probe(self, q: np.ndarray, qn: float, conversations: int, ended_only: bool) -> np.ndarray:
+        """Chunk positions of the `conversations` conversations with the closest centroids."""
+        nc = len(self._members)
+        scores = self._centroids[:nc] @ q
+        scores /= self._centroid_norms[:nc] * qn + 1e-9
+        if ended_only:
+            scores = np.where(self._centroid_ended[:nc], scores, -np.inf)
+        best = np.argpartition(-scores, conversations - 1)[:conversations]
+        best = best[np.isfinite(scores[best])]
+        return np.fromiter(itertools.chain.from_iterable(self._members[c] for c in best.tolist()),
+                           dtype=np.int64)
+
+
+_index: Optional[VectorIndex] = None
+
+
+def get_index() -> VectorIndex:
+    global _index
+    if _index is None:
+        _index = VectorIndex()
+    return _index
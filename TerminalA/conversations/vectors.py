@@ -0,0 +1,41 @@
+import os
+from typing import Sequence, Tuple, Union
+
+import numpy as np
+
+# Storage codecs for embedding vectors. All are little-endian; "f4" decodes
+# with np.frombuffer and no copy, "f2"/"i1" trade precision for size.
+DTYPE_CHOICES = (("f4", "float32"), ("f2", "float16"), ("i1", "int8"))
+DEFAULT_DTYPE = os.getenv("EMBED_STORAGE_DTYPE", "f4")
+
+_NUMPY_DTYPES = {"f4": "<f4", "f2": "<f2", "i1": "i1"}
+
+Buffer = Union[bytes, bytearray, memoryview]
+
+
+def encode_vector(values: Union[Sequence[float], np.ndarray], dtype: str = DEFAULT_DTYPE) -> Tuple[bytes, float]:
+    """Pack a vector into bytes; returns (blob, scale). scale is only used by int8."""
+    v = np.asarray(values, dtype=np.float32)
+    if dtype == "f4":
+        return v.astype("<f4", copy=False).tobytes(), 1.0
+    if dtype == "f2":
+        return v.astype("<f2").tobytes(), 1.0
+    if dtype == "i1":
+        peak = float(np.abs(v).max()) if v.size else 0.0
+        scale = peak / 127.0 if peak else 1.0
+        return np.clip(np.rint(v / scale), -127, 127).astype("i1").tobytes(), scale
+    raise ValueError(f"Unknown vector dtype: {dtype}")
+
+
+def decode_vector(blob: Buffer, dtype: str = "f4", scale: float = 1.0) -> np.ndarray:
+    """Unpack a stored vector to float32. Zero-copy for "f4"."""
+    try:
+        raw = np.frombuffer(blob, dtype=_NUMPY_DTYPES[dtype])
+    except KeyError:
+        raise ValueError(f"Unknown vector dtype: {dtype}")
+    if dtype == "f4":
+        return raw
+    out = raw.astype(np.float32)
+    if dtype == "i1":
+        out *= scale
+    return out
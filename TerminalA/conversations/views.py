@@ -1,5 +1,18 @@
+import hashlib
+import itertools
+import json
+import logging
+import time
+
+from django.core.serializers.json import DjangoJSONEncoder
+from django.http import HttpResponse, JsonResponse, StreamingHttpResponse
+from django.views.decorators.csrf import csrf_exempt
+from django.views.decorators.http import require_GET, require_POST
+from django.db.models import Count, OuterRef, Prefetch, Subquery, prefetch_related_objects
+from django.db.models.functions import Coalesce
 from django.utils import timezone
-from django.db.models import Prefetch
+from django.utils.cache import get_conditional_response
+from django.utils.http import http_date
 from rest_framework import viewsets
 from rest_framework.decorators import action
 from rest_framework.permissions import AllowAny
@@ -8,13 +21,20 @@ from rest_framework.views import APIView
 from drf_spectacular.utils import extend_schema
 
 from .models import Conversation, Message
+from .pagination import StartedAtCursorPagination
+from .routing import replica_reads
 from .serializers import (
+    AnalyticsQuerySerializer,
     ConversationListSerializer,
     ConversationDetailSerializer,
     ConversationCreateSerializer,
+    MessagePageQuerySerializer,
+    MessagePageSerializer,
     MessageSerializer,
     SendMessageSerializer,
     QuerySerializer,
+    DailyAnalyticsSerializer,
+    TagAnalyticsSerializer,
 )
 
 
@@ -35,28 +55,97 @@ class QueryOutSerializer(serializers.Serializer):
 
 
 
-from .ai import summarize_and_tag, gemini_chat
-from .services import messages_to_llm_format
+from .ai import gemini_chat, gemini_chat_stream
+from . import analytics, archive, metrics, retrieval
+from .jobs import enqueue_conversation_end
+from .context import build_llm_context
+
+logger = logging.getLogger(__name__)
+
+SYSTEM_PROMPT = "You are a concise, helpful assistant."
+
+
+def _validators(parts, times):
+    """(ETag, Last-Modified as a timestamp) for a representation built from `parts`."""
+    digest = hashlib.md5(json.dumps(parts, cls=DjangoJSONEncoder).encode()).hexdigest()
+    latest = max((t for t in times if t is not None), default=None)
+    return f'"{digest}"', int(latest.timestamp()) if latest else None
+
+
+def _not_modified(request, etag, modified):
+    """A 304 when the client's If-None-Match / If-Modified-Since still hold, else None."""
+    return get_conditional_response(request, etag=etag, last_modified=modified)
+
+
+def _set_validators(response, etag, modified):
+    response["ETag"] = etag
+    if modified is not None:
+        response["Last-Modified"] = http_date(modified)
+    response["Cache-Control"] = "no-cache"  # cache, but revalidate on every use
+    return response
 
 
 class ConversationViewSet(viewsets.ModelViewSet):
     """
-    /api/conversations/              GET list, POST create
+    /api/conversations/              GET list (cursor-paginated), POST create
     /api/conversations/{id}/         GET retrieve
-    /api/conversations/{id}/messages/  POST user message + AI reply
-    /api/conversations/{id}/end/       POST finalize conversation + summary
+    /api/conversations/{id}/messages/  GET messages after ?after_id= (keyset), POST user message + AI reply
+    /api/conversations/{id}/messages/stream/  POST same, AI reply streamed as NDJSON
+    /api/conversations/{id}/end/       POST finalize conversation; summary is queued
     """
     permission_classes = [AllowAny]
 
+    pagination_class = StartedAtCursorPagination
+
     def get_queryset(self):
-        return (
-            Conversation.objects
-            .all()
-            .order_by("-started_at")
-            .prefetch_related(
-                Prefetch("messages", queryset=Message.objects.order_by("created_at"))
+        qs = Conversation.objects.all().order_by("-started_at")
+        if self.action == "list":
+            # aggregates in SQL; the list never needs message bodies. Correlated
+            # subqueries rather than JOIN + GROUP BY, so only the rows of the
+            # page are aggregated (each one an index range on msg_conv_created_idx)
+            msgs = Message.objects.filter(conversation=OuterRef("pk")).order_by()
+            return qs.annotate(
+                message_count=Coalesce(
+                    Subquery(msgs.values("conversation").annotate(n=Count("id")).values("n")), 0
+                ),
+                last_message_at=Subquery(msgs.order_by("-created_at").values("created_at")[:1]),
+            )
+        if self.action == "retrieve":
+            # messages are prefetched in retrieve(), only when the client's copy is stale
+            msgs = Message.objects.filter(conversation=OuterRef("pk")).order_by()
+            return qs.annotate(
+                last_message_id=Subquery(msgs.order_by("-id").values("id")[:1]),
+                last_message_at=Subquery(msgs.order_by("-created_at").values("created_at")[:1]),
             )
+        return qs
+
+    @replica_reads()
+    def list(self, request, *args, **kwargs):
+        page = self.paginate_queryset(self.filter_queryset(self.get_queryset()))
+        etag, modified = _validators(
+            [[c.id, c.title, c.status, c.tags, c.ended_at, c.message_count, c.last_message_at] for c in page]
+            + [self.paginator.next_cursor],
+            [t for c in page for t in (c.started_at, c.ended_at, c.last_message_at)],
+        )
+        response = _not_modified(request, etag, modified)
+        if response is None:
+            response = self.get_paginated_response(self.get_serializer(page, many=True).data)
+        return _set_validators(response, etag, modified)
+
+    def retrieve(self, request, *args, **kwargs):
+        conv = self.get_object()
+        # title, summary and tags can also be edited with PATCH, which moves no timestamp
+        etag, modified = _validators(
+            [conv.id, conv.last_message_id, conv.ended_at, conv.status, conv.title, conv.summary, conv.tags],
+            [conv.started_at, conv.ended_at, conv.last_message_at],
         )
+        response = _not_modified(request, etag, modified)
+        if response is None:
+            prefetch_related_objects(
+                [conv], Prefetch("messages", queryset=Message.objects.order_by("created_at"))
+            )
+            response = Response(self.get_serializer(conv).data)
+        return _set_validators(response, etag, modified)
 
     def get_serializer_class(self):
         if self.action == "list":
@@ -73,27 +162,37 @@ class ConversationViewSet(viewsets.ModelViewSet):
         conv = ser.save()
         return Response(ConversationDetailSerializer(conv).data, status=201)
 
-    @action(detail=True, methods=["post"], url_path="messages")
-    def send_message(self, request, pk=None):
-        conv = self.get_object()
-        if conv.status != "active":
-            return Response({"detail": "Conversation has ended."}, status=400)
-
+    def _new_message(self, conv, request):
+        """
+        The posted message, unsaved. A user turn is saved only once its reply
+        was admitted, so a shed call (Overloaded) leaves nothing for the
+        client's retry to duplicate; created_at keeps when it arrived.
+        """
         msg_ser = SendMessageSerializer(data=request.data)
         msg_ser.is_valid(raise_exception=True)
-
-        user_msg = Message.objects.create(
+        return Message(
             conversation=conv,
             role=msg_ser.validated_data["role"],
             content=msg_ser.validated_data["content"],
+            created_at=timezone.now(),
         )
 
+    @action(detail=True, methods=["post"], url_path="messages")
+    def send_message(self, request, pk=None):
+        conv = self.get_object()
+        if conv.status != "active":
+            return Response({"detail": "Conversation has ended."}, status=400)
+
+        user_msg = self._new_message(conv, request)
+
         ai_msg = None
         if user_msg.role == "user":
-            messages = [{"role": "system", "content": "You are a concise, helpful assistant."}]
-            messages += messages_to_llm_format(conv)
+            messages = build_llm_context(conv, SYSTEM_PROMPT, pending=user_msg)
             ai_text = gemini_chat(messages) or "..."
+            user_msg.save()
             ai_msg = Message.objects.create(conversation=conv, role="assistant", content=ai_text)
+        else:
+            user_msg.save()
 
         return Response(
             {
@@ -103,41 +202,91 @@ class ConversationViewSet(viewsets.ModelViewSet):
             status=201,
         )
 
-    @action(detail=True, methods=["post"], url_path="end")
-    def end_conversation(self, request, pk=None):
+    @extend_schema(parameters=[MessagePageQuerySerializer], responses=MessagePageSerializer)
+    @send_message.mapping.get
+    def list_messages(self, request, pk=None):
+        """
+        Messages with id > after_id, oldest first, at most `limit`. Poll with
+        the previous page's next_after_id to pick up only new messages;
+        `status` tells the poller when the conversation has ended.
+        """
+        params = MessagePageQuerySerializer(data=request.query_params)
+        params.is_valid(raise_exception=True)
+        after_id, limit = params.validated_data["after_id"], params.validated_data["limit"]
         conv = self.get_object()
-        if conv.status == "ended":
-            return Response({"detail": "Already ended."}, status=400)
-
-        text_dump = "\n".join(
-            f"{m.role}: {m.content}" for m in conv.messages.order_by("created_at")
-        )
-
-        summary, tags = summarize_and_tag(text_dump)
-        conv.summary = summary
-        conv.tags = tags
-        conv.status = "ended"
-        conv.ended_at = timezone.now()
-        conv.save()
+        rows = list(conv.messages.filter(id__gt=after_id).order_by("id")[:limit])
+        return Response({
+            "results": MessageSerializer(rows, many=True).data,
+            "next_after_id": rows[-1].id if rows else after_id,
+            "status": conv.status,
+        })
 
-        return Response(ConversationDetailSerializer(conv).data, status=200)
+    @action(detail=True, methods=["post"], url_path="messages/stream")
+    def send_message_stream(self, request, pk=None):
+        """
+        Streaming variant of send_message. Emits one JSON object per line:
+        {"type": "user_message"}, then {"type": "token"} per chunk, then
+        {"type": "done"} carrying the persisted assistant message and timings.
+        """
+        conv = self.get_object()
+        if conv.status != "active":
+            return Response({"detail": "Conversation has ended."}, status=400)
 
+        user_msg = self._new_message(conv, request)
+        stream = None
+        if user_msg.role == "user":
+            messages = build_llm_context(conv, SYSTEM_PROMPT, pending=user_msg)
+            started = time.perf_counter()
+            stream = gemini_chat_stream(messages)
+            # admission happens on the first chunk: a shed call still gets its 429 here
+            first = next(stream, None)
+            ttft = time.perf_counter() - started if first is not None else None
+        user_msg.save()
+
+        def line(payload):
+            return json.dumps(payload, cls=DjangoJSONEncoder) + "\n"
+
+        def events():
+            yield line({"type": "user_message", "message": MessageSerializer(user_msg).data})
+            if stream is None:
+                yield line({"type": "done", "assistant_message": None})
+                return
+
+            parts = []
+            for chunk in itertools.chain([first] if first is not None else [], stream):
+                parts.append(chunk)
+                yield line({"type": "token", "text": chunk})
+            total = time.perf_counter() - started
+
+            ai_msg = Message.objects.create(
+                conversation=conv, role="assistant", content="".join(parts).strip() or "..."
+            )
+            ttft_ms = round(ttft * 1000, 1) if ttft is not None else None
+            logger.info("stream conv=%s ttft_ms=%s total_ms=%.1f", conv.id, ttft_ms, total * 1000)
+            yield line({
+                "type": "done",
+                "assistant_message": MessageSerializer(ai_msg).data,
+                "ttft_ms": ttft_ms,
+                "total_ms": round(total * 1000, 1),
+            })
+
+        resp = StreamingHttpResponse(events(), content_type="application/x-ndjson")
+        resp["Cache-Control"] = "no-cache"
+        resp["X-Accel-Buffering"] = "no"
+        return resp
 
+    @action(detail=True, methods=["post"], url_path="end")
+    def end_conversation(self, request, pk=None):
+        conv = self.get_object()
+        if conv.status != "active":
+            return Response({"detail": "Already ended."}, status=400)
 
+        # summary, tags and embeddings are produced by the run_jobs worker
+        enqueue_conversation_end(conv)
 
-def _score(text, terms):
-    t = (text or "").lower()
-    return sum(t.count(term) for term in terms if term)
+        return Response(ConversationDetailSerializer(conv).data, status=202)
 
 
-def _snippet(text, term, pad=80):
-    t = text or ""
-    i = t.lower().find(term.lower())
-    if i < 0:
-        return (t[: pad * 2] + "…") if len(t) > pad * 2 else t
-    a = max(0, i - pad)
-    b = min(len(t), i + len(term) + pad)
-    return ("…" if a else "") + t[a:b] + ("…" if b < len(t) else "")
 
 
 @extend_schema(request=QuerySerializer, responses=QueryOutSerializer)
@@ -152,35 +301,68 @@ class QueryPastConversations(APIView):
         if not q:
             return Response({"answer": "Please type something to search.", "excerpts": []})
 
-        terms = [w for w in q.lower().split() if w]
+        with replica_reads():
+            payload = retrieval.search(
+                q,
+                analysis_depth=ser.validated_data["analysis_depth"],
+                date_from=ser.validated_data.get("date_from"),
+                date_to=ser.validated_data.get("date_to"),
+                keywords=ser.validated_data.get("keywords"),
+            )
+        return Response(payload)
+
 
-        results = []
-        convs = (
-            Conversation.objects
-            .prefetch_related(Prefetch("messages", queryset=Message.objects.order_by("created_at")))
-            .order_by("-started_at")
-        )
+def _analytics_params(request):
+    params = AnalyticsQuerySerializer(data=request.query_params)
+    params.is_valid(raise_exception=True)
+    data = params.validated_data
+    return analytics.date_range(data.get("date_from"), data.get("date_to")), data["limit"]
 
-        for c in convs:
-            base = _score(f"{c.title or ''} {c.summary or ''}", terms)
-            for m in c.messages.all():
-                sc = base + _score(m.content, terms)
-                if sc > 0:
-                    results.append({
-                        "conversation_id": str(c.id),
-                        "message_id": str(m.id),
-                        "snippet": _snippet(m.content, terms[0]),
-                        "timestamp": m.created_at,
-                        "score": sc,
-                    })
-
-        results.sort(key=lambda x: -x["score"])
-        top = results[:10]
-
-        if not top:
-            return Response({"answer": "No relevant results found.", "excerpts": []})
 
-        return Response({
-            "answer": f"Found {len(top)} relevant excerpts.",
-            "excerpts": top,
-        })
+@extend_schema(parameters=[AnalyticsQuerySerializer], responses=DailyAnalyticsSerializer)
+class DailyAnalytics(APIView):
+    """Conversations, messages and reply latency per day, from the rollups (last 30 days by default)."""
+    permission_classes = [AllowAny]
+
+    def get(self, request):
+        (date_from, date_to), _ = _analytics_params(request)
+        return Response(analytics.daily(date_from, date_to))
+
+
+@extend_schema(parameters=[AnalyticsQuerySerializer], responses=TagAnalyticsSerializer)
+class TagAnalytics(APIView):
+    """The most frequent tags of conversations ended in the range, with per-day counts."""
+    permission_classes = [AllowAny]
+
+    def get(self, request):
+        (date_from, date_to), limit = _analytics_params(request)
+        return Response(analytics.top_tags(date_from, date_to, limit))
+
+
+def metrics_view(request):
+    """Prometheus scrape endpoint (text exposition format 0.0.4)."""
+    return HttpResponse(metrics.render(), content_type="text/plain; version=0.0.4; charset=utf-8")
+
+
+@require_GET
+def export_view(request):
+    """
+    GET /api/export/?status=ended&embeddings=0 — every conversation with its
+    messages (and embeddings unless embeddings=0) as streamed NDJSON.
+    """
+    lines = archive.export_ndjson(status=request.GET.get("status") or None,
+                                  embeddings=request.GET.get("embeddings", "1") != "0")
+    response = StreamingHttpResponse(lines, content_type="application/x-ndjson")
+    response["Content-Disposition"] = 'attachment; filename="conversations.ndjson"'
+    return response
+
+
+@csrf_exempt
+@require_POST
+def import_view(request):
+    """POST /api/import/ with an NDJSON archive body; read line by line, never buffered whole."""
+    try:
+        counts = archive.import_ndjson(request)
+    except archive.ArchiveError as e:
+        return JsonResponse({"detail": str(e)}, status=400)
+    return JsonResponse(counts, status=201)
@@ -0,0 +1,20 @@
+const API = (import.meta.env.VITE_API_BASE || "http://127.0.0.1:8000/api").replace(/\/+$/, "");
+
+const query = (params) => {
+  const q = new URLSearchParams(Object.entries(params).filter(([, v]) => v != null && v !== ""));
+  return q.toString() ? `?${q}` : "";
+};
+
+// { date_from, date_to, days: [{ day, conversations_started, conversations_ended, messages, avg_reply_seconds }], totals }
+export async function getDailyAnalytics({ dateFrom, dateTo } = {}) {
+  const res = await fetch(`${API}/analytics/daily/${query({ date_from: dateFrom, date_to: dateTo })}`);
+  if (!res.ok) throw new Error(`Analytics failed (${res.status})`);
+  return res.json();
+}
+
+// { date_from, date_to, tags: [{ tag, conversations, days: [{ day, conversations }] }] }
+export async function getTagAnalytics({ dateFrom, dateTo, limit = 10 } = {}) {
+  const res = await fetch(`${API}/analytics/tags/${query({ date_from: dateFrom, date_to: dateTo, limit })}`);
+  if (!res.ok) throw new Error(`Tag analytics failed (${res.status})`);
+  return res.json();
+}
@@ -6,8 +6,9 @@ const withSlash = (path) => {
   return `${API}/${p}${p.endsWith("/") ? "" : "/"}`;
 };
 
-export async function listConversations() {
-  const res = await fetch(withSlash("conversations"));
+// One page: { results, next }. Pass the previous page's `next` to continue.
+export async function listConversations(next = null) {
+  const res = await fetch(next || withSlash("conversations"));
   if (!res.ok) throw new Error(`List failed (${res.status})`);
   return res.json();
 }
@@ -17,3 +18,10 @@ export async function getConversation(id) {
   if (!res.ok) throw new Error(`Fetch failed (${res.status})`);
   return res.json();
 }
+
+// Messages newer than afterId: { results, next_after_id }. Pass next_after_id back to poll.
+export async function listMessages(id, afterId = 0, limit = 100) {
+  const res = await fetch(`${withSlash(`conversations/${id}/messages`)}?after_id=${afterId}&limit=${limit}`);
+  if (!res.ok) throw new Error(`Messages failed (${res.status})`);
+  return res.json();
+}
@@ -2,6 +2,8 @@ import { useEffect, useRef, useState } from "react";
 import axios from "axios";
 
 const API = "http://127.0.0.1:8000/api";
+const END_POLL_MS = 1500;
+const END_POLL_LIMIT = 80; // about two minutes
 
 export default function ChatPage() {
   const [conv, setConv] = useState(null);      
@@ -43,21 +45,58 @@ export default function ChatPage() {
     setText("");
     setBusy(true);
 
-    try {
-      const { data } = await axios.post(
-        `${API}/conversations/${conv.id}/messages/`,
-        { role: "user", content }
-      );
-
-      
+    const appendMessage = (m) =>
+      setConv((prev) => ({ ...prev, messages: [...(prev?.messages || []), m] }));
+    const patchStreaming = (fn) =>
       setConv((prev) => ({
         ...prev,
-        messages: [
-          ...(prev?.messages || []),
-          data.user_message,
-          data.assistant_message,
-        ].filter(Boolean),
+        messages: (prev?.messages || []).map((m) => (m.id === "streaming" ? fn(m) : m)),
       }));
+
+    try {
+      const res = await fetch(`${API}/conversations/${conv.id}/messages/stream/`, {
+        method: "POST",
+        headers: { "Content-Type": "application/json" },
+        body: JSON.stringify({ role: "user", content }),
+      });
+      if (!res.ok || !res.body) throw new Error(`Stream failed (${res.status})`);
+
+      const reader = res.body.getReader();
+      const decoder = new TextDecoder();
+      let buffer = "";
+
+      const handle = (evt) => {
+        if (evt.type === "user_message") {
+          appendMessage(evt.message);
+          appendMessage({
+            id: "streaming",
+            role: "assistant",
+            content: "",
+            created_at: new Date().toISOString(),
+          });
+        } else if (evt.type === "token") {
+          patchStreaming((m) => ({ ...m, content: m.content + evt.text }));
+        } else if (evt.type === "done") {
+          if (evt.assistant_message) {
+            patchStreaming(() => evt.assistant_message);
+          } else {
+            setConv((prev) => ({
+              ...prev,
+              messages: (prev?.messages || []).filter((m) => m.id !== "streaming"),
+            }));
+          }
+        }
+      };
+
+      for (;;) {
+        const { value, done } = await reader.read();
+        if (done) break;
+        buffer += decoder.decode(value, { stream: true });
+        const lines = buffer.split("\n");
+        buffer = lines.pop();
+        lines.filter(Boolean).forEach((l) => handle(JSON.parse(l)));
+      }
+      if (buffer.trim()) handle(JSON.parse(buffer));
     } catch (err) {
       console.error(err);
       alert("Message failed. Check backend.");
@@ -70,8 +109,18 @@ export default function ChatPage() {
     if (!conv || busy || conv.status === "ended") return;
     setBusy(true);
     try {
-      const { data } = await axios.post(`${API}/conversations/${conv.id}/end/`);
-      setConv(data); 
+      let { data } = await axios.post(`${API}/conversations/${conv.id}/end/`);
+      setConv(data);
+      // summary + tags are produced by the background worker
+      for (let i = 0; data.status === "ending"; i++) {
+        if (i >= END_POLL_LIMIT) {
+          alert("The summary is taking longer than expected. Check back on the Conversations page.");
+          break;
+        }
+        await new Promise((r) => setTimeout(r, END_POLL_MS));
+        ({ data } = await axios.get(`${API}/conversations/${conv.id}/`));
+        setConv(data);
+      }
     } catch (err) {
       console.error(err);
       alert("Couldn't end conversation.");
@@ -143,7 +192,7 @@ export default function ChatPage() {
         {conv?.status === "ended" && (
           <div className="mt-4 border-t pt-3">
             <div className="text-sm font-semibold mb-2">Summary</div>
-            <pre className="whitespace-pre-wrap text-sm">{conv.summary}</pre>
+            <pre className="whitespace-pre-wrap text-sm">{conv.summary || "No summary (summarization failed)."}</pre>
             {!!(conv.tags || []).length && (
               <div className="mt-2 flex flex-wrap gap-2">
                 {conv.tags.map((t) => (
@@ -1,8 +1,9 @@
 import { useEffect, useState } from "react";
 import { useParams, Link } from "react-router-dom";
-import { getConversation } from "../api/conversations";
+import { getConversation, listMessages } from "../api/conversations";
 
 const fmt = (v) => (v ? new Date(v).toLocaleString() : "—");
+const POLL_MS = 5000;
 
 export default function ConversationDetailPage() {
   const { id } = useParams();
@@ -28,6 +29,32 @@ export default function ConversationDetailPage() {
     return () => { cancelled = true; };
   }, [id]);
 
+  // While the conversation is open, fetch only messages newer than the last one shown.
+  const status = data?.status;
+  const lastId = data?.messages?.length ? data.messages[data.messages.length - 1].id : 0;
+  useEffect(() => {
+    if (!status || status === "ended") return;
+    let cancelled = false;
+
+    const timer = setInterval(async () => {
+      try {
+        const page = await listMessages(id, lastId);
+        if (cancelled) return;
+        if (page.results.length) {
+          setData((prev) => ({ ...prev, messages: [...(prev.messages || []), ...page.results] }));
+        }
+        if (page.status !== status) {
+          const convo = await getConversation(id); // summary and tags
+          if (!cancelled) setData(convo);
+        }
+      } catch (e) {
+        console.error(e);
+      }
+    }, POLL_MS);
+
+    return () => { cancelled = true; clearInterval(timer); };
+  }, [id, status, lastId]);
+
   if (err) {
     return (
       <div className="mx-auto max-w-4xl">
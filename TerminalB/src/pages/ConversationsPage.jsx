@@ -1,4 +1,4 @@
-import { useEffect, useMemo, useState } from "react";
+import { useCallback, useEffect, useMemo, useRef, useState } from "react";
 import { useNavigate } from "react-router-dom";
 import { listConversations } from "../api/conversations.js";
 
@@ -6,9 +6,12 @@ const fmt = (v) => (v ? new Date(v).toLocaleString() : "—");
 
 export default function ConversationsPage() {
   const [items, setItems] = useState([]);
+  const [next, setNext] = useState(null);
   const [query, setQuery] = useState("");
   const [loading, setLoading] = useState(true);
+  const [loadingMore, setLoadingMore] = useState(false);
   const [err, setErr] = useState("");
+  const sentinelRef = useRef(null);
   const navigate = useNavigate();
 
   useEffect(() => {
@@ -18,7 +21,10 @@ export default function ConversationsPage() {
       try {
         setLoading(true);
         const data = await listConversations();
-        if (!cancelled) setItems(Array.isArray(data) ? data : []);
+        if (!cancelled) {
+          setItems(Array.isArray(data?.results) ? data.results : []);
+          setNext(data?.next || null);
+        }
       } catch (e) {
         if (!cancelled) setErr(e?.message || "Could not load conversations");
       } finally {
@@ -29,6 +35,31 @@ export default function ConversationsPage() {
     return () => { cancelled = true; };
   }, []);
 
+  const loadMore = useCallback(async () => {
+    if (!next || loadingMore) return;
+    setLoadingMore(true);
+    try {
+      const data = await listConversations(next);
+      setItems((prev) => [...prev, ...(data?.results || [])]);
+      setNext(data?.next || null);
+    } catch (e) {
+      setErr(e?.message || "Could not load more conversations");
+    } finally {
+      setLoadingMore(false);
+    }
+  }, [next, loadingMore]);
+
+  // infinite scroll: fetch the next page when the sentinel comes into view
+  useEffect(() => {
+    const el = sentinelRef.current;
+    if (!el || !next) return;
+    const obs = new IntersectionObserver((entries) => {
+      if (entries.some((e) => e.isIntersecting)) loadMore();
+    });
+    obs.observe(el);
+    return () => obs.disconnect();
+  }, [next, loadMore]);
+
   const filtered = useMemo(() => {
     const q = query.trim().toLowerCase();
     if (!q) return items;
@@ -94,11 +125,15 @@ export default function ConversationsPage() {
               >
                 <div className="col-span-6">
                   <div className="font-medium">{c.title || "Untitled"}</div>
+                  <div className="text-xs text-gray-400">
+                    {c.message_count ?? 0} messages
+                    {c.last_message_at ? ` • last ${fmt(c.last_message_at)}` : ""}
+                  </div>
                   {c.summary ? (
                     <div className="line-clamp-1 text-xs text-gray-500">{c.summary}</div>
                   ) : null}
                 </div>
-                <div className="col-span-3 text-sm text-gray-600">{fmt(c.created_at)}</div>
+                <div className="col-span-3 text-sm text-gray-600">{fmt(c.started_at)}</div>
                 <div className="col-span-3">
                   <span
                     className={[
@@ -112,6 +147,9 @@ export default function ConversationsPage() {
               </button>
             ))}
           </div>
+          <div ref={sentinelRef} className="px-4 py-3 text-center text-xs text-gray-400">
+            {loadingMore ? "Loading more…" : next ? "" : "End of list"}
+          </div>
         </div>
       )}
     </div>
@@ -1,7 +1,69 @@
-import { useState } from "react";
+import { useEffect, useState } from "react";
+import { getDailyAnalytics, getTagAnalytics } from "../api/analytics.js";
 
 const API = (import.meta.env.VITE_API_BASE || "http://127.0.0.1:8000/api").replace(/\/+$/, "");
 
+const num = (v, unit = "") => (v == null ? "—" : `${v}${unit}`);
+
+function Overview() {
+  const [daily, setDaily] = useState(null);
+  const [tags, setTags] = useState([]);
+  const [error, setError] = useState("");
+
+  useEffect(() => {
+    let cancelled = false;
+    Promise.all([getDailyAnalytics(), getTagAnalytics({ limit: 8 })])
+      .then(([d, t]) => {
+        if (!cancelled) {
+          setDaily(d);
+          setTags(t.tags || []);
+        }
+      })
+      .catch((e) => !cancelled && setError(e.message || "Could not load analytics"));
+    return () => { cancelled = true; };
+  }, []);
+
+  if (error) return <div className="text-sm text-red-700">{error}</div>;
+  if (!daily) return null;
+
+  const t = daily.totals;
+  const peak = Math.max(1, ...daily.days.map((d) => d.messages));
+  return (
+    <div className="rounded-xl border bg-white/70 p-4 space-y-3">
+      <div className="text-sm font-medium">
+        {daily.date_from} – {daily.date_to}
+      </div>
+      <div className="grid grid-cols-2 gap-2 text-sm sm:grid-cols-4">
+        <div>Conversations<br /><b>{t.conversations_started}</b></div>
+        <div>Messages<br /><b>{t.user_messages + t.assistant_messages}</b></div>
+        <div>Avg. length<br /><b>{num(t.avg_conversation_messages, " msgs")}</b></div>
+        <div>Avg. reply time<br /><b>{num(t.avg_reply_seconds, " s")}</b></div>
+      </div>
+      {daily.days.length > 0 && (
+        <div className="flex h-16 items-end gap-px" title="Messages per day">
+          {daily.days.map((d) => (
+            <div
+              key={d.day}
+              className="flex-1 bg-gray-400"
+              style={{ height: `${(100 * d.messages) / peak}%` }}
+              title={`${d.day}: ${d.messages} messages`}
+            />
+          ))}
+        </div>
+      )}
+      {tags.length > 0 && (
+        <div className="flex flex-wrap gap-2 text-xs">
+          {tags.map((tag) => (
+            <span key={tag.tag} className="rounded-full border px-2 py-0.5">
+              {tag.tag} · {tag.conversations}
+            </span>
+          ))}
+        </div>
+      )}
+    </div>
+  );
+}
+
 export default function IntelligencePage() {
   const [q, setQ] = useState("");
   const [busy, setBusy] = useState(false);
@@ -32,6 +94,8 @@ export default function IntelligencePage() {
     <div className="mx-auto max-w-3xl space-y-4">
       <h1 className="text-xl font-semibold">Conversation Intelligence</h1>
 
+      <Overview />
+
       <div className="flex gap-2">
         <input
           className="w-full rounded-xl border px-3 py-2"